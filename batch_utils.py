@@ -0,0 +1,261 @@
+# -*- coding: UTF-8 -*-
+''' Check the system requirements of many AutoConanFile recipes at once: the conandata.yml of every recipe folder
+is loaded, the same lib or command required by several recipes is probed once, the probes run on a process pool
+that reuses the host facts of this process, and the resolution of every recipe is reported as json.
+Run with `python -m conanutils.batch_utils --help`.
+'''
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+import typing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import yaml
+from conans import tools
+from conans.model.version import Version
+
+from .cache_utils import warn
+from .command_utils import check_cmd_versions, cmd_version_result_t
+from .conanfile_utils import get_required_os_field, libpkg_exists_many, lib_probe_result_t, version_in_range
+from .pc_file_utils import get_pc_index, get_pc_search_dirs
+from .pkg_conf_utils import export_host_facts, get_default_lib_path, get_default_pc_path, get_pkg_config_info, \
+    import_host_facts
+
+if typing.TYPE_CHECKING:
+    from conans.client.output import ScopedOutput
+default_logger = logging.getLogger(__name__)
+
+CONAN_DATA_NAME = 'conandata.yml'
+
+
+class recipe_requirements_t(NamedTuple):
+    folder: str
+    system_libs: Dict[str, Dict[str, typing.Any]]  # {lib: {'pkg': system package, 'version': range}}
+    lib_fallbacks: Dict[str, str]  # {lib: conan reference}
+    commands: Dict[str, str]  # {command: system package}
+    command_specs: Dict[str, Optional[Dict[str, typing.Any]]]  # {command: keyword arguments of check_cmd_version}
+    command_fallbacks: Dict[str, str]  # {command: conan reference}
+    error: Optional[str] = None
+
+
+def find_recipe_folders(paths: typing.Iterable[str]) -> List[str]:
+    ''' the folders with a conandata.yml: each of paths that has one, otherwise the ones found below it
+    '''
+    ret = []
+    for path in paths:
+        if os.path.isfile(os.path.join(path, CONAN_DATA_NAME)):
+            ret.append(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(_d for _d in dirs if not _d.startswith('.'))
+            if CONAN_DATA_NAME in files:
+                ret.append(root)
+    return list(dict.fromkeys(os.path.normpath(_p) for _p in ret))
+
+
+def load_recipe_requirements(folder: str) -> recipe_requirements_t:
+    ''' the requirements of system_requirements_from_conan_data and build_requirements_from_conan_data
+    for this host, read from the conandata.yml of folder
+    '''
+    try:
+        with open(os.path.join(folder, CONAN_DATA_NAME)) as f:
+            conan_data = yaml.safe_load(f) or {}
+        system_libs, lib_fallbacks = {}, {}
+        if 'system-packages' in conan_data:
+            system_libs, lib_fallbacks = get_required_os_field(conan_data, 'system-packages')
+        commands, command_fallbacks, command_specs = {}, {}, {}
+        if 'required-commands' in conan_data:
+            commands, command_fallbacks = get_required_os_field(conan_data, 'required-commands')
+            versions = conan_data.get('required-command-versions') or {}
+            command_specs = {_cmd: versions.get(_cmd) for _cmd in commands}
+        return recipe_requirements_t(
+            folder, dict(system_libs or {}), dict(lib_fallbacks or {}), dict(commands or {}), command_specs,
+            dict(command_fallbacks or {}))
+    except Exception as e:
+        return recipe_requirements_t(folder, {}, {}, {}, {}, {}, '{}: {}'.format(type(e).__name__, e))
+
+
+def _spec_key(cmd: str, spec: Optional[typing.Mapping[str, typing.Any]]) -> str:
+    return json.dumps([cmd, spec], sort_keys=True, default=str)
+
+
+def _probe_libs(names: List[str], use_index: bool, use_cache: bool) -> Dict[str, lib_probe_result_t]:
+    # without a range, the version found is compared with the range of every recipe afterwards
+    return libpkg_exists_many(names, use_cache=use_cache, use_index=use_index)
+
+
+def _probe_commands(specs: List[Tuple[str, Optional[Dict]]], use_cache: bool) -> Dict[str, cmd_version_result_t]:
+    ''' :return: {_spec_key: result}
+    '''
+    ret = {}
+    pending = list(specs)
+    while pending:
+        # check_cmd_versions takes one spec per command
+        batch, pending_next = {}, []
+        for cmd, spec in pending:
+            if cmd in batch:
+                pending_next.append((cmd, spec))
+            else:
+                batch[cmd] = spec
+        results = check_cmd_versions(batch, log_output=None, use_cache=use_cache)
+        ret.update({_spec_key(_cmd, _spec): results[_cmd] for _cmd, _spec in batch.items()})
+        pending = pending_next
+    return ret
+
+
+def _chunks(items: List, count: int) -> List[List]:
+    return [_c for _c in (items[_i::count] for _i in range(count)) if _c]
+
+
+def probe_requirements(
+        recipes: typing.Sequence[recipe_requirements_t], jobs: Optional[int] = None, use_index: bool = True,
+        use_cache: bool = True
+) -> Tuple[Dict[str, lib_probe_result_t], Dict[str, cmd_version_result_t]]:
+    ''' probe every lib and command required by recipes once, on a pool of jobs processes
+    which get the host facts (pkg-config, search path, .pc index, linker dirs) of this process
+    :return: results of the libs by name, results of the commands by _spec_key
+    '''
+    libs = list(dict.fromkeys(_lib for _r in recipes for _lib in _r.system_libs))
+    commands = list({
+        _spec_key(_cmd, _r.command_specs.get(_cmd)): (_cmd, _r.command_specs.get(_cmd))
+        for _r in recipes for _cmd in _r.commands
+    }.values())
+    jobs = jobs or min(max(len(libs), len(commands), 1), os.cpu_count() or 1)
+    if use_index:
+        # in memory lookups, one scan for everybody
+        lib_results = _probe_libs(libs, True, use_cache)
+        libs = []
+    else:
+        lib_results = {}
+    if jobs <= 1:
+        lib_results.update(_probe_libs(libs, use_index, use_cache) if libs else {})
+        return lib_results, _probe_commands(commands, use_cache)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=import_host_facts, initargs=(export_host_facts(),)) \
+            as executor:
+        lib_futures = [executor.submit(_probe_libs, _c, use_index, use_cache) for _c in _chunks(libs, jobs)]
+        cmd_futures = [executor.submit(_probe_commands, _c, use_cache) for _c in _chunks(commands, jobs)]
+        for future in lib_futures:
+            lib_results.update(future.result())
+        cmd_results = {}
+        for future in cmd_futures:
+            cmd_results.update(future.result())
+    return lib_results, cmd_results
+
+
+def resolve_recipe(
+        recipe: recipe_requirements_t, lib_results: Dict[str, lib_probe_result_t],
+        cmd_results: Dict[str, cmd_version_result_t]
+) -> Dict[str, typing.Any]:
+    ''' what system_requirements_from_conan_data and build_requirements_from_conan_data would do, without
+    installing anything: every lib and command is 'system' (found and in range), 'install' (a system package
+    provides it), 'fallback' (a conan package is required instead) or 'unresolved'
+    '''
+    ret = {'folder': recipe.folder, 'error': recipe.error, 'system_libs': {}, 'commands': {}}
+    for lib, info in recipe.system_libs.items():
+        info = info or {}
+        ver_range = tuple(info.get('version') or ())
+        probe = lib_results[lib]
+        in_range = probe.version is not None and version_in_range(Version(probe.version), ver_range)
+        entry = {'required': list(ver_range), 'version': probe.version, 'package': info.get('pkg') or None,
+                 'fallback': recipe.lib_fallbacks.get(lib) or None, 'error': probe.error}
+        entry['status'] = _status(in_range, entry['package'], entry['fallback'])
+        ret['system_libs'][lib] = entry
+    for cmd, pkg in recipe.commands.items():
+        spec = recipe.command_specs.get(cmd)
+        probe = cmd_results[_spec_key(cmd, spec)]
+        entry = {'required': (spec or {}).get('ver_range_expr'), 'version': probe.version, 'path': probe.path,
+                 'package': pkg or None, 'fallback': recipe.command_fallbacks.get(cmd) or None,
+                 'error': probe.error}
+        entry['status'] = _status(probe.satisfied, entry['package'], entry['fallback'])
+        ret['commands'][cmd] = entry
+    return ret
+
+
+def _status(satisfied: bool, package: Optional[str], fallback: Optional[str]) -> str:
+    if satisfied:
+        return 'system'
+    if package:
+        return 'install'
+    if fallback:
+        return 'fallback'
+    return 'unresolved'
+
+
+def host_report() -> Dict[str, typing.Any]:
+    info = get_pkg_config_info()
+    return {
+        'os': tools.os_info.linux_distro or sys.platform,
+        'pkg_config': info.executable,
+        'pkg_config_version': info.version,
+        'is_pkgconf': info.is_pkgconf,
+        'pc_search_dirs': get_pc_search_dirs(get_default_pc_path) if info.executable else [],
+        'default_lib_paths': get_default_lib_path(),
+    }
+
+
+def evaluate_recipes(
+        paths: typing.Iterable[str], jobs: Optional[int] = None, use_index: bool = True, use_cache: bool = True,
+        output: typing.Union['ScopedOutput', logging.Logger] = default_logger
+) -> Dict[str, typing.Any]:
+    ''' load the recipe folders found in paths (see find_recipe_folders), probe their requirements once
+    and resolve each recipe
+    :return: json compatible report {'host': ..., 'probes': ..., 'recipes': {folder: resolution}, 'elapsed': seconds}
+    '''
+    start = time.perf_counter()
+    folders = find_recipe_folders(paths)
+    recipes = [load_recipe_requirements(_f) for _f in folders]
+    # probed once here, then given to the workers
+    host = host_report()
+    if use_index and host['pkg_config']:
+        get_pc_index()
+    for recipe in recipes:
+        if recipe.error:
+            warn(output, 'cannot load {}: {}'.format(recipe.folder, recipe.error))
+    lib_results, cmd_results = probe_requirements(recipes, jobs, use_index and bool(host['pkg_config']), use_cache)
+    resolutions = {_r.folder: resolve_recipe(_r, lib_results, cmd_results) for _r in recipes}
+    return {
+        'host': host,
+        'probes': {
+            'libs': len(lib_results),
+            'lib_requests': sum(len(_r.system_libs) for _r in recipes),
+            'commands': len(cmd_results),
+            'command_requests': sum(len(_r.commands) for _r in recipes),
+        },
+        'recipes': resolutions,
+        'elapsed': time.perf_counter() - start,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m conanutils.batch_utils', description=__doc__)
+    parser.add_argument('paths', nargs='+', help='recipe folders, or folders to search for conandata.yml')
+    parser.add_argument('--jobs', '-j', type=int, default=None, help='worker processes, one per cpu by default')
+    parser.add_argument('--no-index', action='store_true',
+                        help='run pkg-config for every lib instead of looking it up in the .pc index')
+    parser.add_argument('--no-cache', action='store_true', help='do not reuse the probes of previous runs')
+    parser.add_argument('--output', '-o', default=None, help='write the report to this json file instead of stdout')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    report = evaluate_recipes(args.paths, args.jobs, not args.no_index, not args.no_cache)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    statuses = [_e['status'] for _res in report['recipes'].values()
+                for _kind in ('system_libs', 'commands') for _e in _res[_kind].values()]
+    default_logger.info('{} recipes, {} libs and {} commands probed for {} and {} requests in {:.3f}s, {}'.format(
+        len(report['recipes']), report['probes']['libs'], report['probes']['commands'],
+        report['probes']['lib_requests'], report['probes']['command_requests'], report['elapsed'],
+        ', '.join('{} {}'.format(statuses.count(_s), _s) for _s in ('system', 'install', 'fallback', 'unresolved'))))
+    return 1 if any(_res['error'] for _res in report['recipes'].values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,9 @@
+# -*- coding: UTF-8 -*-
+''' Offline benchmarks of the helpers that scale with the number of packages or files:
+synthetic .pc trees and text files, and stub pkg-config / package manager executables.
+Run with `python -m conanutils.benchmarks --help`.
+'''
+from .cases import CASES, benchmark_case_t
+from .runner import (
+    DEFAULT_SIZES, benchmark_result_t, compare_results, load_results, run_benchmarks, save_results
+)
@@ -0,0 +1,43 @@
+# -*- coding: UTF-8 -*-
+import argparse
+import json
+import sys
+
+from .cases import CASES
+from .runner import (
+    DEFAULT_MAX_SUBPROCESS_SIZE, DEFAULT_SIZES, compare_results, load_results, run_benchmarks, run_case,
+    save_results
+)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m conanutils.benchmarks', description=__doc__)
+    parser.add_argument('--cases', nargs='+', choices=sorted(CASES), default=list(CASES))
+    parser.add_argument('--sizes', nargs='+', type=int, default=list(DEFAULT_SIZES),
+                        help='number of packages or files of the synthetic trees')
+    parser.add_argument('--max-subprocess-size', type=int, default=DEFAULT_MAX_SUBPROCESS_SIZE,
+                        help='largest size also measured with the pkg-config executable')
+    parser.add_argument('--timeout', type=float, default=None, help='seconds per measurement')
+    parser.add_argument('--workdir', default=None, help='where the synthetic trees are generated')
+    parser.add_argument('--output', '-o', default=None, help='write the results to this json file')
+    parser.add_argument('--compare', default=None, help='json file of a previous run to compare with')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--subprocess-pkg-config', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        result = run_case(args.cases[0], args.sizes[0], not args.subprocess_pkg_config, args.workdir)
+        print(json.dumps(result._asdict()))
+        return 0
+
+    results = run_benchmarks(args.cases, args.sizes, args.max_subprocess_size, args.workdir, args.timeout)
+    if args.output:
+        save_results(args.output, results)
+    if args.compare:
+        for line in compare_results(load_results(args.compare), results):
+            print(line)
+    return 1 if any(_r.error for _r in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+# -*- coding: UTF-8 -*-
+import glob
+import io
+import os
+import typing
+from typing import Callable, Dict, NamedTuple
+
+from . import stubs
+from .synthetic import conan_package_dir, generate_prefix, generate_text_tree
+
+
+class benchmark_case_t(NamedTuple):
+    name: str
+    # prepare(workdir, size) -> state, not timed
+    prepare: Callable[[str, int], typing.Any]
+    # run(state, native_pkg_config), timed
+    run: Callable[[typing.Any, bool], None]
+    uses_pkg_config: bool = False
+    max_size: typing.Optional[int] = None
+
+
+def make_recipe(package_folder: str, native_pkg_config: bool):
+    from conans.client.output import ConanOutput
+    from conans.model.build_info import CppInfo
+    from .. import AutoConanFile
+
+    class BenchRecipe(AutoConanFile):
+        name = 'bench'
+        fallback_requires = []
+
+        def requires(self, ref):
+            self.fallback_requires.append(ref)
+
+    BenchRecipe.native_pkg_config = native_pkg_config
+    recipe = BenchRecipe(ConanOutput(io.StringIO()), None, 'bench')
+    recipe.folders.set_base_package(package_folder)
+    recipe.cpp_info = CppInfo('bench', package_folder)
+    return recipe
+
+
+def _prepare_prefix(workdir: str, size: int):
+    return generate_prefix(os.path.join(workdir, 'prefix'), size)
+
+
+def _run_collect_libs_info(prefix, native: bool):
+    recipe = make_recipe(prefix.root, native)
+    recipe.collect_libs_info_from_pc(prefix.pc_dir, (prefix.system_pc_dir,))
+
+
+def _run_collect_components_info(prefix, native: bool):
+    from conans import tools
+    recipe = make_recipe(prefix.root, native)
+    # the system packages are found through PKG_CONFIG_PATH, like the .pc files of other conan packages
+    with tools.environment_append({'PKG_CONFIG_PATH': prefix.system_pc_dir}):
+        recipe.collect_components_info_from_pc(prefix.pc_dir)
+
+
+def _run_replace_regex_in_files(prefix, native: bool):
+    from ..conanfile_utils import replace_regex_in_files
+    replace_regex_in_files(
+        os.path.join(prefix.root, '**', '*.pc'), 'Description: synthetic', 'Description: generated', strict=False)
+
+
+def _prepare_relocation(workdir: str, size: int):
+    prefix = generate_prefix(os.path.join(workdir, 'prefix'), size)
+    deps = prefix.names[:20]
+    generate_text_tree(prefix.root, size, [conan_package_dir(_name) for _name in deps])
+    return prefix, [os.path.join(workdir, 'conan', _name, '1.0.0', '_', '_', 'package', 'f' * 40) for _name in deps]
+
+
+def _run_relocate_package_paths(state, native: bool):
+    from ..conanfile_utils import relocate_package_paths
+    prefix, dependency_dirs = state
+    relocate_package_paths(prefix.root, dependency_dirs)
+
+
+def _prepare_system_requirements(workdir: str, size: int):
+    ''' a third of the libs are installed, a third can be installed by the fake apt-get,
+    the others are missing and fall back to a conan package
+    '''
+    from conans import tools
+    system_pc_dir = os.environ[stubs.SYSTEM_PC_DIR_ENV]
+    available = os.environ[stubs.AVAILABLE_PACKAGES_ENV]
+    names = ['syslib{:04d}'.format(_i) for _i in range(size)]
+    installed = names[0::3]
+    installable = names[1::3]
+    stubs.write_available_packages(available, installed + installable)
+    with open(os.environ[stubs.PACKAGE_DB_ENV], 'w') as db:
+        for name in installed:
+            db.write(name + '-dev\n')
+            for pc in glob.glob(os.path.join(available, name + '-dev', '*.pc')):
+                os.link(pc, os.path.join(system_pc_dir, os.path.basename(pc)))
+    tools.os_info.linux_distro = 'ubuntu'
+    packages = {}
+    for name in names:
+        packages[name] = {'pkg': '' if name not in installed + installable else name + '-dev', 'version': ['1.0']}
+    conan_data = {'system-packages': {
+        'ubuntu': packages,
+        'fallback': {_name: '{}/1.0'.format(_name) for _name in names[2::3]},
+    }}
+    return os.path.join(workdir, 'package'), conan_data
+
+
+def _run_system_requirements(state, native: bool):
+    package_folder, conan_data = state
+    recipe = make_recipe(package_folder, native)
+    recipe.conan_data = conan_data
+    recipe.system_requirements_from_conan_data()
+
+
+CASES: Dict[str, benchmark_case_t] = {_case.name: _case for _case in (
+    benchmark_case_t('collect_libs_info_from_pc', _prepare_prefix, _run_collect_libs_info, True),
+    benchmark_case_t('collect_components_info_from_pc', _prepare_prefix, _run_collect_components_info, True),
+    benchmark_case_t('replace_regex_in_files', _prepare_prefix, _run_replace_regex_in_files),
+    benchmark_case_t('relocate_package_paths', _prepare_relocation, _run_relocate_package_paths),
+    benchmark_case_t(
+        'system_requirements_from_conan_data', _prepare_system_requirements, _run_system_requirements, True,
+        max_size=500),
+)}
@@ -0,0 +1,207 @@
+# -*- coding: UTF-8 -*-
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from . import stubs
+from .cases import CASES
+
+DEFAULT_SIZES = (10, 100, 1000)
+# tools.PkgConfig spawns about ten processes per package, bigger trees take minutes
+DEFAULT_MAX_SUBPROCESS_SIZE = 200
+
+
+class benchmark_result_t(NamedTuple):
+    case: str
+    size: int
+    native_pkg_config: Optional[bool]  # None if the case does not query pkg-config
+    wall_time: float  # seconds
+    popen_count: int  # subprocess.Popen created by the benchmarked process
+    stub_calls: int  # pkg-config and package manager invocations, including the ones run through a shell
+    peak_rss_kb: int
+    children_peak_rss_kb: int
+    error: Optional[str] = None
+
+
+def _package_root() -> str:
+    ''' folder to add to sys.path to import this package
+    '''
+    return os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _package_name() -> str:
+    return os.path.basename(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def bench_environment(workdir: str) -> Dict[str, str]:
+    ''' environment of the benchmarked process: stub tools first in PATH, private caches, no real pkg-config paths
+    '''
+    bin_dir = stubs.write_stub_tools(os.path.join(workdir, 'bin'))
+    system_pc_dir = os.path.join(workdir, 'system-pc')
+    os.makedirs(system_pc_dir, exist_ok=True)
+    env = dict(os.environ)
+    for var in ('PKG_CONFIG_PATH', 'PKG_CONFIG_LIBDIR', 'PKG_CONFIG', 'PKG_CONFIG_SYSROOT_DIR', 'SYSROOT'):
+        env.pop(var, None)
+    env.update({
+        'PATH': bin_dir + os.pathsep + env.get('PATH', ''),
+        'PYTHONPATH': _package_root() + os.pathsep + env.get('PYTHONPATH', ''),
+        'CONANUTILS_CACHE_DIR': os.path.join(workdir, 'cache'),
+        'CONAN_SYSREQUIRES_MODE': 'enabled',
+        'CONAN_SYSREQUIRES_SUDO': 'False',
+        stubs.SPAWN_LOG_ENV: os.path.join(workdir, 'spawns.log'),
+        stubs.PACKAGE_DB_ENV: os.path.join(workdir, 'dpkg-status'),
+        # invalidates the host probe cache when the fake apt-get installs something
+        'CONANUTILS_PACKAGE_DB_PATHS': os.path.join(workdir, 'dpkg-status'),
+        stubs.AVAILABLE_PACKAGES_ENV: os.path.join(workdir, 'available'),
+        stubs.SYSTEM_PC_DIR_ENV: system_pc_dir,
+    })
+    return env
+
+
+def run_case(case_name: str, size: int, native_pkg_config: bool, workdir: str) -> benchmark_result_t:
+    ''' prepare and run one case in the current process, which should have the environment of bench_environment
+    '''
+    import subprocess as _subprocess
+    case = CASES[case_name]
+    state = case.prepare(workdir, size)
+    popen_count = [0]
+    original_init = _subprocess.Popen.__init__
+
+    def counting_init(self, *args, **kwargs):
+        popen_count[0] += 1
+        original_init(self, *args, **kwargs)
+
+    spawn_log = os.environ[stubs.SPAWN_LOG_ENV]
+    if os.path.exists(spawn_log):
+        os.unlink(spawn_log)
+    _subprocess.Popen.__init__ = counting_init
+    error = None
+    start = time.perf_counter()
+    try:
+        case.run(state, native_pkg_config)
+    except Exception as e:
+        error = '{}: {}'.format(type(e).__name__, e)
+    finally:
+        wall_time = time.perf_counter() - start
+        _subprocess.Popen.__init__ = original_init
+    return benchmark_result_t(
+        case_name, size, native_pkg_config if case.uses_pkg_config else None, wall_time, popen_count[0],
+        stubs.count_spawns(spawn_log),
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        error
+    )
+
+
+def run_case_in_child(
+        case_name: str, size: int, native_pkg_config: bool, workdir: str, timeout: Optional[float] = None
+) -> benchmark_result_t:
+    ''' run_case in a fresh interpreter, so that peak RSS and the in-process caches belong to this case only
+    '''
+    os.makedirs(workdir, exist_ok=True)
+    cmd = [sys.executable, '-m', _package_name() + '.benchmarks', '--child',
+           '--cases', case_name, '--sizes', str(size), '--workdir', workdir]
+    if not native_pkg_config:
+        cmd.append('--subprocess-pkg-config')
+    try:
+        proc = subprocess.run(
+            cmd, env=bench_environment(workdir), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True, timeout=timeout
+        )
+    except subprocess.TimeoutExpired:
+        return benchmark_result_t(case_name, size, native_pkg_config, timeout, 0, 0, 0, 0, 'timeout')
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        return benchmark_result_t(
+            case_name, size, native_pkg_config, 0., 0, 0, 0, 0,
+            'exit code {}: {}'.format(proc.returncode, proc.stderr.strip()[-2000:]))
+    return benchmark_result_t(**json.loads(lines[-1]))
+
+
+def run_benchmarks(
+        cases: Sequence[str] = tuple(CASES), sizes: Sequence[int] = DEFAULT_SIZES,
+        max_subprocess_size: int = DEFAULT_MAX_SUBPROCESS_SIZE, workdir: Optional[str] = None,
+        timeout: Optional[float] = None, log: typing.Callable[[str], None] = print
+) -> List[benchmark_result_t]:
+    ''' run every case for every size, with the native .pc engine and with the pkg-config executable
+    for the cases that query pkg-config.
+    '''
+    results = []
+    if workdir is not None:
+        os.makedirs(workdir, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix='conanutils-bench-', dir=workdir) as root:
+        for case_name in cases:
+            case = CASES[case_name]
+            for size in sizes:
+                if case.max_size is not None and size > case.max_size:
+                    continue
+                modes = [True]
+                if case.uses_pkg_config and size <= max_subprocess_size:
+                    modes.append(False)
+                for native in modes:
+                    case_dir = os.path.join(root, '{}-{}-{}'.format(case_name, size, 'native' if native else 'exe'))
+                    result = run_case_in_child(case_name, size, native, case_dir, timeout)
+                    log(format_result(result))
+                    results.append(result)
+    return results
+
+
+def format_result(result: benchmark_result_t) -> str:
+    mode = {None: '', True: ' (native)', False: ' (pkg-config)'}[result.native_pkg_config]
+    if result.error:
+        return '{}{} size={}: ERROR {}'.format(result.case, mode, result.size, result.error)
+    return '{}{} size={}: {:.3f}s, {} popen, {} stub calls, peak rss {} KiB (children {} KiB)'.format(
+        result.case, mode, result.size, result.wall_time, result.popen_count, result.stub_calls,
+        result.peak_rss_kb, result.children_peak_rss_kb)
+
+
+def save_results(path: str, results: Sequence[benchmark_result_t]):
+    data = {
+        'created': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': [_r._asdict() for _r in results],
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+def load_results(path: str) -> List[benchmark_result_t]:
+    with open(path) as f:
+        return [benchmark_result_t(**_r) for _r in json.load(f)['results']]
+
+
+def compare_results(
+        baseline: Sequence[benchmark_result_t], current: Sequence[benchmark_result_t]
+) -> List[str]:
+    ''' one line per case present in both runs with the ratio current / baseline of time, spawned processes and RSS
+    '''
+    def key(result):
+        return result.case, result.size, result.native_pkg_config
+
+    old = {key(_r): _r for _r in baseline}
+    ret = []
+    for result in current:
+        base = old.get(key(result))
+        if base is None or base.error or result.error:
+            continue
+
+        def ratio(a, b):
+            return '{:.2f}x'.format(a / b) if b else ('=' if a == b else 'new')
+
+        mode = {None: '', True: ' (native)', False: ' (pkg-config)'}[result.native_pkg_config]
+        ret.append('{}{} size={}: time {} ({:.3f}s -> {:.3f}s), popen {} ({} -> {}), stub calls {} ({} -> {}), '
+                   'rss {}'.format(
+                       result.case, mode, result.size,
+                       ratio(result.wall_time, base.wall_time), base.wall_time, result.wall_time,
+                       ratio(result.popen_count, base.popen_count), base.popen_count, result.popen_count,
+                       ratio(result.stub_calls, base.stub_calls), base.stub_calls, result.stub_calls,
+                       ratio(result.peak_rss_kb, base.peak_rss_kb)))
+    return ret
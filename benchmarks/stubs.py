@@ -0,0 +1,285 @@
+# -*- coding: UTF-8 -*-
+''' Offline stand-ins for pkg-config and the system package manager, written as executables into a bin folder
+that the benchmarks put first in PATH. Every call is appended to $BENCH_SPAWN_LOG.
+'''
+import os
+import stat
+import sys
+from typing import Iterable
+
+SPAWN_LOG_ENV = 'BENCH_SPAWN_LOG'
+PACKAGE_DB_ENV = 'BENCH_PACKAGE_DB'
+# folder of <system package>/<*.pc> that the fake apt-get installs into BENCH_SYSTEM_PC_DIR
+AVAILABLE_PACKAGES_ENV = 'BENCH_AVAILABLE_PACKAGES'
+SYSTEM_PC_DIR_ENV = 'BENCH_SYSTEM_PC_DIR'
+PKG_CONFIG_FLAVOUR_ENV = 'BENCH_PKG_CONFIG_FLAVOUR'
+
+# a small pkg-config: variables, Requires (without version checks), the flag options of tools.PkgConfig,
+# PKG_CONFIG_<PKG>_<VAR> overrides, --list-all and the built-in "pkg-config" package.
+# It only needs the standard library, so that it starts quickly with -SE.
+_PKG_CONFIG_STUB = r'''
+import os, re, sys
+
+def log():
+    path = os.environ.get('BENCH_SPAWN_LOG')
+    if path:
+        with open(path, 'a') as f:
+            f.write('pkg-config ' + ' '.join(sys.argv[1:]) + '\n')
+
+PKGCONF = os.environ.get('BENCH_PKG_CONFIG_FLAVOUR') == 'pkgconf'
+SYSTEM_DIRS = os.environ.get('BENCH_SYSTEM_PC_DIR', '')
+
+def search_dirs():
+    dirs = [d for d in os.environ.get('PKG_CONFIG_PATH', '').split(':') if d]
+    libdir = os.environ.get('PKG_CONFIG_LIBDIR')
+    dirs.extend([d for d in (libdir if libdir is not None else SYSTEM_DIRS).split(':') if d])
+    return dirs
+
+def find(name):
+    for d in search_dirs():
+        path = os.path.join(d, name + '.pc')
+        if os.path.isfile(path):
+            return path
+    return None
+
+def parse(path, defines):
+    pkg = os.path.splitext(os.path.basename(path))[0]
+    variables, fields = {'pcfiledir': os.path.dirname(path)}, {}
+    def expand(value):
+        return re.sub(r'\$\{([^}]*)\}', lambda m: variables.get(m.group(1), ''), value)
+    for line in open(path):
+        line = line.split('#', 1)[0].strip()
+        m = re.match(r'^([A-Za-z0-9_.]+)\s*([:=])\s*(.*)$', line)
+        if not m:
+            continue
+        key, op, value = m.groups()
+        if op == '=':
+            env = 'PKG_CONFIG_' + re.sub('[^A-Za-z0-9]', '_', pkg).upper() + '_' + key.upper()
+            if key in defines:
+                variables[key] = defines[key]
+            elif not PKGCONF and env in os.environ:
+                variables[key] = os.environ[env]
+            else:
+                variables[key] = expand(value)
+        else:
+            fields[key.lower()] = expand(value)
+    return variables, fields
+
+def requires(value):
+    ret, tokens = [], value.replace(',', ' ').split()
+    i = 0
+    while i < len(tokens):
+        if tokens[i] in ('<', '>', '<=', '>=', '=', '!='):
+            i += 2
+            continue
+        ret.append(tokens[i])
+        i += 1
+    return ret
+
+def main(argv):
+    log()
+    options, names, defines = [], [], {}
+    static = False
+    for arg in argv:
+        if arg.startswith('--define-variable='):
+            key, _, value = arg[len('--define-variable='):].partition('=')
+            defines[key] = value
+        elif arg == '--static':
+            static = True
+        elif arg in ('--print-errors', '--errors-to-stdout', '--short-errors'):
+            pass
+        elif arg.startswith('--'):
+            options.append(arg[2:])
+        else:
+            names.append(arg)
+    if 'about' in options:
+        if PKGCONF:
+            print('pkgconf 1.8.1 (stub)')
+            return 0
+        return 1
+    if 'version' in options:
+        print('1.8.1' if PKGCONF else '0.29.2')
+        return 0
+    if 'list-all' in options or 'list-package-names' in options:
+        seen = set()
+        for d in search_dirs():
+            if os.path.isdir(d):
+                for f in sorted(os.listdir(d)):
+                    if f.endswith('.pc') and f[:-3] not in seen:
+                        seen.add(f[:-3])
+                        print(f[:-3] if 'list-package-names' in options else f[:-3] + ' ' + f[:-3])
+        return 0
+    if names == ['pkg-config']:
+        builtins = {'pc_path': SYSTEM_DIRS, 'pc_system_libdirs': '/usr/lib', 'pc_system_includedirs': '/usr/include'}
+        for option in options:
+            if option == 'print-variables':
+                print('\n'.join(builtins))
+            elif option.startswith('variable='):
+                print(builtins.get(option[len('variable='):], ''))
+        return 0
+    parsed = {}
+    def load(name):
+        if name not in parsed:
+            path = find(name)
+            if path is None:
+                sys.stderr.write("Package {} was not found in the pkg-config search path.\n".format(name))
+                sys.exit(1)
+            parsed[name] = parse(path, defines)
+        return parsed[name]
+    order = []
+    def visit(name):
+        if name in order:
+            return
+        order.append(name)
+        _variables, fields = load(name)
+        deps = requires(fields.get('requires', ''))
+        if static:
+            deps += requires(fields.get('requires.private', ''))
+        for dep in deps:
+            visit(dep)
+    for name in names:
+        visit(name)
+    def flags(field, private_field=None):
+        ret = []
+        for name in order:
+            _variables, fields = parsed[name]
+            ret.extend(fields.get(field, '').split())
+            if static and private_field:
+                ret.extend(fields.get(private_field, '').split())
+        out = []
+        for flag in ret:
+            if flag not in out or flag.startswith('-l'):
+                out.append(flag)
+        return out
+    for option in options:
+        variables, fields = parsed[names[0]]
+        if option == 'exists':
+            pass
+        elif option == 'modversion':
+            print(fields.get('version', ''))
+        elif option.startswith('variable='):
+            print(variables.get(option[len('variable='):], ''))
+        elif option == 'print-variables':
+            print('\n'.join(v for v in variables if v != 'pcfiledir'))
+        elif option == 'print-requires':
+            print('\n'.join(requires(fields.get('requires', ''))))
+        elif option == 'print-requires-private':
+            print('\n'.join(requires(fields.get('requires.private', ''))))
+        elif option.startswith('cflags'):
+            cflags = flags('cflags')
+            if option == 'cflags-only-I':
+                cflags = [f for f in cflags if f.startswith('-I')]
+            elif option == 'cflags-only-other':
+                cflags = [f for f in cflags if not f.startswith('-I')]
+            print(' '.join(cflags))
+        elif option.startswith('libs'):
+            libs = flags('libs', 'libs.private')
+            if option == 'libs-only-L':
+                libs = [f for f in libs if f.startswith('-L')]
+            elif option == 'libs-only-l':
+                libs = [f for f in libs if f.startswith('-l')]
+            elif option == 'libs-only-other':
+                libs = [f for f in libs if not f.startswith(('-L', '-l'))]
+            print(' '.join(libs))
+        else:
+            sys.stderr.write('unsupported option --{}\n'.format(option))
+            return 1
+    return 0
+
+sys.exit(main(sys.argv[1:]))
+'''
+
+# dpkg-query -W [-f=<format>] <pkg>...
+_DPKG_QUERY_STUB = r'''
+import os, sys
+log = os.environ.get('BENCH_SPAWN_LOG')
+if log:
+    with open(log, 'a') as f:
+        f.write('dpkg-query ' + ' '.join(sys.argv[1:]) + '\n')
+db = os.environ.get('BENCH_PACKAGE_DB', '')
+installed = set(open(db).read().split()) if os.path.isfile(db) else set()
+fmt = '${Package}\t${Version}\n'
+pkgs = []
+args = iter(sys.argv[1:])
+for a in args:
+    if a.startswith(('-f=', '--showformat=')):
+        fmt = a.split('=', 1)[1]
+    elif a in ('-f', '--showformat'):
+        fmt = next(args)
+    elif not a.startswith('-'):
+        pkgs.append(a)
+fmt = fmt.replace('\\n', '\n').replace('\\t', '\t')
+missing = []
+for p in pkgs:
+    name = p.split(':')[0]
+    if name not in installed:
+        missing.append(p)
+        continue
+    sys.stdout.write(fmt.replace('${binary:Package}', name).replace('${Package}', name)
+                     .replace('${Status}', 'install ok installed').replace('${Version}', '1.0'))
+if missing:
+    sys.stderr.write('dpkg-query: no packages found matching {}\n'.format(' '.join(missing)))
+    sys.exit(1)
+'''
+
+# apt-get update | apt-get install -y [--no-install-recommends] <pkg>..., nothing is installed if a package is unknown
+_APT_GET_STUB = r'''
+import os, shutil, sys
+log = os.environ.get('BENCH_SPAWN_LOG')
+if log:
+    with open(log, 'a') as f:
+        f.write('apt-get ' + ' '.join(sys.argv[1:]) + '\n')
+args = [a for a in sys.argv[1:] if not a.startswith('-')]
+if args and args[0] == 'install':
+    available = os.environ.get('BENCH_AVAILABLE_PACKAGES', '')
+    pc_dir = os.environ.get('BENCH_SYSTEM_PC_DIR', '')
+    pkgs = [p.split(':')[0] for p in args[1:]]
+    for pkg in pkgs:
+        if not os.path.isdir(os.path.join(available, pkg)):
+            sys.stderr.write('E: Unable to locate package {}\n'.format(pkg))
+            sys.exit(100)
+    with open(os.environ['BENCH_PACKAGE_DB'], 'a') as db:
+        for pkg in pkgs:
+            src = os.path.join(available, pkg)
+            for f in os.listdir(src):
+                shutil.copy(os.path.join(src, f), pc_dir)
+            db.write(pkg + '\n')
+'''
+
+
+def _write_script(path: str, body: str):
+    with open(path, 'w') as f:
+        f.write('#!{} -SE\n'.format(sys.executable))
+        f.write(body)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def write_stub_tools(bin_dir: str) -> str:
+    ''' write pkg-config, pkgconf, dpkg-query and apt-get stubs into bin_dir
+    :return: bin_dir
+    '''
+    os.makedirs(bin_dir, exist_ok=True)
+    _write_script(os.path.join(bin_dir, 'pkg-config'), _PKG_CONFIG_STUB)
+    _write_script(os.path.join(bin_dir, 'pkgconf'), _PKG_CONFIG_STUB)
+    _write_script(os.path.join(bin_dir, 'dpkg-query'), _DPKG_QUERY_STUB)
+    _write_script(os.path.join(bin_dir, 'apt-get'), _APT_GET_STUB)
+    return bin_dir
+
+
+def write_available_packages(available_dir: str, packages: Iterable[str], version: str = '1.2.0') -> str:
+    ''' .pc files that the fake apt-get installs, one system package <name>-dev per library <name>
+    '''
+    for name in packages:
+        pkg_dir = os.path.join(available_dir, name + '-dev')
+        os.makedirs(pkg_dir, exist_ok=True)
+        with open(os.path.join(pkg_dir, name + '.pc'), 'w') as f:
+            f.write('prefix=/usr\nlibdir=${prefix}/lib\nName: %s\nVersion: %s\nLibs: -L${libdir} -l%s\n'
+                    % (name, version, name))
+    return available_dir
+
+
+def count_spawns(log_path: str) -> int:
+    if not os.path.exists(log_path):
+        return 0
+    with open(log_path) as f:
+        return sum(1 for _ in f)
@@ -0,0 +1,115 @@
+# -*- coding: UTF-8 -*-
+import hashlib
+import os
+import random
+import typing
+from typing import Dict, List, NamedTuple
+
+# packages of the system prefix that synthetic packages can depend on
+SYSTEM_PACKAGES = ('zlib', 'libffi', 'libpcre2-8', 'openssl', 'libcrypto')
+SYSTEM_LIBS = ('m', 'pthread', 'dl', 'rt')
+
+
+class synthetic_prefix_t(NamedTuple):
+    root: str  # install prefix of the generated packages
+    pc_dir: str
+    system_pc_dir: str  # .pc files of the fake system prefix
+    names: List[str]
+    requires: Dict[str, List[str]]
+
+
+def conan_package_dir(name: str, version: str = '1.0.0') -> str:
+    ''' package folder of name in a fake conan cache, used as the prefix that relocation has to replace
+    '''
+    return '/home/builder/.conan/data/{}/{}/_/_/package/{}'.format(
+        name, version, hashlib.sha1(name.encode()).hexdigest())
+
+
+def _pc_content(name: str, prefix: str, version: str, requires: List[str], requires_private: List[str],
+                libs_private: List[str]) -> str:
+    lines = [
+        'prefix={}'.format(prefix),
+        'exec_prefix=${prefix}',
+        'libdir=${exec_prefix}/lib',
+        'includedir=${prefix}/include',
+        '',
+        'Name: {}'.format(name),
+        'Description: synthetic package {}'.format(name),
+        'Version: {}'.format(version),
+    ]
+    if requires:
+        lines.append('Requires: {}'.format(', '.join(requires)))
+    if requires_private:
+        lines.append('Requires.private: {}'.format(', '.join(requires_private)))
+    lines.append('Libs: -L${{libdir}} -l{}'.format(name))
+    if libs_private:
+        lines.append('Libs.private: {}'.format(' '.join('-l' + _lib for _lib in libs_private)))
+    lines.append('Cflags: -I${{includedir}}/{} -DHAVE_{}=1'.format(name, name.upper().replace('-', '_')))
+    return '\n'.join(lines) + '\n'
+
+
+def write_system_prefix(system_root: str) -> str:
+    ''' a fake /usr with the .pc files of SYSTEM_PACKAGES
+    :return: its pkgconfig dir
+    '''
+    pc_dir = os.path.join(system_root, 'lib', 'pkgconfig')
+    os.makedirs(pc_dir, exist_ok=True)
+    for name in SYSTEM_PACKAGES:
+        with open(os.path.join(pc_dir, name + '.pc'), 'w') as f:
+            f.write(_pc_content(name, system_root, '1.2.0', [], [], []))
+    return pc_dir
+
+
+def generate_prefix(
+        root: str, n_packages: int, seed: int = 0, max_requires: int = 3, window: int = 50,
+        conan_prefixes: bool = True
+) -> synthetic_prefix_t:
+    ''' install prefix with n_packages .pc files whose Requires form chains: package i depends on up to
+    max_requires packages among the window packages generated before it, and sometimes on a system package.
+    :param conan_prefixes: write the prefix of every package as a folder of a fake conan cache (see conan_package_dir)
+        instead of root, like the .pc files of a package built on another machine
+    '''
+    rng = random.Random(seed)
+    system_pc_dir = write_system_prefix(os.path.join(root, 'system'))
+    pc_dir = os.path.join(root, 'lib', 'pkgconfig')
+    os.makedirs(pc_dir, exist_ok=True)
+    os.makedirs(os.path.join(root, 'include'), exist_ok=True)
+    names = ['synth{:05d}'.format(_i) for _i in range(n_packages)]
+    all_requires = {}
+    for i, name in enumerate(names):
+        candidates = names[max(0, i - window):i]
+        requires = rng.sample(candidates, min(len(candidates), rng.randint(0, max_requires)))
+        requires_private = []
+        if requires and rng.random() < 0.3:
+            requires_private.append(requires.pop())
+        if rng.random() < 0.1:
+            requires.append(rng.choice(SYSTEM_PACKAGES))
+        libs_private = rng.sample(SYSTEM_LIBS, rng.randint(0, 2))
+        prefix = conan_package_dir(name) if conan_prefixes else root
+        with open(os.path.join(pc_dir, name + '.pc'), 'w') as f:
+            f.write(_pc_content(
+                name, prefix, '1.{}.{}'.format(i % 10, i % 7), requires, requires_private, libs_private))
+        all_requires[name] = requires + requires_private
+    return synthetic_prefix_t(root, pc_dir, system_pc_dir, names, all_requires)
+
+
+def generate_text_tree(root: str, n_files: int, prefixes: typing.Sequence[str], seed: int = 0) -> List[str]:
+    ''' cmake/libtool/script files mentioning some of prefixes, for the relocation benchmarks
+    '''
+    rng = random.Random(seed)
+    ret = []
+    suffixes = ('.cmake', '.la', '.sh', '.txt')
+    for i in range(n_files):
+        folder = os.path.join(root, 'share', 'd{:03d}'.format(i % 100))
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, 'f{:05d}{}'.format(i, suffixes[i % len(suffixes)]))
+        lines = ['# synthetic file {}'.format(i)]
+        for _ in range(20):
+            if prefixes and rng.random() < 0.2:
+                lines.append('set(DEP_DIR "{}/lib")'.format(rng.choice(prefixes)))
+            else:
+                lines.append('set(VAR_{} "value {}")'.format(rng.randint(0, 1000), rng.random()))
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        ret.append(path)
+    return ret
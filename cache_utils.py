@@ -0,0 +1,356 @@
+# -*- coding: UTF-8 -*-
+import contextlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import typing
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+CACHE_DIR_ENV = 'CONANUTILS_CACHE_DIR'
+
+
+def warn(output, msg: str):
+    ''' output.warn of a ScopedOutput, output.warning of a logger whose warn is deprecated.
+    A stage_utils.StageOutput stands for its target.
+    '''
+    if isinstance(getattr(output, 'target', output), logging.Logger):
+        output.warning(msg)
+    else:
+        output.warn(msg)
+
+
+def get_cache_dir(*sub_dirs: str, create: bool = True) -> str:
+    ''' host level cache folder shared by all recipes: $CONANUTILS_CACHE_DIR, or conanutils in the XDG cache dir
+    '''
+    root = os.environ.get(CACHE_DIR_ENV)
+    if not root:
+        root = os.path.join(
+            os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+            'conanutils'
+        )
+    path = os.path.join(root, *sub_dirs)
+    if create:
+        os.makedirs(path, exist_ok=True)
+    return path
+
+
+def binary_identity(executable: str, search_path: typing.Optional[str] = None) \
+        -> typing.Optional[typing.Tuple[str, int, int]]:
+    ''' (resolved path, mtime, inode) of an executable in PATH, None if it cannot be found
+    :param search_path: look in these dirs instead of PATH
+    '''
+    path = shutil.which(executable, path=search_path)
+    if not path:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return os.path.realpath(path), st.st_mtime_ns, st.st_ino
+
+
+@contextlib.contextmanager
+def file_lock(lock_path: str, shared: bool = False, blocking: bool = True):
+    ''' advisory lock on lock_path, so that concurrent conan processes can share a cache
+    :param blocking: if False, do not wait for the lock
+    :return: whether the lock is held
+    '''
+    with open(lock_path, 'a+') as f:
+        acquired = True
+        if fcntl is not None:
+            flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+            if not blocking:
+                flags |= fcntl.LOCK_NB
+            try:
+                fcntl.flock(f.fileno(), flags)
+            except BlockingIOError:
+                acquired = False
+        try:
+            yield acquired
+        finally:
+            if fcntl is not None and acquired:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def save_json_atomic(path: str, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, sort_keys=True)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def load_json(path: str, default=None):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+class HostCache(object):
+    ''' Small JSON store for facts about the host (linker search dirs, pkg-config built-in variables, ...).
+    Each entry remembers the key it was computed for, e.g. the identity of the binary that produced it,
+    and is recomputed when the key changes.
+    '''
+
+    def __init__(self, name: str = 'host_facts'):
+        self.path = os.path.join(get_cache_dir(create=False), name + '.json')
+        self.lock_path = self.path + '.lock'
+
+    def get(self, name: str, key):
+        if not os.path.exists(self.path):
+            return None
+        with file_lock(self.lock_path, shared=True):
+            entry = load_json(self.path, {}).get(name)
+        if entry is not None and entry.get('key') == self._normalize(key):
+            return entry.get('value')
+        return None
+
+    def set(self, name: str, key, value):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with file_lock(self.lock_path):
+            data = load_json(self.path, {})
+            data[name] = {'key': self._normalize(key), 'value': value}
+            save_json_atomic(self.path, data)
+
+    def get_or_compute(self, name: str, key, compute: typing.Callable[[], typing.Any]):
+        try:
+            value = self.get(name, key)
+        except OSError:
+            value = None
+        if value is None:
+            value = compute()
+            try:
+                self.set(name, key, value)
+            except OSError:
+                # a read only cache dir must not break the recipe
+                pass
+        return value
+
+    @staticmethod
+    def _normalize(key):
+        # compare keys the way they come back from json
+        return json.loads(json.dumps(key))
+
+
+_host_cache: typing.Optional[HostCache] = None
+
+
+def get_host_cache() -> HostCache:
+    global _host_cache
+    if _host_cache is None:
+        _host_cache = HostCache()
+    return _host_cache
+
+
+# databases whose mtime changes whenever a system package is installed or removed
+PACKAGE_DB_PATHS = (
+    '/var/lib/dpkg/status',
+    '/var/lib/rpm/rpmdb.sqlite',
+    '/var/lib/rpm/Packages',
+    '/usr/lib/sysimage/rpm/rpmdb.sqlite',
+    '/var/lib/pacman/local',
+    '/var/db/pkg/local.sqlite',
+)
+# more databases to watch, separated by os.pathsep
+PACKAGE_DB_PATHS_ENV = 'CONANUTILS_PACKAGE_DB_PATHS'
+PROBE_TTL_ENV = 'CONANUTILS_PROBE_TTL'
+DEFAULT_PROBE_TTL = 24 * 3600
+
+
+def package_db_stamp(env: typing.Optional[typing.Mapping[str, str]] = None) -> typing.List[typing.Tuple[str, int]]:
+    ''' (path, mtime) of the package databases of the host, to invalidate what depends on the installed packages
+    :param env: environment to read instead of os.environ
+    '''
+    paths = list(PACKAGE_DB_PATHS)
+    paths.extend([_p for _p in (os.environ if env is None else env).get(PACKAGE_DB_PATHS_ENV, '').split(os.pathsep)
+                  if _p])
+    ret = []
+    for path in paths:
+        try:
+            ret.append((path, os.stat(path).st_mtime_ns))
+        except OSError:
+            pass
+    return ret
+
+
+def dir_stamp(dirs: typing.Iterable[str]) -> typing.List[typing.Tuple[str, typing.Optional[int]]]:
+    ''' (dir, mtime, None if it does not exist) of dirs, which changes when a file is added to or removed from them
+    '''
+    ret = []
+    for _dir in dirs:
+        try:
+            ret.append((_dir, os.stat(_dir).st_mtime_ns))
+        except OSError:
+            ret.append((_dir, None))
+    return ret
+
+
+class ProbeCache(HostCache):
+    ''' Results of host probes (pkg-config lookups, command versions, installed system packages) shared by the
+    conan processes of the host. An entry is used only if its key is unchanged, which should include
+    package_db_stamp() and whatever else the probe depends on (PATH, binary_identity, ...), and if it is younger
+    than ttl seconds. Lookups and stores work on many entries at once, so that a recipe reads and writes the
+    file once for all its probes.
+    '''
+
+    def __init__(self, name: str = 'host_probes', ttl: typing.Optional[float] = None):
+        super().__init__(name)
+        if ttl is None:
+            ttl = float(os.environ.get(PROBE_TTL_ENV) or DEFAULT_PROBE_TTL)
+        self.ttl = ttl
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def lookup(self, keys: typing.Mapping[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+        ''' :param keys: {entry name: key}
+        :return: {entry name: value} of the valid entries
+        '''
+        if not self.enabled or not keys or not os.path.exists(self.path):
+            return {}
+        try:
+            with file_lock(self.lock_path, shared=True):
+                data = load_json(self.path, {})
+        except OSError:
+            return {}
+        now = time.time()
+        ret = {}
+        for name, key in keys.items():
+            entry = data.get(name)
+            if entry is not None and entry.get('key') == self._normalize(key) \
+                    and now - entry.get('time', 0) < self.ttl:
+                ret[name] = entry['value']
+        return ret
+
+    def store(self, items: typing.Mapping[str, typing.Tuple[typing.Any, typing.Any]]):
+        ''' :param items: {entry name: (key, value)}, the expired entries are dropped at the same time
+        '''
+        if not self.enabled or not items:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with file_lock(self.lock_path):
+                data = load_json(self.path, {})
+                now = time.time()
+                data = {_n: _e for _n, _e in data.items() if now - _e.get('time', 0) < self.ttl}
+                for name, (key, value) in items.items():
+                    data[name] = {'key': self._normalize(key), 'value': value, 'time': now}
+                save_json_atomic(self.path, data)
+        except OSError:
+            # a read only cache dir must not break the recipe
+            pass
+
+    def get_or_probe_many(
+            self, keys: typing.Mapping[str, typing.Any],
+            probe: typing.Callable[[typing.List[str]], typing.Mapping[str, typing.Any]],
+            cacheable: typing.Callable[[typing.Any], bool] = lambda _v: True
+    ) -> typing.Dict[str, typing.Any]:
+        ''' values of keys, from the cache or from probe(names of the missing entries)
+        :param cacheable: whether a probed value can be stored, e.g. not after a timeout
+        '''
+        ret = self.lookup(keys)
+        missing = [_name for _name in keys if _name not in ret]
+        if missing:
+            probed = probe(missing)
+            ret.update(probed)
+            self.store({_name: (keys[_name], _value) for _name, _value in probed.items() if cacheable(_value)})
+        return {_name: ret[_name] for _name in keys}
+
+
+_probe_cache: typing.Optional[ProbeCache] = None
+
+
+def get_probe_cache() -> ProbeCache:
+    global _probe_cache
+    if _probe_cache is None:
+        _probe_cache = ProbeCache()
+    return _probe_cache
+
+
+def dir_size(path: str) -> int:
+    ret = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                ret += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                pass
+    return ret
+
+
+class LruDirCache(object):
+    ''' Directories under root with an index of their size and last use.
+    Each directory has its own lock file, the least recently used ones are removed
+    when the total size grows over max_size bytes.
+    '''
+
+    def __init__(self, root: str, max_size: int):
+        self.root = root
+        self.max_size = max_size
+        self.index_path = os.path.join(self.root, 'index.json')
+
+    def entry_lock_path(self, path: str) -> str:
+        return path + '.lock'
+
+    def record(self, path: str, size: typing.Optional[int] = None, **info):
+        ''' mark path as used now
+        :param size: new size of path, the recorded one is kept if None
+        '''
+        os.makedirs(self.root, exist_ok=True)
+        with file_lock(self.index_path + '.lock'):
+            index = load_json(self.index_path, {})
+            entry = index.setdefault(os.path.basename(path), {'size': 0})
+            entry.update(info)
+            if size is not None:
+                entry['size'] = size
+            entry['last_used'] = time.time()
+            save_json_atomic(self.index_path, index)
+
+    def forget(self, path: str):
+        with file_lock(self.index_path + '.lock'):
+            index = load_json(self.index_path, {})
+            if index.pop(os.path.basename(path), None) is not None:
+                save_json_atomic(self.index_path, index)
+
+    def evict(self, keep: typing.Sequence[str] = ()) -> typing.List[str]:
+        ''' remove the least recently used directories until the cache fits in max_size,
+        directories locked by another process and keep are not removed
+        :return: removed directories
+        '''
+        removed = []
+        keep = {os.path.basename(_path) for _path in keep}
+        if not os.path.exists(self.index_path):
+            return removed
+        with file_lock(self.index_path + '.lock'):
+            index = load_json(self.index_path, {})
+            total = sum(_entry.get('size', 0) for _entry in index.values())
+            for name, entry in sorted(index.items(), key=lambda _item: _item[1].get('last_used', 0)):
+                if total <= self.max_size:
+                    break
+                if name in keep:
+                    continue
+                path = os.path.join(self.root, name)
+                with file_lock(self.entry_lock_path(path), blocking=False) as acquired:
+                    if not acquired:
+                        continue
+                    shutil.rmtree(path, ignore_errors=True)
+                total -= entry.get('size', 0)
+                index.pop(name)
+                removed.append(path)
+            if removed:
+                save_json_atomic(self.index_path, index)
+        return removed
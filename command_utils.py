@@ -1,44 +1,170 @@
 # -*- coding: UTF-8 -*-
+import functools
+import json
+import os
+import shutil
 import subprocess
+import time
 import typing
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, NamedTuple, Optional
 
-from conans.client.output import ScopedOutput
+from conans import tools
 from conans.errors import ConanException
-from conans.util.runners import check_output_runner
 from conans.model.version import Version
-from conans.client.graph import range_resolver
+
+from .cache_utils import binary_identity, get_probe_cache, package_db_stamp
 import re
 import logging
+if typing.TYPE_CHECKING:
+    from conans.client.output import ScopedOutput
 default_logger = logging.getLogger(__name__)
+
+DEFAULT_VER_OUTPUT_PATTERN = r'.*?([0-9][.0-9a-zA-Z-_]+)'
+DEFAULT_VER_TIMEOUT = 30.0
+
+
+class cmd_version_result_t(NamedTuple):
+    cmd: str
+    path: Optional[str]  # None if the command is not in PATH
+    version: Optional[str]
+    satisfied: bool
+    elapsed: float
+    messages: typing.Tuple[str, ...] = ()
+    error: Optional[str] = None
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_pattern(pattern: str) -> typing.Pattern:
+    return re.compile(pattern)
+
+
+def probe_cmd_version(
+    cmd_name: str,
+    ver_range_expr: Optional[str] = None,
+    ver_opts: typing.Sequence[str] = ('--version',),
+    ver_output_pattern: typing.Union[str, typing.Pattern] = DEFAULT_VER_OUTPUT_PATTERN,
+    timeout: Optional[float] = DEFAULT_VER_TIMEOUT,
+    env: Optional[typing.Mapping[str, str]] = None,
+) -> cmd_version_result_t:
+    ''' find cmd_name in PATH and check its version against ver_range_expr, without logging anything
+    :param ver_range_expr: conan version range, e.g. ">=3.16"; None only checks that the command exists
+    :param timeout: seconds to wait for `cmd_name ver_opts`
+    :param env: environment of the command instead of os.environ, PATH included
+    '''
+    start = time.monotonic()
+    path = tools.which(cmd_name) if env is None else shutil.which(cmd_name, path=env.get('PATH'))
+
+    def _result(version=None, satisfied=False, messages=(), error=None):
+        return cmd_version_result_t(
+            cmd_name, path, version, satisfied, time.monotonic() - start, tuple(messages), error)
+
+    if not path:
+        return _result(error='WARNING: {} is not found'.format(cmd_name))
+    if ver_range_expr is None:
+        return _result(satisfied=True)
+    if isinstance(ver_output_pattern, str):
+        ver_output_pattern = _compile_pattern(ver_output_pattern)
+    cmd = [path, ]
+    cmd.extend(ver_opts)
+    try:
+        output = subprocess.run(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout, check=True, env=env
+        ).stdout.decode(errors='replace')
+    except subprocess.TimeoutExpired:
+        return _result(error='WARNING: command {} timed out after {}s'.format(' '.join(cmd), timeout))
+    except (subprocess.CalledProcessError, OSError) as e:
+        return _result(error='WARNING: command {} failed: {}'.format(' '.join(cmd), e))
+    output = output.strip()
+    if not output:
+        return _result(error='WARNING: no output from command {}'.format(' '.join(cmd)))
+    match = ver_output_pattern.match(output)
+    if not match:
+        return _result(error='WARNING: output from {} is {}, which does not match version pattern `{}`'.format(
+            ' '.join(cmd), output, ver_output_pattern.pattern))
+    from conans.client.graph import range_resolver
+    ver_str = match.group(1)
+    messages = ['{} version = {}'.format(cmd_name, ver_str)]
+    results = []
+    ver_satisfied = bool(range_resolver.satisfying([ver_str, ], ver_range_expr, results))
+    messages.extend(results)
+    if not ver_satisfied:
+        messages.append('{} version does not meet requirement {}'.format(cmd_name, ver_range_expr))
+    return _result(ver_str, ver_satisfied, messages)
+
+
+def log_cmd_version_result(
+    result: cmd_version_result_t,
+    log_output: typing.Union['ScopedOutput', logging.Logger] = default_logger
+):
+    for msg in result.messages:
+        log_output.info(msg)
+    if result.error is not None:
+        log_output.warn(result.error)
+
+
 def check_cmd_version(
     cmd_name: str,
     ver_range_expr: str,
     ver_opts: typing.List[str] = ('--version',),
-    ver_output_pattern: str = r'.*?([0-9][.0-9a-zA-Z-_]+)',
-    log_output: typing.Union[ScopedOutput, logging.Logger] = default_logger
+    ver_output_pattern: str = DEFAULT_VER_OUTPUT_PATTERN,
+    log_output: typing.Union['ScopedOutput', logging.Logger] = default_logger,
+    timeout: Optional[float] = DEFAULT_VER_TIMEOUT,
 ) -> bool:
-    cmd = [
-        cmd_name,
-    ]
-    cmd.extend(ver_opts)
-    output = check_output_runner(cmd)
-    if output:
-        output = output.strip()
-        match = re.match(ver_output_pattern, output)
-        if match:
-            results = []
-            ver_str = match.group(1)
-            log_output.info('{} version = {}'.format(cmd_name, ver_str))
-            ver_satisfied = range_resolver.satisfying([ver_str,], ver_range_expr, results)
-            for result in results:
-                log_output.info(result)
-            if ver_satisfied:
-                return True
-            else:
-                log_output.info('{} version does not meet requirement {}'.format(cmd_name, ver_range_expr))
-        else:
-            msg = 'WARNING: output from {} is {}, which does not match version pattern `{}`'.format(' '.join(cmd), output, ver_output_pattern.pattern)
-            log_output.warn(msg)
+    spec = dict(ver_range_expr=ver_range_expr, ver_opts=list(ver_opts), ver_output_pattern=ver_output_pattern)
+    return check_cmd_versions({cmd_name: spec}, timeout, log_output=log_output)[cmd_name].satisfied
+
+
+def check_cmd_versions(
+    specs: typing.Mapping[str, Optional[typing.Mapping[str, typing.Any]]],
+    timeout: Optional[float] = DEFAULT_VER_TIMEOUT,
+    max_workers: Optional[int] = None,
+    log_output: typing.Union['ScopedOutput', logging.Logger, None] = default_logger,
+    use_cache: bool = True,
+    env: Optional[typing.Mapping[str, str]] = None,
+) -> Dict[str, cmd_version_result_t]:
+    ''' check many commands in parallel, each with its own timeout.
+    :param specs: {cmd: keyword arguments of check_cmd_version (ver_range_expr, ver_opts, ver_output_pattern)},
+        a None spec only checks that the command exists
+    :param log_output: if not None, the result of every command is logged in the order of specs
+    :param use_cache: reuse the results of a previous check on this host while the command binary, PATH and
+        the installed system packages are the same, see cache_utils.ProbeCache
+    :param env: environment of the commands instead of os.environ, e.g. a copy taken by another thread
+    :return: results in the order of specs
+    '''
+    def _probe(cmds: typing.List[str]) -> Dict[str, cmd_version_result_t]:
+        ret: Dict[str, cmd_version_result_t] = {}
+        if cmds:
+            workers = max_workers or min(len(cmds), 2 * (os.cpu_count() or 1), 16)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    _cmd: executor.submit(probe_cmd_version, _cmd, timeout=timeout, env=env, **(specs[_cmd] or {}))
+                    for _cmd in cmds
+                }
+                for _cmd in cmds:
+                    ret[_cmd] = futures[_cmd].result()
+        return ret
+
+    if use_cache and specs:
+        search_path = (os.environ if env is None else env).get('PATH')
+        context = [search_path or '', package_db_stamp(env)]
+        entries = {
+            'cmd:{}:{}'.format(_cmd, json.dumps(_spec, sort_keys=True, default=str)): _cmd
+            for _cmd, _spec in specs.items()
+        }
+        values = get_probe_cache().get_or_probe_many(
+            {_entry: [binary_identity(_cmd, search_path), context] for _entry, _cmd in entries.items()},
+            lambda _missing: dict(zip(_missing, _probe([entries[_e] for _e in _missing]).values())),
+            # a timeout or a crash of the command may not happen next time
+            cacheable=lambda _result: _result.error is None or _result.path is None
+        )
+        ret = {}
+        for _entry, _value in values.items():
+            _result = cmd_version_result_t(*_value)
+            ret[entries[_entry]] = _result._replace(messages=tuple(_result.messages))
     else:
-        log_output.warn('WARNING: no output from command {}'.format(' '.join(cmd)))
-    return False
\ No newline at end of file
+        ret = _probe(list(specs))
+    if log_output is not None:
+        for result in ret.values():
+            log_cmd_version_result(result, log_output)
+    return ret
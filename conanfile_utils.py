@@ -1,20 +1,41 @@
 # -*- coding: UTF-8 -*-
+import atexit
+import hashlib
+import json
 import shutil
+import subprocess
 import typing
+import weakref
 from typing import Dict, Union, NamedTuple, List, Tuple, Iterable
 from conans import tools
 from conans import ConanFile
 import conans
-import yaml
 import os
 import glob
+from concurrent.futures import ThreadPoolExecutor
 
-from .file_utils import replace_regex_in_file
+from .file_utils import replace_regex_in_file, replace_regex_in_file_list, relocate_in_files, \
+    DEFAULT_RELOCATION_GLOBS
 from .pkg_conf_utils import get_all_pkg_names, get_all_names_in_pkgconfig, MyPkgConfig, get_default_pc_path, \
-    get_default_lib_path
+    get_default_lib_path, get_pkg_config_info, get_host_sysroot, is_pkgconf, pkg_config_identity
 from conans.model.version import Version
-from .command_utils import check_cmd_version
+from conans.util.files import load, save
+from .command_utils import check_cmd_version, check_cmd_versions, cmd_version_result_t
+from .pc_file_utils import NativePkgConfig, PcGraph, PcIndex, PcResolver, default_pc_resolver, \
+    find_pc_requirement_files, get_pc_index, get_pc_search_dirs, rewrite_pc_prefix
+from .cache_utils import dir_stamp, get_probe_cache, load_json, package_db_stamp, save_json_atomic
+from .patch_utils import apply_patch_series, patch_stamp_dir
+from .source_cache_utils import file_sha256, get_source_tree_cache, source_tree_key, LINK_MODE_AUTO
+from .git_utils import fetch_commit, get_git_mirror_cache, GIT_FETCH_AUTO, DEFAULT_DEEPEN_STEPS
+from .stage_utils import StageScheduler, stage_result_t
+from .system_package_utils import SystemPackageManager
+from .trace_utils import traced_stage
 import re
+# written next to the .pc files generated by AutoConanFile.copy_pkg_configs
+PKG_CONFIG_MANIFEST_NAME = '.conanutils-pkgconfig.json'
+# written into the package folder by AutoConanFile.cache_package_info_from_pc
+PACKAGE_INFO_CACHE_NAME = '.conanutils-package-info.json'
+_PACKAGE_FOLDER_PLACEHOLDER = '${package_folder}'
 VERSION_REGEX = re.compile(r'([0-9.]+)-(.+)-([a-z0-9]+)')
 
 def parse_version(version: str):
@@ -24,25 +45,157 @@ def parse_version(version: str):
     raise RuntimeError('% does not match version pattern: %s'%version%VERSION_REGEX.pattern)
 
 
+class lib_probe_result_t(NamedTuple):
+    name: str
+    version: typing.Optional[str]  # modversion found by pkg-config, None if the lib is not found
+    in_range: bool
+    error: typing.Optional[str]
+    ver_range: Union[Tuple[()], Tuple[str], Tuple[str, str]] = ()
+
+    @property
+    def ok(self):
+        return self.version is not None and self.in_range
+
+
+def version_in_range(version: Version, ver_range: Union[Tuple[()], Tuple[str], Tuple[str, str]]) -> bool:
+    ''' :param ver_range: (), (min,) or (min, max), both bounds included
+    '''
+    if not ver_range:
+        return True
+    min_ver = Version(ver_range[0])
+    max_ver = Version(ver_range[1]) if len(ver_range) == 2 else None
+    return not (version < min_ver or (max_ver is not None and version > max_ver))
+
+
+def _pkg_config_modversion(libname: str, env: typing.Mapping[str, str]) -> str:
+    executable = pkg_config_identity(env=env)[0] or env.get('PKG_CONFIG', 'pkg-config')
+    command = [executable, '--modversion', libname]
+    try:
+        return subprocess.run(
+            command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True, env=env
+        ).stdout.strip()
+    except (subprocess.CalledProcessError, OSError) as e:
+        raise conans.errors.ConanException('pkg-config command {} failed with error: {}'.format(
+            subprocess.list2cmdline(command), (getattr(e, 'stderr', None) or str(e)).strip()))
+
+
+def probe_libpkg(
+        libname: str,
+        ver_range: Union[Tuple[()], Tuple[str], Tuple[str, str]] = (),
+        index: typing.Optional[PcIndex] = None,
+        env: typing.Optional[typing.Mapping[str, str]] = None
+) -> lib_probe_result_t:
+    ''' :param index: answer from it instead of running pkg-config --modversion
+    :param env: environment of pkg-config instead of os.environ
+    '''
+    try:
+        if index is not None:
+            _modversion = Version(index.modversion(libname))
+        elif env is not None:
+            _modversion = Version(_pkg_config_modversion(libname, env))
+        else:
+            _modversion = Version(tools.PkgConfig(libname)._get_option('modversion')[0])
+    except conans.errors.ConanException as e:
+        return lib_probe_result_t(libname, None, False, '{}'.format(e), tuple(ver_range))
+    in_range = version_in_range(_modversion, ver_range)
+    return lib_probe_result_t(libname, str(_modversion), in_range, None, tuple(ver_range))
+
+
+def log_libpkg_probe(result: lib_probe_result_t, scope_output):
+    if result.error is not None:
+        scope_output.warn(result.error)
+        return
+    scope_output.info('{} {} exists'.format(result.name, result.version))
+    if not result.in_range:
+        scope_output.info('{} version {} is not in {}'.format(result.name, result.version, result.ver_range))
+
+
 def libpkg_exists(
         libname: str, scope_output,
-        ver_range: Union[Tuple[str], Tuple[str, str]] = ()
+        ver_range: Union[Tuple[str], Tuple[str, str]] = (),
+        use_index: bool = False
 ):
-    pkgconf = tools.PkgConfig(libname)
-    try:
-        _modversion = Version(pkgconf._get_option('modversion')[0])
-        pkgconf_vars = pkgconf.variables
-        scope_output.info('{} {} exists'.format(libname, _modversion))
-        if ver_range:
-            min_ver = Version(ver_range[0])
-            max_ver = Version(ver_range[1]) if len(ver_range) == 2 else None
-            if _modversion < min_ver or (max_ver is not None and _modversion > max_ver):
-                scope_output.info('{} version {} is not in {}'.format(libname, _modversion, ver_range))
-                return False
-        return True
-    except conans.errors.ConanException as e:
-        scope_output.warn('{}'.format(e))
-        return False
+    result = libpkg_exists_many([libname], {libname: ver_range}, use_index=use_index)[libname]
+    log_libpkg_probe(result, scope_output)
+    return result.ok
+
+
+def libpkg_probe_context(env: typing.Optional[typing.Mapping[str, str]] = None) -> List:
+    ''' what the result of probe_libpkg depends on besides its arguments: the pkg-config executable,
+    its search path and the content of the search dirs, and the installed system packages
+    :param env: environment to read instead of os.environ
+    '''
+    search_dirs = get_pc_search_dirs(get_default_pc_path, env)
+    return [
+        pkg_config_identity(env=env)[1],
+        get_host_sysroot(env),
+        dir_stamp(search_dirs),
+        package_db_stamp(env),
+    ]
+
+
+def libpkg_exists_many(
+        names: Iterable[str],
+        ranges: typing.Optional[typing.Mapping[str, Union[Tuple[str], Tuple[str, str]]]] = None,
+        scope_output=None,
+        max_workers: typing.Optional[int] = None,
+        use_cache: bool = True,
+        use_index: bool = False,
+        env: typing.Optional[typing.Mapping[str, str]] = None
+) -> Dict[str, lib_probe_result_t]:
+    ''' probe many libs concurrently on a bounded thread pool.
+    :param names: lib (pc) names
+    :param ranges: optional version range per lib name
+    :param scope_output: if given, the result of every lib is logged in the order of names
+    :param use_cache: reuse the results of a previous probe on this host, see cache_utils.ProbeCache
+    :param use_index: look the libs up in the index of the .pc search path (see pc_file_utils.PcIndex)
+        instead of running pkg-config, the probe cache is not needed then
+    :param env: environment of pkg-config instead of os.environ, e.g. a copy taken by another thread
+    :return: results in the order of names
+    '''
+    names = list(dict.fromkeys(names))
+    ranges = {_n: tuple((ranges or {}).get(_n) or ()) for _n in names}
+    if use_index:
+        if env is None:
+            index = get_pc_index()
+        else:
+            index = get_pc_index(get_pc_search_dirs(get_default_pc_path, env), sysroot=get_host_sysroot(env))
+        ret = {_n: probe_libpkg(_n, ranges[_n], index) for _n in names}
+        if scope_output is not None:
+            for result in ret.values():
+                log_libpkg_probe(result, scope_output)
+        return ret
+
+    def _probe(_names: List[str]) -> Dict[str, lib_probe_result_t]:
+        ret: Dict[str, lib_probe_result_t] = {}
+        if _names:
+            workers = max_workers or min(len(_names), 2 * (os.cpu_count() or 1), 16)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {_n: executor.submit(probe_libpkg, _n, ranges[_n], None, env) for _n in _names}
+                for _n in _names:
+                    ret[_n] = futures[_n].result()
+        return ret
+
+    if use_cache and names:
+        context = libpkg_probe_context(env)
+        entries = {'libpkg:{}:{}'.format(_n, ','.join(ranges[_n])): _n for _n in names}
+        values = get_probe_cache().get_or_probe_many(
+            {_entry: context for _entry in entries},
+            lambda _missing: {
+                _entry: _result for _entry, _result in zip(_missing, _probe([entries[_e] for _e in _missing]).values())
+            }
+        )
+        ret = {}
+        for _entry, _value in values.items():
+            _result = lib_probe_result_t(*_value)
+            ret[entries[_entry]] = _result._replace(ver_range=tuple(_result.ver_range))
+    else:
+        ret = _probe(names)
+    if scope_output is not None:
+        for result in ret.values():
+            log_libpkg_probe(result, scope_output)
+    return ret
+
 
 class sys_lib_requirement_t(NamedTuple):
     pkg: str
@@ -64,33 +217,240 @@ def get_required_os_field(conandata: Dict[str, typing.Any], field_name: str):
     return ret, data['fallback']
 
 
+class _LazyDefaultLibPaths(object):
+    ''' resolve the linker search dirs on first access instead of when the class is defined
+    '''
+
+    def __get__(self, instance, owner):
+        return get_default_lib_path()
+
+
+# conan methods of the subclasses recorded as stages by trace_utils
+TRACED_RECIPE_METHODS = (
+    'requirements', 'build_requirements', 'system_requirements', 'configure', 'source', 'imports', 'generate',
+    'build', 'package', 'package_info',
+)
+
+
+# recipes with background stages, flushed at exit by _flush_all_stages
+_stage_owners: 'weakref.WeakSet[AutoConanFile]' = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_all_stages():
+    for recipe in list(_stage_owners):
+        recipe.flush_stages()
+
+
 class AutoConanFile(ConanFile):
     exports_dir_path = os.path.realpath('./')
     os_packages = {}
     _source_subfolder = "source_subfolder"
     _build_subfolder = "build_subfolder"
-    default_lib_paths = get_default_lib_path()
+    default_lib_paths = _LazyDefaultLibPaths()
+    # evaluate .pc files in-process instead of running pkg-config for every query,
+    # it also lets the system requirements be looked up in the .pc index (see pc_file_utils.PcIndex)
+    native_pkg_config = False
+    # how git_source gets target_commit, one of git_utils.GIT_FETCH_STRATEGIES
+    git_fetch_strategy = GIT_FETCH_AUTO
+    # fetch with --filter=blob:none, blobs are only downloaded for the checked out commit
+    git_partial_clone = False
+    git_deepen_steps = DEFAULT_DEEPEN_STEPS
+    # clone from a bare mirror shared by all recipes of the host (see git_utils.GitMirrorCache)
+    # instead of downloading from repo_url every time
+    git_use_mirror = False
+    # let prepare_source reuse the trees produced by git_source + apply_patches (see source_cache_utils)
+    use_source_tree_cache = True
+    source_tree_link_mode = LINK_MODE_AUTO
     #TODO: compatibility management is required when fallback to conan package
     #TODO: compatibility management is required when fallback to meson wrap
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for method in TRACED_RECIPE_METHODS:
+            func = cls.__dict__.get(method)
+            if callable(func) and not hasattr(func, '__wrapped__'):
+                setattr(cls, method, traced_stage(func))
+
+    @traced_stage
     def git_source(self):
+        self.join_stages('prefetch_source', check=False)
         _target_version, self.repo_branch, self.target_commit = parse_version(self.version)
-        git = tools.Git(folder=self._source_subfolder)
-        git.clone(
+        if not os.path.isdir(self._source_subfolder):
+            # the patch stamp lives next to the source folder, it does not go away with it
+            shutil.rmtree(patch_stamp_dir(self._source_subfolder), ignore_errors=True)
+        if self.git_use_mirror:
+            get_git_mirror_cache().clone(
+                self._source_subfolder,
+                self.repo_url,
+                branch=self.repo_branch,
+                commit=self.target_commit,
+                output=self.output
+            )
+            return
+        fetch_commit(
+            self._source_subfolder,
             self.repo_url,
             branch=self.repo_branch,
-            shallow=True,
+            commit=self.target_commit,
+            strategy=self.git_fetch_strategy,
+            partial_clone=self.git_partial_clone,
+            deepen_steps=self.git_deepen_steps,
+            output=self.output
         )
-        current_commit = git.get_commit()
-        if not current_commit.startswith(self.target_commit):
-            # if the wanted commit is not on the top
-            # we have to get full repo
-            git.run('fetch --unshallow')
-            if self.target_commit:
-                git.checkout(self.target_commit)
 
 
+    @traced_stage
+    def prepare_source(self):
+        ''' git_source then apply_patches, or a copy of the tree they produced for the same url, commit and patches
+        '''
+        _target_version, self.repo_branch, self.target_commit = parse_version(self.version)
+        if not self.use_source_tree_cache:
+            self.git_source()
+            self.apply_patches()
+            return
+        cache = get_source_tree_cache()
+        key = source_tree_key(self.repo_url, self.target_commit, self.patch_files())
+        stamp_dir = patch_stamp_dir(self._source_subfolder)
+        if cache.materialize(key, self._source_subfolder, self.source_tree_link_mode, self.output, stamp_dir):
+            self.output.info('reuse cached source tree {} for {}@{}'.format(key, self.repo_url, self.target_commit))
+            return
+        self.git_source()
+        self.apply_patches()
+        try:
+            cache.store(key, self._source_subfolder, stamp_dir, url=self.repo_url, commit=self.target_commit)
+        except OSError as e:
+            self.output.warn('cannot cache source tree {}: {}'.format(key, e))
+
+    def system_package_tool(self) -> tools.SystemPackageTool:
+        ''' created on first use: detecting the package manager spawns processes, which a host where every
+        requirement is already satisfied does not need
+        '''
+        if getattr(self, '_system_package_tool', None) is None:
+            self._system_package_tool = tools.SystemPackageTool(
+                conanfile=self,
+                default_mode='disabled' # export CONAN_SYSREQUIRES_SUDO='enabled' to allow actual installation
+            )
+        return self._system_package_tool
+
+    def system_package_manager(self) -> SystemPackageManager:
+        ''' installs the system packages of system_requirements_from_conan_data and build_requirements_from_conan_data,
+        override it to return a system_package_utils.StubPackageManager in tests
+        '''
+        if getattr(self, '_system_package_manager', None) is None:
+            self._system_package_manager = SystemPackageManager(self.system_package_tool(), output=self.output)
+        return self._system_package_manager
+
+    def stage_scheduler(self) -> StageScheduler:
+        ''' scheduler of the stages this recipe runs in the background, created on first use.
+        self.output becomes its StageOutput: the output of a stage is printed when the stage is joined.
+        '''
+        if getattr(self, '_stage_scheduler', None) is None:
+            self._stage_scheduler = StageScheduler(self.output)
+            self.output = self._stage_scheduler.output
+            self._stage_report_size = 0
+            _stage_owners.add(self)
+        return self._stage_scheduler
+
+    def start_stage(self, name: str, func: typing.Callable, *args, deps: Iterable[str] = (), **kwargs):
+        ''' run func(*args, **kwargs) in the background once the stages deps are done, see stage_utils.StageScheduler
+        '''
+        self.stage_scheduler().add(name, func, *args, deps=deps, **kwargs)
+
+    def flush_stages(self):
+        ''' join the stages that are not joined yet, e.g. prefetch_source when source() did not run,
+        print their output and stop the workers. Called when conan exits for the recipes still alive.
+        '''
+        scheduler = getattr(self, '_stage_scheduler', None)
+        if scheduler is None:
+            return
+        self.join_stages(check=False)
+        scheduler.shutdown()
+
+    def join_stages(self, *names: str, check: bool = True) -> Dict[str, stage_result_t]:
+        ''' wait for the stages names (all of them if empty) and print their output, the stages that were never
+        started are ignored. Once every stage is joined, the durations and the critical path are printed.
+        :param check: raise the error of a failed stage, otherwise only warn about it
+        '''
+        scheduler = getattr(self, '_stage_scheduler', None)
+        if scheduler is None:
+            return {}
+        started = [_n for _n in names if _n in scheduler]
+        if names and not started:
+            return {}
+        try:
+            results = scheduler.join(started or None)
+        except Exception as e:
+            if check:
+                raise
+            self.output.warn('stage failed, continue without it: {}'.format(e))
+            results = {}
+        if scheduler.all_joined() and len(scheduler.results) != self._stage_report_size:
+            self._stage_report_size = len(scheduler.results)
+            for line in scheduler.report():
+                self.output.info(line)
+            # nothing left to run, a later start_stage starts new workers
+            scheduler.shutdown()
+        return results
+
+    @traced_stage
+    def prefetch_source(self, env: typing.Optional[Dict[str, str]] = None) -> typing.Optional[str]:
+        ''' fetch target_commit into the git mirror of repo_url (see git_use_mirror), so that git_source only clones
+        locally
+        :param env: environment of git instead of os.environ
+        :return: path of the mirror, None without git_use_mirror
+        '''
+        if not self.git_use_mirror:
+            return None
+        _target_version, repo_branch, target_commit = parse_version(self.version)
+        return get_git_mirror_cache().update(self.repo_url, target_commit, output=self.output, env=env)
+
+    def probe_system_requirements(self, exclude=(), env: typing.Optional[Dict[str, str]] = None) \
+            -> Dict[str, lib_probe_result_t]:
+        ''' look the libs of system_requirements_from_conan_data up without installing anything, the results are
+        cached (see libpkg_exists_many) for system_requirements_from_conan_data
+        :param env: environment of pkg-config instead of os.environ
+        '''
+        packages, _fallbacks = get_required_os_field(self.conan_data, 'system-packages')
+        ranges = {_name: _info.get('version') for _name, _info in packages.items() if _name not in exclude}
+        return libpkg_exists_many(ranges.keys(), ranges, use_index=self.native_pkg_config, env=env)
+
+    def probe_build_requirements(self, exclude=(), env: typing.Optional[Dict[str, str]] = None) \
+            -> Dict[str, cmd_version_result_t]:
+        ''' check the commands of build_requirements_from_conan_data without installing anything, the results are
+        cached (see check_cmd_versions) for build_requirements_from_conan_data
+        :param env: environment of the commands instead of os.environ
+        '''
+        required_cmds, _fallbacks = get_required_os_field(self.conan_data, 'required-commands')
+        required_cmd_vers = self.conan_data['required-command-versions']
+        specs = {_cmd: required_cmd_vers.get(_cmd) for _cmd in required_cmds if _cmd not in exclude}
+        return check_cmd_versions(specs, log_output=None, env=env)
+
+    def start_pipeline(self, exclude_libs=(), exclude_cmds=()):
+        ''' start in the background the process bound work of the later conan methods: probe_system_requirements and
+        probe_build_requirements. Call it early, e.g. in requirements(); system_requirements_from_conan_data and
+        build_requirements_from_conan_data join their stage before doing the work for real.
+        The stages get a copy of os.environ taken now, so that the environment_append of the main thread does not
+        change what they see while they run.
+        '''
+        conan_data = self.conan_data or {}
+        env = dict(os.environ)
+        if 'system-packages' in conan_data:
+            self.start_stage('probe_system_requirements', self.probe_system_requirements, exclude_libs, env)
+        if 'required-commands' in conan_data:
+            self.start_stage('probe_build_requirements', self.probe_build_requirements, exclude_cmds, env)
+
+    def start_source_prefetch(self):
+        ''' start prefetch_source in the background, git_source joins it. Conan only calls build_requirements()
+        when the package is built from sources, call it from there so that nothing is fetched for a package
+        whose binary is installed; build_requirements_from_conan_data does.
+        '''
+        if self.git_use_mirror and 'prefetch_source' not in self.stage_scheduler():
+            self.start_stage('prefetch_source', self.prefetch_source, dict(os.environ))
+
+    @traced_stage
     def system_requirements_from_conan_data(self, exclude=()):
+        self.join_stages('probe_system_requirements', check=False)
         packages: Dict[str, Dict] = {}
         packages, fallbacks = get_required_os_field(self.conan_data, 'system-packages')
         self.output.info('system_requirements_from_conan_data: exclude={}'.format(exclude))
@@ -101,38 +461,50 @@ class AutoConanFile(ConanFile):
                 fallbacks.pop(_i)
         self.output.info('packages={}'.format(packages))
         if packages:
-            installer = tools.SystemPackageTool(
-                conanfile=self,
-                default_mode='disabled' # export CONAN_SYSREQUIRES_SUDO='enabled' to allow actual installation
-            )
             self.output.info('system_requirements_from_conan_data: packages={}'.format(packages))
-            for libname, libinfo in packages.items():
-                libreq = sys_lib_requirement_t(**libinfo)
+            libreqs = {_name: sys_lib_requirement_t(**_info) for _name, _info in packages.items()}
+            for libname, libreq in libreqs.items():
                 self.output.info('system_requirements_from_conan_data: check libname={}, pkgname={}, version={}'.format(libname, libreq.pkg, libreq.version))
-                if not libpkg_exists(libname, self.output, libreq.version):
-                    if libreq.pkg:
-                        self.output.info(
-                            'system_requirements_from_conan_data: try to isntall {} for {}'.format(libreq.pkg, libname))
-                        installer.install(libreq.pkg, update=False)
-                        if installer.installed(libreq.pkg):
-                            self.output.success('installed {}'.format(libreq.pkg))
-                        else:
-                            self.output.info('fail to install {}'.format(libreq.pkg))
-
-                        if libpkg_exists(libname, self.output, libreq.version):
-                            continue
-                        else:
-                            self.output.warn('{} insalled, but version does not match {}.'.format(libreq.pkg, libreq.version))
-                    if libname in fallbacks:
-                        conan_pkg = fallbacks[libname]
-                        if conan_pkg:
-                            self.output.warn('cannot find/install system lib {}, requires conan package {}.'.format(libname, conan_pkg))
-                            self.requires(conan_pkg)
-                            continue
-                    self.output.error('{} does not exist in system nor in conan.'.format(libname))
+            ranges = {_name: _req.version for _name, _req in libreqs.items()}
+            probes = libpkg_exists_many(libreqs.keys(), ranges, self.output, use_index=self.native_pkg_config)
+            missing = [_name for _name, _probe in probes.items() if not _probe.ok]
+            # one query and one transaction for all the missing libs
+            to_install = {_name: libreqs[_name].pkg.split() for _name in missing if libreqs[_name].pkg}
+            for libname in to_install:
+                self.output.info(
+                    'system_requirements_from_conan_data: try to isntall {} for {}'.format(libreqs[libname].pkg, libname))
+            states = {}
+            if to_install:
+                states = self.system_package_manager().install(
+                    [_pkg for _pkgs in to_install.values() for _pkg in _pkgs], update=False)
+            installed = []
+            for libname, pkgs in to_install.items():
+                if all(states[_pkg] for _pkg in pkgs):
+                    self.output.success('installed {}'.format(libreqs[libname].pkg))
+                else:
+                    self.output.info('fail to install {}'.format(libreqs[libname].pkg))
+                installed.append(libname)
+            if installed:
+                probes.update(libpkg_exists_many(installed, ranges, self.output, use_index=self.native_pkg_config))
+            for libname in missing:
+                libreq = libreqs[libname]
+                if probes[libname].ok:
+                    continue
+                if libname in installed:
+                    self.output.warn('{} insalled, but version does not match {}.'.format(libreq.pkg, libreq.version))
+                if libname in fallbacks:
+                    conan_pkg = fallbacks[libname]
+                    if conan_pkg:
+                        self.output.warn('cannot find/install system lib {}, requires conan package {}.'.format(libname, conan_pkg))
+                        self.requires(conan_pkg)
+                        continue
+                self.output.error('{} does not exist in system nor in conan.'.format(libname))
 
 
+    @traced_stage
     def build_requirements_from_conan_data(self, exclude=()):
+        self.start_source_prefetch()
+        self.join_stages('probe_build_requirements', check=False)
         required_cmds, fallbacks = get_required_os_field(self.conan_data, 'required-commands')
         required_cmd_vers = self.conan_data['required-command-versions']
         for _i in exclude:
@@ -141,25 +513,31 @@ class AutoConanFile(ConanFile):
             if _i in fallbacks:
                 required_cmds.pop(_i)
         if required_cmds:
-            installer = tools.SystemPackageTool(
-                conanfile=self,
-                default_mode='disabled'  # export CONAN_SYSREQUIRES_SUDO='enabled' to allow actual installation
-            )
+            specs = {_cmd: required_cmd_vers.get(_cmd) for _cmd in required_cmds}
+            for cmd, spec in specs.items():
+                if spec:
+                    self.output.info('{}: {}'.format(cmd, spec))
+            results = check_cmd_versions(specs, log_output=self.output)
+            unsatisfied = []
             for cmd in required_cmds:
-                if tools.which(cmd):
-                    if cmd in required_cmd_vers:
-                        self.output.info(required_cmd_vers[cmd])
-                        if check_cmd_version(cmd, log_output=self.output, **required_cmd_vers[cmd]):
-                            self.output.info('{} version matched'.format(cmd))
-                            continue
+                result = results[cmd]
+                if result.satisfied:
+                    if specs[cmd]:
+                        self.output.info('{} version matched'.format(cmd))
                     else:
                         self.output.info('has {} (any version is ok).'.format(cmd))
-                        continue
-                sys_pkg = required_cmds[cmd]
-                if sys_pkg:
-                    self.output.warn('install {} for cmd ``{}'.format(sys_pkg, cmd))
-                    installer.install(sys_pkg)
-                if not sys_pkg or not installer.installed(sys_pkg):
+                    continue
+                unsatisfied.append(cmd)
+            # one query and one transaction for all the missing commands
+            to_install = {_cmd: required_cmds[_cmd].split() for _cmd in unsatisfied if required_cmds[_cmd]}
+            for cmd in to_install:
+                self.output.warn('install {} for cmd ``{}'.format(required_cmds[cmd], cmd))
+            states = {}
+            if to_install:
+                states = self.system_package_manager().install(
+                    [_pkg for _pkgs in to_install.values() for _pkg in _pkgs])
+            for cmd in unsatisfied:
+                if cmd not in to_install or not all(states[_pkg] for _pkg in to_install[cmd]):
                     if cmd in fallbacks:
                         self.output.warn('requires {} for cmd `{}`.'.format(fallbacks[cmd], cmd))
                         self.build_requires(fallbacks[cmd])
@@ -167,78 +545,74 @@ class AutoConanFile(ConanFile):
                         self.output.error('cannot install/find {}'.format(cmd))
 
 
-    def apply_patches(self):
-        for filename in sorted(glob.glob("patches/*.diff")):
-            self.output.info('applying patch "%s"' % filename)
-            tools.patch(base_path=self._source_subfolder, patch_file=filename)
+    def patch_files(self) -> List[str]:
+        return sorted(glob.glob("patches/*.diff"))
+
+    @traced_stage
+    def apply_patches(self, dry_run=False) -> List[str]:
+        ''' apply patch_files on the source folder, the patches applied by a previous call are kept if unchanged,
+        see patch_utils.apply_patch_series
+        :param dry_run: only check that the patches apply
+        :return: names of the newly applied patches
+        '''
+        return apply_patch_series(self._source_subfolder, self.patch_files(), dry_run=dry_run, output=self.output)
 
 
     def copy_pkg_config(self, name):
-        root = self.deps_cpp_info[name].rootpath
-        self.output.info('prefix in pc file will be replaced with %s'%root)
-        pc_dir = os.path.join(root, 'lib', 'pkgconfig')
-        pc_files = glob.glob('%s/*.pc' % pc_dir)
-        if not pc_files:  # zlib store .pc in root
-            pc_files = glob.glob('%s/*.pc' % root)
-        for pc_name in pc_files:
-            new_pc = os.path.basename(pc_name)
-            self.output.warn('copy and modify .pc file %s' %pc_name)
-            shutil.copy(pc_name, new_pc)
-            prefix = root
-            tools.replace_prefix_in_pc_file(new_pc, prefix)
-
-
-    def collect_components_info_from_pc(self, pkgconf_dir):
-        ''' Find all pc files and convert them to cpp_info.components. It uses PKG_CONFIG_$PACKAGE_$VARIABLE to define the prefix variable
-        :param pkgconf_dir:
-        :return:
+        self.copy_pkg_configs([name])
+
+    @traced_stage
+    def copy_pkg_configs(self, names: Iterable[str] = None, output_folder: str = '.') -> Dict[str, Dict]:
+        ''' copy the .pc files of the dependencies to output_folder with their prefix set to the dependency rootpath.
+        Each .pc is read once and only written if its content changes, a dependency is skipped altogether
+        when its rootpath and the mtimes of its .pc files are the same as in the previous call.
+        :param names: dependencies to process, all of deps_cpp_info if None
+        :return: manifest {dependency: {'rootpath': ..., 'sources': {pc file: mtime}, 'outputs': [generated files]}}
         '''
-        pkg_names = get_all_names_in_pkgconfig(pkgconf_dir)
-        env_vars = self.create_pkgconfig_prefix_env(pkg_names)
-        pkgconf_path = tools.get_env('PKG_CONFIG_PATH')
-        if pkgconf_path:
-            pkgconf_path = pkgconf_dir + ':' + pkgconf_path
-        else:
-            pkgconf_path = pkgconf_dir
-        print('PKG_CONFIG_PATH=%s'%pkgconf_path)
-        env_vars.update({'PKG_CONFIG_PATH': pkgconf_path})
-        with tools.environment_append(env_vars):
-            for pkg_name in pkg_names:
-                _cflags, _includedirs, _libdirs, _libs, _syslibs = self.get_cpp_info_fields_from_pkg(pkg_name)
-                self.cpp_info.components[pkg_name].names["cmake_find_package"] = pkg_name
-                self.cpp_info.components[pkg_name].libdirs = _libdirs
-                self.cpp_info.components[pkg_name].libs = _libs
-                self.cpp_info.components[pkg_name].cflags = _cflags
-                # TODO: split cflags to defines and pure cflags
-                self.cpp_info.components[pkg_name].includedirs = _includedirs
-                self.cpp_info.components[pkg_name].system_libs = _syslibs
-                # self.cpp_info.components[pkg_name].requires = pkg.requires
-                # the design of cpp_info_components
-                # prevent any dependency outside conan
-                # package from working.
-                # It has to be a lib created in this package
-                # or a lib in another conan pkg which need
-                # to use conan_pkgname::lib to identify.
-                # this is very clumsy when same libs can be
-                # either from a system package or from current
-                # build or from an another conan package
-                # we should improve the components in conan
-                # currently we can just ignore it, since there is
-                # no components concept in generator at all.
-                self.output.info("{} LIBRARIES: {}, requires: {}".format( pkg_name, self.cpp_info.components[pkg_name].libs, self.cpp_info.components[pkg_name].requires))
-        # the component info is not really used in generators
-        # so the best way is to use cmake side find_package on deployed pc file or cmake_paths's CMAKE_MODULE_PATH as XX_ROOT
+        if names is None:
+            names = self.deps_cpp_info.deps
+        manifest_path = os.path.join(output_folder, PKG_CONFIG_MANIFEST_NAME)
+        manifest = load_json(manifest_path, {})
+        ret = {}
+        for name in names:
+            root = self.deps_cpp_info[name].rootpath
+            pc_dir = os.path.join(root, 'lib', 'pkgconfig')
+            pc_files = glob.glob('%s/*.pc' % pc_dir)
+            if not pc_files:  # zlib store .pc in root
+                pc_files = glob.glob('%s/*.pc' % root)
+            sources = {_pc: os.stat(_pc).st_mtime_ns for _pc in sorted(pc_files)}
+            previous = manifest.get(name)
+            if previous and previous['rootpath'] == root and previous['sources'] == sources and all(
+                    os.path.exists(os.path.join(output_folder, _out)) for _out in previous['outputs']):
+                self.output.info('.pc files of {} are up to date'.format(name))
+                ret[name] = previous
+                continue
+            self.output.info('prefix in pc file will be replaced with %s'%root)
+            outputs = []
+            for pc_name in sources:
+                new_pc = os.path.basename(pc_name)
+                self.output.warn('copy and modify .pc file %s' %pc_name)
+                save(
+                    os.path.join(output_folder, new_pc),
+                    rewrite_pc_prefix(load(pc_name), root),
+                    only_if_modified=True
+                )
+                outputs.append(new_pc)
+            if previous:
+                generated_by_others = {
+                    _out for _name, _entry in manifest.items() if _name != name for _out in _entry['outputs']
+                }
+                for stale in set(previous['outputs']) - set(outputs) - generated_by_others:
+                    stale_path = os.path.join(output_folder, stale)
+                    if os.path.exists(stale_path):
+                        os.unlink(stale_path)
+            manifest[name] = ret[name] = {'rootpath': root, 'sources': sources, 'outputs': outputs}
+        save_json_atomic(manifest_path, manifest)
+        return ret
 
 
-    def collect_libs_info_from_pc(self, pkgconf_dir:str, aux_pkgconf_dirs: Tuple[str]):
-        ''' Find all pc files and convert them to cpp_info.components. It uses PKG_CONFIG_$PACKAGE_$VARIABLE to define the prefix variable
-        :param pkgconf_dir:
-        :return:
-        '''
-        print(pkgconf_dir)
-        pkg_names = get_all_names_in_pkgconfig(pkgconf_dir)
+    def _pkgconfig_env(self, pkgconf_dir: str, aux_pkgconf_dirs: Tuple[str], pkg_names: List[str]) -> Dict[str, str]:
         env_vars = self.create_pkgconfig_prefix_env(pkg_names)
-
         pkgconf_paths = []
         pkgconf_paths.append(pkgconf_dir)
         pkgconf_paths.extend(aux_pkgconf_dirs)
@@ -248,6 +622,152 @@ class AutoConanFile(ConanFile):
         pkgconf_path = ':'.join(pkgconf_paths)
         print('PKG_CONFIG_PATH=%s'%pkgconf_path)
         env_vars.update({'PKG_CONFIG_PATH': pkgconf_path})
+        return env_vars
+
+    def package_info_cache_key(self, kind: str, pkgconf_dir: str, aux_pkgconf_dirs: Tuple[str] = ()) -> str:
+        ''' hash of everything the cpp_info fields extracted from the pc files of pkgconf_dir depend on:
+        the content of these pc files and of the pc files they require, the pkg-config flavour,
+        native_pkg_config and default_lib_paths
+        :param kind: 'libs' or 'components'
+        '''
+        pkg_names = get_all_names_in_pkgconfig(pkgconf_dir)
+        with tools.environment_append({'PKG_CONFIG_PATH': os.pathsep.join(
+                [pkgconf_dir] + list(aux_pkgconf_dirs) + [tools.get_env('PKG_CONFIG_PATH') or ''])}):
+            search_dirs = get_pc_search_dirs(get_default_pc_path)
+        pc_files = find_pc_requirement_files(pkg_names, search_dirs)
+        info = get_pkg_config_info()
+        key = {
+            'kind': kind,
+            'pc_files': {_name: _path and file_sha256(_path) for _name, _path in sorted(pc_files.items())},
+            'is_pkgconf': info.is_pkgconf,
+            'pkg_config_version': info.version,
+            'native_pkg_config': bool(self.native_pkg_config),
+            'default_lib_paths': sorted(self.default_lib_paths),
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+    def _package_info_cache_entry(self, kind: str, pkgconf_dir: str) -> typing.Optional[str]:
+        rel_dir = os.path.relpath(os.path.realpath(pkgconf_dir), os.path.realpath(self.package_folder))
+        if rel_dir.startswith(os.pardir):
+            return None
+        return '{}:{}'.format(kind, rel_dir.replace(os.sep, '/'))
+
+    def _relocate_package_info(self, fields, old: str, new: str):
+        if isinstance(fields, str):
+            return fields.replace(old, new)
+        if isinstance(fields, list):
+            return [self._relocate_package_info(_i, old, new) for _i in fields]
+        return {_k: self._relocate_package_info(_v, old, new) for _k, _v in fields.items()}
+
+    def load_package_info_cache(self, kind: str, pkgconf_dir: str, aux_pkgconf_dirs: Tuple[str] = ()):
+        ''' the fields stored by cache_package_info_from_pc, None if there are none for pkgconf_dir
+        or if their key does not match any more
+        '''
+        entry_name = self._package_info_cache_entry(kind, pkgconf_dir)
+        if entry_name is None:
+            return None
+        entry = load_json(os.path.join(self.package_folder, PACKAGE_INFO_CACHE_NAME), {}).get(entry_name)
+        if entry is None:
+            return None
+        if entry['key'] != self.package_info_cache_key(kind, pkgconf_dir, aux_pkgconf_dirs):
+            self.output.info('cached {} info of {} is outdated'.format(kind, pkgconf_dir))
+            return None
+        return self._relocate_package_info(entry['fields'], _PACKAGE_FOLDER_PLACEHOLDER, self.package_folder)
+
+    def cache_package_info_from_pc(self, pkgconf_dir: str, aux_pkgconf_dirs: Tuple[str] = (), components=False):
+        ''' call from package(): extract the cpp_info fields from the pc files of pkgconf_dir now and store them
+        in the package folder, so that collect_libs_info_from_pc / collect_components_info_from_pc in package_info()
+        only load them
+        :param components: cache for collect_components_info_from_pc instead of collect_libs_info_from_pc
+        '''
+        kind = 'components' if components else 'libs'
+        entry_name = self._package_info_cache_entry(kind, pkgconf_dir)
+        if entry_name is None:
+            raise conans.errors.ConanException('{} is not in the package folder {}'.format(
+                pkgconf_dir, self.package_folder))
+        if components:
+            fields = self._extract_components_info_from_pc(pkgconf_dir, aux_pkgconf_dirs)
+        else:
+            fields = self._extract_libs_info_from_pc(pkgconf_dir, aux_pkgconf_dirs)
+        cache_path = os.path.join(self.package_folder, PACKAGE_INFO_CACHE_NAME)
+        cache = load_json(cache_path, {})
+        cache[entry_name] = {
+            'key': self.package_info_cache_key(kind, pkgconf_dir, aux_pkgconf_dirs),
+            'fields': self._relocate_package_info(fields, self.package_folder, _PACKAGE_FOLDER_PLACEHOLDER),
+        }
+        save_json_atomic(cache_path, cache)
+        return fields
+
+    def _extract_components_info_from_pc(self, pkgconf_dir, aux_pkgconf_dirs: Tuple[str] = ()) -> Dict[str, Dict]:
+        pkg_names = get_all_names_in_pkgconfig(pkgconf_dir)
+        env_vars = self._pkgconfig_env(pkgconf_dir, aux_pkgconf_dirs, pkg_names)
+        graph = PcGraph([pkgconf_dir])
+        for _dependent, _requirement in sorted(graph.cycles()):
+            self.output.warn('cyclic Requires between {} and {}, {} does not require the component {}'.format(
+                _dependent, _requirement, _dependent, _requirement))
+        internal_requires = graph.internal_requires(pkg_names)
+        # requirements first, so that the components are declared in dependency order
+        pkg_names = [_name for _name in graph.order() if _name in internal_requires]
+        components = {}
+        with tools.environment_append(env_vars):
+            # every component keeps the flags of all its requirements, Requires.private included,
+            # exactly like the pkg-config executable gives them
+            resolver = self.create_pc_resolver()
+            for pkg_name in pkg_names:
+                _cflags, _includedirs, _libdirs, _libs, _syslibs = self.get_cpp_info_fields_from_pkg(pkg_name, resolver)
+                conans.tools.logger.debug('{} transitive requires: {}'.format(pkg_name, graph.closure(pkg_name)))
+                components[pkg_name] = {
+                    'libdirs': _libdirs,
+                    'libs': _libs,
+                    'cflags': _cflags,
+                    # TODO: split cflags to defines and pure cflags
+                    'includedirs': _includedirs,
+                    'system_libs': _syslibs,
+                    'requires': internal_requires[pkg_name],
+                }
+        return components
+
+    @traced_stage
+    def collect_components_info_from_pc(self, pkgconf_dir, aux_pkgconf_dirs: Tuple[str] = ()):
+        ''' Find all pc files and convert them to cpp_info.components. It uses PKG_CONFIG_$PACKAGE_$VARIABLE to define the prefix variable.
+        The Requires between the pc files of pkgconf_dir become the requires of the components. A component still gets
+        the flags of all the packages it requires, with or without native_pkg_config.
+        The result stored by cache_package_info_from_pc is used if it is still valid.
+        :param pkgconf_dir:
+        :param aux_pkgconf_dirs: other folders where the required pc files can be found
+        :return:
+        '''
+        components = self.load_package_info_cache('components', pkgconf_dir, aux_pkgconf_dirs)
+        if components is None:
+            components = self._extract_components_info_from_pc(pkgconf_dir, aux_pkgconf_dirs)
+        for pkg_name, fields in components.items():
+            self.cpp_info.components[pkg_name].names["cmake_find_package"] = pkg_name
+            self.cpp_info.components[pkg_name].libdirs = fields['libdirs']
+            self.cpp_info.components[pkg_name].libs = fields['libs']
+            self.cpp_info.components[pkg_name].cflags = fields['cflags']
+            self.cpp_info.components[pkg_name].includedirs = fields['includedirs']
+            self.cpp_info.components[pkg_name].system_libs = fields['system_libs']
+            # only the components of this package: the design of cpp_info_components
+            # prevent any dependency outside conan
+            # package from working.
+            # It has to be a lib created in this package
+            # or a lib in another conan pkg which need
+            # to use conan_pkgname::lib to identify.
+            # this is very clumsy when same libs can be
+            # either from a system package or from current
+            # build or from an another conan package
+            # we should improve the components in conan
+            # the flags of the other requirements are kept in the component itself.
+            self.cpp_info.components[pkg_name].requires = fields['requires']
+            self.output.info("{} LIBRARIES: {}, requires: {}".format( pkg_name, self.cpp_info.components[pkg_name].libs, self.cpp_info.components[pkg_name].requires))
+        # the component info is not really used in generators
+        # so the best way is to use cmake side find_package on deployed pc file or cmake_paths's CMAKE_MODULE_PATH as XX_ROOT
+
+
+    def _extract_libs_info_from_pc(self, pkgconf_dir: str, aux_pkgconf_dirs: Tuple[str]) -> Dict[str, List[str]]:
+        print(pkgconf_dir)
+        pkg_names = get_all_names_in_pkgconfig(pkgconf_dir)
+        env_vars = self._pkgconfig_env(pkgconf_dir, aux_pkgconf_dirs, pkg_names)
 
         libdirs = set()
         libs = set()
@@ -255,31 +775,75 @@ class AutoConanFile(ConanFile):
         cflags = set()
         includedirs = set()
         with tools.environment_append(env_vars):
+            resolver = self.create_pc_resolver()
             for pkg_name in pkg_names:
-                _cflags, _includedirs, _libdirs, _libs, _syslibs = self.get_cpp_info_fields_from_pkg(pkg_name)
+                _cflags, _includedirs, _libdirs, _libs, _syslibs = self.get_cpp_info_fields_from_pkg(pkg_name, resolver)
                 libdirs.update(_libdirs)
                 libs.update(_libs)
                 syslibs.update(_syslibs)
                 cflags.update(_cflags)
                 includedirs.update(_includedirs)
-
-        self.output.info('includedirs={}'.format(includedirs))
-        self.output.info('libdirs={}'.format(libdirs))
-        self.output.info('libs={}'.format(libs))
-        self.output.info('system_libs={}'.format(syslibs))
-        self.cpp_info.libdirs = list(libdirs)
-        self.cpp_info.libs = list(libs)
-        self.cpp_info.system_libs = list(syslibs)
-        self.cpp_info.cflags= list(cflags)
-        self.cpp_info.includedirs = list(includedirs)
+        return {
+            'libdirs': sorted(libdirs),
+            'libs': sorted(libs),
+            'system_libs': sorted(syslibs),
+            'cflags': sorted(cflags),
+            'includedirs': sorted(includedirs),
+        }
+
+    @traced_stage
+    def collect_libs_info_from_pc(self, pkgconf_dir:str, aux_pkgconf_dirs: Tuple[str]):
+        ''' Find all pc files and convert them to cpp_info.components. It uses PKG_CONFIG_$PACKAGE_$VARIABLE to define the prefix variable.
+        The result stored by cache_package_info_from_pc is used if it is still valid.
+        :param pkgconf_dir:
+        :return:
+        '''
+        fields = self.load_package_info_cache('libs', pkgconf_dir, aux_pkgconf_dirs)
+        if fields is None:
+            fields = self._extract_libs_info_from_pc(pkgconf_dir, aux_pkgconf_dirs)
+
+        self.output.info('includedirs={}'.format(fields['includedirs']))
+        self.output.info('libdirs={}'.format(fields['libdirs']))
+        self.output.info('libs={}'.format(fields['libs']))
+        self.output.info('system_libs={}'.format(fields['system_libs']))
+        self.cpp_info.libdirs = list(fields['libdirs'])
+        self.cpp_info.libs = list(fields['libs'])
+        self.cpp_info.system_libs = list(fields['system_libs'])
+        self.cpp_info.cflags= list(fields['cflags'])
+        self.cpp_info.includedirs = list(fields['includedirs'])
         # self.output.info("INCLUDES: {}; LIBRARIES: {} {}; DEFINES={}".format(self.cpp_info.includedirs, self.cpp_info.libdirs, self.cpp_info.libs, self.cpp_info.cflags))
         # the orc-0.4 has bug, the libdir and include dir does not composite with $prefix
         # need to fix with pkgconfig module
         # https://gitlab.freedesktop.org/gstreamer/orc/-/blob/master/meson.build
 
 
-    def get_cpp_info_fields_from_pkg(self, pkg_name):
-        pkg = tools.PkgConfig(pkg_name)
+    def create_pc_resolver(self, provided: Iterable[str] = ()) -> typing.Optional[PcResolver]:
+        ''' resolver shared by the get_pkg_config calls of one collect_*_info_from_pc, None without native_pkg_config
+        :param provided: see PcResolver
+        '''
+        if not self.native_pkg_config:
+            return None
+        return default_pc_resolver(provided=provided)
+
+    def get_pkg_config(self, pkg_name, resolver: PcResolver = None):
+        ''' PkgConfig-like object for pkg_name: the in-process NativePkgConfig if it can evaluate the package,
+        otherwise tools.PkgConfig which runs the pkg-config executable
+        :param resolver: evaluate pkg_name with this resolver instead of a new one, to share its cache
+        '''
+        if self.native_pkg_config:
+            pkg = NativePkgConfig(pkg_name, resolver=resolver)
+            try:
+                pkg.libs
+                pkg.cflags
+                pkg.variables
+                return pkg
+            except conans.errors.ConanException as e:
+                self.output.warn('fall back to pkg-config executable for {}: {}'.format(pkg_name, e))
+        return tools.PkgConfig(pkg_name)
+
+
+    def get_cpp_info_fields_from_pkg(self, pkg_name, resolver: PcResolver = None):
+        pkg = self.get_pkg_config(pkg_name, resolver)
         libdirs = []
         syslibs = []
         libs = []
@@ -314,7 +878,7 @@ class AutoConanFile(ConanFile):
         cflags = pkg.cflags_only_other
         # TODO: split cflags to defines and pure cflags
         includedirs = [_i[2:] for _i in pkg.cflags_only_I]
-        if MyPkgConfig(None).is_pkgconf():
+        if is_pkgconf():
             _prefix = re.compile(pkg.variables['prefix'])
             conans.tools.logger.debug(
                 'replace prefix (`{}`) with current package folder.'.format(_prefix.pattern))
@@ -327,7 +891,7 @@ class AutoConanFile(ConanFile):
 
     def create_pkgconfig_prefix_env(self, pkg_names):
         prefix_vars = dict()
-        if MyPkgConfig(None).is_pkgconf():
+        if is_pkgconf():
             self.output.warn('pkg-config is provided by pkgconf. It does not support PKG_CONFIG_$PKGNAME_$VARIABLE')
         for pkg_name in pkg_names:
             pkg_var_name = re.sub('[^a-zA-Z0-9]', '_', pkg_name)
@@ -352,19 +916,44 @@ def replace_path_in_files(pattern: str, *args, **kwargs):
         tools.replace_path_in_file(file_path, *args, **kwargs)
 
 
-def replace_regex_in_files(pattern: str, *args, **kwargs):
-    for file_path in glob.glob(pattern, recursive=True):
-        print(file_path)
-        replace_regex_in_file(file_path, *args, **kwargs)
+def replace_regex_in_files(pattern: str, *args, **kwargs) -> Dict[str, int]:
+    ''' replace_regex_in_file on every file matching the glob pattern, see replace_regex_in_file_list
+    :return: {file_path: number of matches}
+    '''
+    report = replace_regex_in_file_list(
+        (_path for _path in glob.glob(pattern, recursive=True) if os.path.isfile(_path)), *args, **kwargs
+    )
+    for file_path, count in report.items():
+        if count:
+            print('{}: {} replacement(s)'.format(file_path, count))
+    return report
 
 
-def replace_path_in_pkgconfig(pc_file_root_dir, dependency_package_dir):
+def package_relocation_pattern(dependency_package_dir: str) -> str:
+    ''' regex matching the package folder of the same name/version/user/channel in any other conan cache
+    '''
     dep_path_comps = dependency_package_dir.split(os.path.sep)
-    pkg_name_version_channel = os.path.join(*dep_path_comps[-6:-2])
-    print(pkg_name_version_channel)
-    replace_regex_in_files(
-        os.path.join(pc_file_root_dir, '**', '*.pc'),
-        search=os.path.join('/.*', pkg_name_version_channel, 'package', '[0-9a-z]+'),
-        replace=dependency_package_dir,
-        strict=False
-    )
\ No newline at end of file
+    pkg_name_version_channel = '/'.join(dep_path_comps[-6:-2])
+    return '/[^\\s\'"=:;]*?/{}/package/[0-9a-z]+'.format(re.escape(pkg_name_version_channel))
+
+
+def relocate_package_paths(
+        root_dir: str, dependency_package_dirs: Iterable[str],
+        file_globs: typing.Sequence[str] = DEFAULT_RELOCATION_GLOBS
+) -> Dict[str, int]:
+    ''' point the files under root_dir to dependency_package_dirs, in one pass whatever the number of dependencies
+    :param file_globs: names of the files to relocate
+    :return: {file_path: number of replacements}
+    '''
+    relocations = {
+        package_relocation_pattern(_dep_dir): _dep_dir for _dep_dir in dependency_package_dirs
+    }
+    report = relocate_in_files(root_dir, relocations, file_globs)
+    for file_path, count in report.items():
+        if count:
+            print('{}: {} replacement(s)'.format(file_path, count))
+    return report
+
+
+def replace_path_in_pkgconfig(pc_file_root_dir, dependency_package_dir):
+    return relocate_package_paths(pc_file_root_dir, [dependency_package_dir], ('*.pc', ))
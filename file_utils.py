@@ -1,21 +1,231 @@
 # -*- coding: UTF-8 -*-
-from conans.client.tools.files import _manage_text_not_found
+import codecs
+import fnmatch
+import functools
+import mmap
+import os
+import shutil
+import tempfile
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, NamedTuple, Optional
+
 from conans.util.fallbacks import default_output
-from conans.util.files import (_generic_algorithm_sum, load, save)
+from conans.util.files import (_generic_algorithm_sum, load, save, decode_text)
 import re
 
+try:
+    from re import _parser as _sre_parse  # python >= 3.11
+except ImportError:
+    import sre_parse as _sre_parse
+
+# files bigger than this are scanned through mmap instead of being read into memory
+MMAP_SCAN_THRESHOLD = 1 << 20
+# BOMs of encodings in which an ascii literal is not stored as ascii bytes
+_NON_ASCII_BOMS = (
+    codecs.BOM_UTF16_BE, codecs.BOM_UTF16_LE, codecs.BOM_UTF32_BE, codecs.BOM_UTF32_LE, b'\x2b\x2f\x76'
+)
+_ASCII_COMPATIBLE_ENCODINGS = ('utf-8', 'utf-8-sig', 'cp1252', 'iso8859-1', 'ascii')
+
+
+class replace_result_t(NamedTuple):
+    file_path: str
+    count: int  # number of matches
+    content: Optional[bytes] = None  # new content, only set if the file has to be rewritten
+
+
+@functools.lru_cache(maxsize=256)
+def _compile(search: str, flags: int) -> typing.Pattern:
+    return re.compile(search, flags)
+
+
+def compile_search(search: typing.Union[str, typing.Pattern], flags: int = 0) -> typing.Pattern:
+    if isinstance(search, str):
+        return _compile(search, flags)
+    if flags:
+        raise ValueError('cannot use flags with a compiled pattern')
+    return search
+
+
+def required_literals(pattern: typing.Pattern) -> Optional[typing.Tuple[bytes, ...]]:
+    ''' ascii literals such that every match of pattern contains at least one of them,
+    None if no such literals can be found (e.g. with IGNORECASE)
+    '''
+    if isinstance(pattern.pattern, bytes) or pattern.flags & re.IGNORECASE:
+        return None
+    try:
+        parsed = _sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:
+        return None
+    state = getattr(parsed, 'state', None) or getattr(parsed, 'pattern', None)
+    if state is not None and state.flags & re.IGNORECASE:
+        # inline (?i)
+        return None
+    return _sequence_literals(list(parsed))
+
+
+def _sequence_literals(items) -> Optional[typing.Tuple[bytes, ...]]:
+    if len(items) == 1:
+        op, av = items[0]
+        if op is _sre_parse.SUBPATTERN:
+            if len(av) == 4 and av[1] & re.IGNORECASE:
+                return None
+            return _sequence_literals(list(av[-1]))
+        if op is _sre_parse.BRANCH:
+            ret = []
+            for branch in av[1]:
+                branch_literals = _sequence_literals(list(branch))
+                if branch_literals is None:
+                    return None
+                ret.extend(branch_literals)
+            return tuple(ret)
+    best = ''
+    run = []
+    for op, av in items + [(None, None)]:
+        if op is _sre_parse.LITERAL and av < 128:
+            run.append(chr(av))
+            continue
+        if len(run) > len(best):
+            best = ''.join(run)
+        run = []
+    return (best.encode('ascii'),) if best else None
+
+
+def _may_contain(file_path: str, literals: Optional[typing.Tuple[bytes, ...]], encoding: Optional[str]) -> bool:
+    if not literals:
+        return True
+    if encoding is not None and codecs.lookup(encoding).name not in _ASCII_COMPATIBLE_ENCODINGS:
+        return True
+    size = os.path.getsize(file_path)
+    if size < min(len(_literal) for _literal in literals):
+        return False
+    with open(file_path, 'rb') as f:
+        if size < MMAP_SCAN_THRESHOLD:
+            data = f.read()
+            return data.startswith(_NON_ASCII_BOMS) or any(_literal in data for _literal in literals)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            return m[:4].startswith(_NON_ASCII_BOMS) or any(m.find(_literal) != -1 for _literal in literals)
+
+
+def save_atomic(file_path: str, content: bytes):
+    ''' replace file_path by content through a rename, keeping its permissions.
+    A symlink is kept, the file it points to is replaced.
+    '''
+    file_path = os.path.realpath(file_path)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path) or '.', prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        shutil.copymode(file_path, tmp_path)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _replace_in_file(
+        file_path: str, pattern: typing.Pattern, replace, literals: Optional[typing.Tuple[bytes, ...]],
+        encoding: Optional[str]
+) -> replace_result_t:
+    if not _may_contain(file_path, literals, encoding):
+        return replace_result_t(file_path, 0)
+    raw = load(file_path, binary=True)
+    content, nb = pattern.subn(replace, decode_text(raw, encoding or 'auto'))
+    if nb == 0:
+        return replace_result_t(file_path, 0)
+    new_raw = content.encode(encoding or 'utf-8')
+    return replace_result_t(file_path, nb, None if new_raw == raw else new_raw)
+
+
 def replace_regex_in_file(file_path, search, replace, flags=0, strict=True, output=None, encoding=None, warning=False):
     output = default_output(output, 'replace_regex_in_file')
 
-    encoding_in = encoding or "auto"
-    encoding_out = encoding or "utf-8"
-    content = load(file_path, encoding=encoding_in)
-    #print(content)
-    content, nb = re.subn(search, replace, content, flags=flags)
-    if nb == 0:
+    result = _replace_in_file(file_path, compile_search(search, flags), replace, None, encoding)
+    if result.count == 0:
         if strict or warning:
+            from conans.client.tools.files import _manage_text_not_found
             _manage_text_not_found(search, file_path, strict, 'replace_regex_in_file', output=output)
-        #return
+    if result.content is not None:
+        save(file_path, result.content, only_if_modified=False, encoding=encoding or 'utf-8')
+
+
+def replace_regex_in_file_list(
+        file_paths: Iterable[str], search, replace, flags=0, strict=True, output=None, encoding=None, warning=False,
+        max_workers: Optional[int] = None
+) -> Dict[str, int]:
+    ''' replace_regex_in_file for many files at once.
+    The pattern is compiled once, files without the literal part of the pattern are skipped without decoding them,
+    the others are processed on a thread pool. Only files whose content changes are rewritten (atomically),
+    so the mtime of the others is kept. Paths leading to the same file (symlinks) are processed once.
+    With strict, nothing is written if a file has no match.
+    :return: {file_path: number of matches} in the order of file_paths
+    '''
+    output = default_output(output, 'replace_regex_in_file_list')
+    file_paths = list(file_paths)
+    real_paths = {_path: os.path.realpath(_path) for _path in file_paths}
+    unique_paths = list(dict.fromkeys(real_paths[_path] for _path in file_paths))
+    pattern = compile_search(search, flags)
+    literals = required_literals(pattern)
+    results = []
+    if file_paths:
+        workers = max_workers or min(len(unique_paths), 2 * (os.cpu_count() or 1), 16)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            by_real_path = {
+                _result.file_path: _result for _result in executor.map(
+                    lambda _path: _replace_in_file(_path, pattern, replace, literals, encoding), unique_paths
+                )
+            }
+            results = [by_real_path[real_paths[_path]]._replace(file_path=_path) for _path in file_paths]
+            if strict or warning:
+                from conans.client.tools.files import _manage_text_not_found
+                for result in results:
+                    if result.count == 0:
+                        _manage_text_not_found(search, result.file_path, strict, 'replace_regex_in_file', output=output)
+            list(executor.map(
+                lambda _result: save_atomic(_result.file_path, _result.content),
+                [_result for _result in by_real_path.values() if _result.content is not None]
+            ))
+    return {_result.file_path: _result.count for _result in results}
+
+
+# files that usually embed the absolute install prefix of a package
+DEFAULT_RELOCATION_GLOBS = ('*.pc', '*.cmake', '*.la', '*.sh', '*-config')
+
+
+def find_files(root_dir: str, file_globs: typing.Sequence[str]) -> typing.List[str]:
+    ''' regular files under root_dir whose name matches one of file_globs, symlinks are not followed nor returned
+    '''
+    ret = []
+    for dirpath, _, filenames in os.walk(root_dir):
+        for filename in filenames:
+            if any(fnmatch.fnmatchcase(filename, _glob) for _glob in file_globs):
+                file_path = os.path.join(dirpath, filename)
+                if not os.path.islink(file_path):
+                    ret.append(file_path)
+    return ret
+
 
-    content = content.encode(encoding_out)
-    save(file_path, content, only_if_modified=False, encoding=encoding_out)
\ No newline at end of file
+def relocate_in_files(
+        root_dir: str, relocations: typing.Mapping[str, str],
+        file_globs: typing.Sequence[str] = DEFAULT_RELOCATION_GLOBS,
+        output=None, encoding=None, max_workers: Optional[int] = None
+) -> Dict[str, int]:
+    ''' replace every match of the relocation patterns by their new path, in a single walk of root_dir
+    and a single pass over each file: all patterns are combined into one alternation.
+    :param relocations: {regex of an old path: new path}, the regexes must not use group references
+    :param file_globs: names of the files to process, e.g. ('*.pc', '*.cmake')
+    :return: {file_path: number of replacements} for every file that was scanned
+    '''
+    if not relocations:
+        return {}
+    targets = {}
+    branches = []
+    for i, (search, new_path) in enumerate(relocations.items()):
+        name = 'r{}'.format(i)
+        targets[name] = new_path
+        branches.append('(?P<{}>{})'.format(name, search))
+    return replace_regex_in_file_list(
+        find_files(root_dir, file_globs), '|'.join(branches), lambda _match: targets[_match.lastgroup],
+        strict=False, output=output, encoding=encoding, max_workers=max_workers
+    )
@@ -0,0 +1,286 @@
+# -*- coding: UTF-8 -*-
+import hashlib
+import logging
+import os
+import re
+import shutil
+import subprocess
+import typing
+import urllib.parse
+from typing import Optional, Sequence
+
+from conans.errors import ConanException
+
+from .cache_utils import LruDirCache, dir_size, file_lock, get_cache_dir
+
+if typing.TYPE_CHECKING:
+    from conans.client.output import ScopedOutput
+default_logger = logging.getLogger(__name__)
+
+# fetch only the wanted commit, then deepen the branch, then fetch its whole history
+GIT_FETCH_AUTO = 'auto'
+# only fetch the wanted commit, fail if the remote does not allow it
+GIT_FETCH_EXACT = 'exact'
+# deepen the branch step by step, then fetch its whole history
+GIT_FETCH_DEEPEN = 'deepen'
+# shallow clone of the branch then its whole history (the historical behaviour)
+GIT_FETCH_UNSHALLOW = 'unshallow'
+GIT_FETCH_STRATEGIES = (GIT_FETCH_AUTO, GIT_FETCH_EXACT, GIT_FETCH_DEEPEN, GIT_FETCH_UNSHALLOW)
+DEFAULT_DEEPEN_STEPS = (50, 200, 1000)
+FULL_SHA_REGEX = re.compile(r'^(?:[0-9a-f]{40}|[0-9a-f]{64})$')
+
+
+def run_git(
+        folder: str, *args: str, check: bool = True, env: Optional[typing.Mapping[str, str]] = None
+) -> subprocess.CompletedProcess:
+    ''' :param env: environment of git instead of os.environ
+    '''
+    cmd = ['git', '-C', folder]
+    cmd.extend(args)
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, env=env)
+    if check and proc.returncode != 0:
+        raise ConanException('{} failed: {}'.format(' '.join(cmd), proc.stderr.strip()))
+    return proc
+
+
+def has_commit(folder: str, commit: str, env: Optional[typing.Mapping[str, str]] = None) -> bool:
+    return run_git(
+        folder, 'rev-parse', '--verify', '--quiet', commit + '^{commit}', check=False, env=env).returncode == 0
+
+
+def is_shallow(folder: str) -> bool:
+    return os.path.exists(os.path.join(folder, '.git', 'shallow'))
+
+
+def init_repo(folder: str, url: str, partial_clone: bool = False):
+    ''' empty repository with url as origin, what `git clone --no-checkout` would create without fetching anything
+    :param partial_clone: set origin up as a blob:none promisor remote, blobs are then downloaded on checkout
+    '''
+    os.makedirs(folder, exist_ok=True)
+    run_git(folder, 'init', '--quiet')
+    run_git(folder, 'remote', 'add', 'origin', url)
+    if partial_clone:
+        run_git(folder, 'config', 'remote.origin.promisor', 'true')
+        run_git(folder, 'config', 'remote.origin.partialclonefilter', 'blob:none')
+
+
+def _fetch_args(partial_clone: bool, *args: str) -> typing.List[str]:
+    ret = ['fetch', '--quiet']
+    if partial_clone:
+        ret.append('--filter=blob:none')
+    ret.extend(args)
+    return ret
+
+
+def remote_refs(folder: str, remote: str = 'origin') -> typing.Dict[str, str]:
+    ''' {ref: sha} of remote, an annotated tag maps to the commit it points at
+    '''
+    ret = {}
+    for line in run_git(folder, 'ls-remote', remote).stdout.splitlines():
+        sha, _, ref = line.partition('\t')
+        if ref.endswith('^{}'):
+            ret[ref[:-len('^{}')]] = sha
+        else:
+            ret.setdefault(ref, sha)
+    return ret
+
+
+def resolve_abbreviated_sha(refs: typing.Mapping[str, str], commit: str) -> Optional[str]:
+    ''' the full sha of commit if it is the tip of exactly one sha among refs, see remote_refs
+    '''
+    matches = {_sha for _sha in refs.values() if _sha.startswith(commit.lower())}
+    return matches.pop() if len(matches) == 1 else None
+
+
+def fetch_tags_in_history(folder: str, commit: str, refs: typing.Mapping[str, str], partial_clone: bool = False) \
+        -> typing.List[str]:
+    ''' fetch the tags of refs that point into the fetched history of commit, so that git describe works
+    in a clone that was fetched with an explicit refspec, which does not follow tags
+    :return: the fetched tags
+    '''
+    history = set(run_git(folder, 'rev-list', commit).stdout.split())
+    tags = [_ref for _ref, _sha in refs.items() if _ref.startswith('refs/tags/') and _sha in history]
+    if tags:
+        run_git(folder, *_fetch_args(partial_clone, 'origin', *('+{0}:{0}'.format(_tag) for _tag in tags)))
+    return [_tag[len('refs/tags/'):] for _tag in tags]
+
+
+def fetch_commit(
+        folder: str,
+        url: str,
+        branch: Optional[str],
+        commit: Optional[str],
+        strategy: str = GIT_FETCH_AUTO,
+        partial_clone: bool = False,
+        deepen_steps: Sequence[int] = DEFAULT_DEEPEN_STEPS,
+        output: typing.Union['ScopedOutput', logging.Logger] = default_logger,
+) -> str:
+    ''' get commit of url into folder and check it out, downloading as little history as the remote allows
+    :param branch: branch or tag that contains commit, also used when commit is empty
+    :param commit: full or abbreviated sha. An abbreviated sha is fetched directly only if it is the tip
+        of a branch or a tag of the remote, otherwise the history of branch is fetched until it is found
+    :param strategy: one of GIT_FETCH_STRATEGIES
+    :param partial_clone: fetch with --filter=blob:none
+    :param deepen_steps: number of commits added to the branch history by each --deepen round
+    :return: sha of the checked out commit
+    '''
+    if strategy not in GIT_FETCH_STRATEGIES:
+        raise ConanException('unknown git fetch strategy {}, expected one of {}'.format(strategy, GIT_FETCH_STRATEGIES))
+    init_repo(folder, url, partial_clone)
+    refs = remote_refs(folder)
+    found = False
+    if commit and strategy in (GIT_FETCH_AUTO, GIT_FETCH_EXACT):
+        if not FULL_SHA_REGEX.match(commit) and resolve_abbreviated_sha(refs, commit):
+            commit = resolve_abbreviated_sha(refs, commit)
+        if FULL_SHA_REGEX.match(commit):
+            proc = run_git(folder, *_fetch_args(partial_clone, '--depth', '1', 'origin', commit), check=False)
+            found = proc.returncode == 0
+            if not found:
+                output.info('remote does not serve commit {} directly: {}'.format(commit, proc.stderr.strip()))
+        else:
+            output.info('{} is not a full sha nor the tip of a ref, it cannot be fetched directly'.format(commit))
+        if not found and strategy == GIT_FETCH_EXACT:
+            raise ConanException('cannot fetch commit {} from {}'.format(commit, url))
+    if not found:
+        if not branch:
+            raise ConanException('a branch is required to fetch {} from {}'.format(commit, url))
+        run_git(folder, *_fetch_args(partial_clone, '--depth', '1', 'origin', branch))
+        if not commit:
+            commit = run_git(folder, 'rev-parse', 'FETCH_HEAD').stdout.strip()
+        found = has_commit(folder, commit)
+    if not found and strategy in (GIT_FETCH_AUTO, GIT_FETCH_DEEPEN):
+        for step in deepen_steps:
+            output.info('{} is not in the fetched history of {}, deepen by {}'.format(commit, branch, step))
+            run_git(folder, *_fetch_args(partial_clone, '--deepen={}'.format(step), 'origin', branch))
+            found = has_commit(folder, commit)
+            if found or not is_shallow(folder):
+                break
+    if not found and is_shallow(folder):
+        output.info('{} is not in the fetched history of {}, fetch all of it'.format(commit, branch))
+        run_git(folder, *_fetch_args(partial_clone, '--unshallow', 'origin', branch))
+        found = has_commit(folder, commit)
+    if not found:
+        raise ConanException('commit {} is not in branch {} of {}'.format(commit, branch, url))
+    fetch_tags_in_history(folder, commit, refs, partial_clone)
+    run_git(folder, '-c', 'advice.detachedHead=false', 'checkout', '--quiet', commit)
+    return run_git(folder, 'rev-parse', 'HEAD').stdout.strip()
+
+
+GIT_MIRROR_MAX_SIZE_ENV = 'CONANUTILS_GIT_MIRROR_MAX_SIZE'
+DEFAULT_GIT_MIRROR_MAX_SIZE = 20 * 1024 ** 3
+_SCP_LIKE_URL_REGEX = re.compile(r'^(?:[^@/]+@)?(?P<host>[^:/]+):(?P<path>(?!//).+)$')
+
+
+def normalize_repo_url(url: str) -> str:
+    ''' the same repository gets the same key whether it is reached through https, ssh or git@host:path
+    '''
+    url = url.strip().rstrip('/')
+    if url.endswith('.git'):
+        url = url[:-len('.git')]
+    match = _SCP_LIKE_URL_REGEX.match(url)
+    if match and '://' not in url:
+        return '{}/{}'.format(match.group('host').lower(), match.group('path').strip('/'))
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme == 'file' or not parsed.scheme:
+        return os.path.realpath(parsed.path if parsed.scheme else url)
+    return '{}/{}'.format((parsed.hostname or '').lower(), parsed.path.strip('/'))
+
+
+class GitMirrorCache(LruDirCache):
+    ''' Bare mirrors of upstream repositories shared by every recipe on the host.
+    A mirror is only fetched when a wanted commit is missing from it, source folders are cloned from it locally.
+    Each mirror has its own lock file, the least recently used mirrors are removed
+    when the cache grows over max_size bytes.
+    '''
+
+    def __init__(self, root: Optional[str] = None, max_size: Optional[int] = None):
+        if max_size is None:
+            max_size = int(os.environ.get(GIT_MIRROR_MAX_SIZE_ENV) or DEFAULT_GIT_MIRROR_MAX_SIZE)
+        super().__init__(root or get_cache_dir('git_mirrors', create=False), max_size)
+
+    def mirror_path(self, url: str) -> str:
+        key = normalize_repo_url(url)
+        name = re.sub(r'[^0-9A-Za-z._-]', '_', key.rsplit('/', 1)[-1]) or 'repo'
+        return os.path.join(self.root, '{}-{}.git'.format(name, hashlib.sha1(key.encode()).hexdigest()[:16]))
+
+    def _is_ready(self, mirror: str, commit: Optional[str], env: Optional[typing.Mapping[str, str]] = None) -> bool:
+        return bool(commit) and os.path.isdir(mirror) and has_commit(mirror, commit, env)
+
+    def update(
+            self, url: str, commit: Optional[str], output=default_logger,
+            env: Optional[typing.Mapping[str, str]] = None
+    ) -> str:
+        ''' make sure the mirror of url has commit, fetching upstream only if it does not
+        :param commit: if empty, the mirror is always fetched to get the latest branches
+        :param env: environment of git instead of os.environ
+        :return: path of the mirror
+        '''
+        mirror = self.mirror_path(url)
+        os.makedirs(self.root, exist_ok=True)
+        with file_lock(self.entry_lock_path(mirror), shared=True):
+            if self._is_ready(mirror, commit, env):
+                return mirror
+        with file_lock(self.entry_lock_path(mirror)):
+            if self._is_ready(mirror, commit, env):
+                # updated by another process while waiting for the lock
+                return mirror
+            if os.path.isdir(mirror):
+                output.info('update git mirror {} of {}'.format(mirror, url))
+                run_git(mirror, 'fetch', '--quiet', '--prune', 'origin', env=env)
+            else:
+                output.info('create git mirror {} of {}'.format(mirror, url))
+                tmp_mirror = mirror + '.tmp'
+                if os.path.isdir(tmp_mirror):
+                    shutil.rmtree(tmp_mirror)
+                run_git(self.root, 'clone', '--quiet', '--mirror', url, tmp_mirror, env=env)
+                os.rename(tmp_mirror, mirror)
+            size = dir_size(mirror)
+        self.record(mirror, size, url=url)
+        return mirror
+
+    def clone(
+            self, folder: str, url: str, branch: Optional[str], commit: Optional[str], dissociate: bool = True,
+            output: typing.Union['ScopedOutput', logging.Logger] = default_logger,
+            env: Optional[typing.Mapping[str, str]] = None
+    ) -> str:
+        ''' check commit of url out into folder through the local mirror, see fetch_commit
+        :param dissociate: copy the objects into folder, so that it does not depend on the mirror afterwards
+        :param env: environment of git instead of os.environ
+        :return: sha of the checked out commit
+        '''
+        while True:
+            mirror = self.update(url, commit, output, env)
+            with file_lock(self.entry_lock_path(mirror), shared=True):
+                # evict() of another process may remove the mirror between update() and the lock
+                if os.path.isdir(mirror):
+                    self._clone_mirror(mirror, folder, url, commit or branch or 'HEAD', dissociate, env)
+                    break
+            output.info('git mirror {} was removed by another process, update it again'.format(mirror))
+        self.record(mirror, url=url)
+        self.evict(keep=(mirror,))
+        return run_git(folder, 'rev-parse', 'HEAD', env=env).stdout.strip()
+
+    @staticmethod
+    def _clone_mirror(
+            mirror: str, folder: str, url: str, commit: str, dissociate: bool,
+            env: Optional[typing.Mapping[str, str]] = None
+    ):
+        if not has_commit(mirror, commit, env):
+            raise ConanException('commit {} is not in {}'.format(commit, url))
+        os.makedirs(folder, exist_ok=True)
+        run_git(folder, 'clone', '--quiet', '--shared', '--no-checkout', mirror, '.', env=env)
+        run_git(folder, 'remote', 'set-url', 'origin', url, env=env)
+        run_git(folder, '-c', 'advice.detachedHead=false', 'checkout', '--quiet', commit, env=env)
+        if dissociate:
+            run_git(folder, 'repack', '-a', '-d', '-q', env=env)
+            os.unlink(os.path.join(folder, '.git', 'objects', 'info', 'alternates'))
+
+
+_git_mirror_cache: Optional[GitMirrorCache] = None
+
+
+def get_git_mirror_cache() -> GitMirrorCache:
+    global _git_mirror_cache
+    if _git_mirror_cache is None:
+        _git_mirror_cache = GitMirrorCache()
+    return _git_mirror_cache
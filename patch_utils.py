@@ -0,0 +1,322 @@
+# -*- coding: UTF-8 -*-
+import copy
+import hashlib
+import io
+import logging
+import os
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from conans.errors import ConanException
+
+from .cache_utils import load_json, save_json_atomic, warn
+from .file_utils import save_atomic
+
+if typing.TYPE_CHECKING:
+    from conans.client.output import ScopedOutput
+    import patch_ng
+default_logger = logging.getLogger(__name__)
+
+# created next to the patched folder, so that it is not part of the source tree
+PATCH_STAMP_DIR = '.conanutils-patches'
+_STAMP_NAME = 'stamp.json'
+_DEV_NULL = b'/dev/null'
+
+
+class patch_step_t(NamedTuple):
+    name: str
+    patchset: 'patch_ng.PatchSet'
+    reverse: bool = False
+
+
+def _sha256(content: Optional[bytes]) -> Optional[str]:
+    return None if content is None else hashlib.sha256(content).hexdigest()
+
+
+def load_patchset(patch_file: str) -> 'patch_ng.PatchSet':
+    from patch_ng import fromfile
+    patchset = fromfile(patch_file)
+    if not patchset:
+        raise ConanException('Failed to parse patch: {}'.format(patch_file))
+    return patchset
+
+
+def _clean(path: bytes) -> str:
+    path = path.decode('utf-8').replace('\\', '/')
+    if path.startswith(('a/', 'b/')):
+        path = path[2:]
+    return path
+
+
+def _file_of(base_path: str, item, overlay: Dict[str, Optional[bytes]]) -> Optional[str]:
+    ''' the file patched by item, looked up the way patch_ng does: as written in the patch, then without a/ and b/
+    '''
+    candidates = [item.source.decode('utf-8'), item.target.decode('utf-8'), _clean(item.source), _clean(item.target)]
+    for candidate in candidates:
+        if candidate in overlay:
+            if overlay[candidate] is not None:
+                return candidate
+        elif os.path.isfile(os.path.join(base_path, candidate)):
+            return candidate
+    return None
+
+
+def patch_touched_files(patchset: 'patch_ng.PatchSet') -> List[str]:
+    ret = []
+    for item in patchset.items:
+        path = _clean(item.target if item.source == _DEV_NULL else item.source)
+        if path not in ret:
+            ret.append(path)
+    return ret
+
+
+def _read(base_path: str, path: str, overlay: Dict[str, Optional[bytes]]) -> Optional[bytes]:
+    if path not in overlay:
+        full_path = os.path.join(base_path, path)
+        if os.path.isfile(full_path):
+            with open(full_path, 'rb') as f:
+                overlay[path] = f.read()
+        else:
+            overlay[path] = None
+    return overlay[path]
+
+
+def _hunks_match(content: bytes, hunks) -> bool:
+    lines = content.splitlines(True)
+    for hunk in hunks:
+        expected = [_line[1:].rstrip(b'\r\n') for _line in hunk.text if _line[:1] in (b' ', b'-')]
+        start = hunk.startsrc - 1 if expected else hunk.startsrc
+        actual = [_line.rstrip(b'\r\n') for _line in lines[start:start + len(expected)]]
+        if actual != expected:
+            return False
+    return True
+
+
+def simulate_patch(
+        base_path: str, patchset: 'patch_ng.PatchSet', overlay: Dict[str, Optional[bytes]], reverse: bool = False
+) -> Optional[str]:
+    ''' apply (or revert) patchset on the files of base_path overlaid by overlay, without touching the disk.
+    A hunk must match exactly at its position, like tools.patch without fuzz.
+    :param overlay: {relative path: content, None if the file does not exist}, updated with the patched files
+    :return: None on success, else the reason of the failure
+    '''
+    if reverse:
+        patchset = copy.deepcopy(patchset)
+        patchset._reverse()
+    for item in patchset.items:
+        created, deleted = item.source == _DEV_NULL, item.target == _DEV_NULL
+        if reverse:
+            created, deleted = deleted, created
+        if created or deleted:
+            path = _clean(item.target if item.source == _DEV_NULL else item.source)
+            # the whole content of a created or deleted file is in its single hunk
+            sign = b'-' if deleted else b'+'
+            whole = b''.join(_line[1:] for _line in item.hunks[0].text if _line[:1] == sign)
+            current = _read(base_path, path, overlay)
+            if created:
+                if current is not None and current != whole:
+                    return '{} already exists'.format(path)
+                overlay[path] = whole
+            else:
+                if current is None:
+                    return '{} does not exist'.format(path)
+                if current.splitlines() != whole.splitlines():
+                    return '{} is different from the file the patch removes'.format(path)
+                overlay[path] = None
+            continue
+        path = _file_of(base_path, item, overlay)
+        if path is None:
+            return 'source/target file does not exist: {} {}'.format(item.source, item.target)
+        current = _read(base_path, path, overlay)
+        if not _hunks_match(current, item.hunks):
+            return 'hunks do not match {}'.format(path)
+        overlay[path] = b''.join(patchset.patch_stream(io.BytesIO(current), item.hunks))
+    return None
+
+
+def _group_by_touched_files(steps: Sequence[patch_step_t]) -> List[List[int]]:
+    ''' indices of the steps, grouped so that steps touching a common file are in the same group, in order
+    '''
+    parent = list(range(len(steps)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    owner: Dict[str, int] = {}
+    for i, step in enumerate(steps):
+        for path in patch_touched_files(step.patchset):
+            if path in owner:
+                parent[find(i)] = find(owner[path])
+            else:
+                owner[path] = i
+    groups: Dict[int, List[int]] = {}
+    for i in range(len(steps)):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+
+def check_patch_series(
+        base_path: str, steps: Sequence[patch_step_t], max_workers: Optional[int] = None
+) -> typing.Tuple[Dict[str, Optional[bytes]], Dict[str, str]]:
+    ''' dry run of steps on base_path: steps touching disjoint sets of files are checked in parallel,
+    the others in order
+    :return: (final content of the touched files, None for removed files; {step name: error})
+    '''
+    groups = _group_by_touched_files(steps)
+
+    def check_group(indices: List[int]):
+        overlay: Dict[str, Optional[bytes]] = {}
+        errors = {}
+        for i in indices:
+            error = simulate_patch(base_path, steps[i].patchset, overlay, steps[i].reverse)
+            if error is not None:
+                errors[steps[i].name] = error
+                # later steps of the group depend on this one
+                break
+        return overlay, errors
+
+    files: Dict[str, Optional[bytes]] = {}
+    errors: Dict[str, str] = {}
+    if groups:
+        workers = max_workers or min(len(groups), 2 * (os.cpu_count() or 1), 16)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for overlay, group_errors in executor.map(check_group, groups):
+                files.update(overlay)
+                errors.update(group_errors)
+    return files, errors
+
+
+def patch_stamp_dir(base_path: str) -> str:
+    ''' where the PatchStamp of base_path is kept: PATCH_STAMP_DIR/<name of base_path> in its parent folder
+    '''
+    base_path = os.path.abspath(base_path)
+    return os.path.join(os.path.dirname(base_path), PATCH_STAMP_DIR, os.path.basename(base_path))
+
+
+class PatchStamp(object):
+    ''' record, next to the patched folder (see patch_stamp_dir), of the applied patches (their hash, the files they
+    touch and a copy of their content to be able to revert them) and of the hash of every touched file after patching.
+    '''
+
+    def __init__(self, base_path: str):
+        self.dir = patch_stamp_dir(base_path)
+        legacy_dir = os.path.join(base_path, PATCH_STAMP_DIR)
+        if os.path.isdir(legacy_dir) and not os.path.exists(self.dir):
+            # stamp of a previous version, inside the patched folder
+            os.makedirs(os.path.dirname(self.dir), exist_ok=True)
+            os.rename(legacy_dir, self.dir)
+        self.path = os.path.join(self.dir, _STAMP_NAME)
+        data = load_json(self.path, {})
+        self.entries: List[dict] = data.get('patches', [])
+        self.files: Dict[str, Optional[str]] = data.get('files', {})
+
+    def patch_copy(self, entry: dict) -> str:
+        return os.path.join(self.dir, entry['sha256'] + '.diff')
+
+    def save(self, entries: List[dict], files: Dict[str, Optional[str]], patch_contents: Dict[str, bytes]):
+        os.makedirs(self.dir, exist_ok=True)
+        for entry in entries:
+            copy_path = self.patch_copy(entry)
+            if not os.path.exists(copy_path):
+                with open(copy_path, 'wb') as f:
+                    f.write(patch_contents[entry['sha256']])
+        save_json_atomic(self.path, {'patches': entries, 'files': files})
+        kept = {_entry['sha256'] + '.diff' for _entry in entries}
+        for name in os.listdir(self.dir):
+            if name.endswith('.diff') and name not in kept:
+                os.unlink(os.path.join(self.dir, name))
+        self.entries = entries
+        self.files = files
+
+
+def apply_patch_series(
+        base_path: str, patch_files: Sequence[str], dry_run: bool = False, max_workers: Optional[int] = None,
+        output: typing.Union['ScopedOutput', logging.Logger] = default_logger
+) -> List[str]:
+    ''' bring base_path to patch_files applied in order, reusing what a previous call applied:
+    the unchanged prefix of the series is kept, the patches applied after it are reverted and the new suffix applied.
+    Every step is checked in memory first, nothing is written if one of them fails.
+    :param dry_run: only check
+    :return: names of the patches applied by this call
+    '''
+    stamp = PatchStamp(base_path)
+    contents = {}
+    wanted = []
+    for patch_file in patch_files:
+        with open(patch_file, 'rb') as f:
+            content = f.read()
+        sha = _sha256(content)
+        contents[sha] = content
+        wanted.append({'name': os.path.basename(patch_file), 'sha256': sha, 'path': patch_file})
+    common = 0
+    for old, new in zip(stamp.entries, wanted):
+        if (old['name'], old['sha256']) != (new['name'], new['sha256']):
+            break
+        common += 1
+    to_revert = stamp.entries[common:]
+    to_apply = wanted[common:]
+    if not to_revert and not to_apply:
+        output.info('all {} patches are already applied'.format(len(wanted)))
+        return []
+    if common:
+        output.info('keep {} already applied patches'.format(common))
+
+    reverted_files = set()
+    for entry in to_revert:
+        reverted_files.update(entry['files'])
+    for path, expected in stamp.files.items():
+        full_path = os.path.join(base_path, path)
+        actual = None
+        if os.path.isfile(full_path):
+            with open(full_path, 'rb') as f:
+                actual = _sha256(f.read())
+        if actual != expected:
+            if path in reverted_files:
+                raise ConanException(
+                    '{} was modified after patching, cannot revert the patches touching it, '
+                    'remove {} to start again'.format(path, base_path))
+            warn(output, '{} was modified after patching'.format(path))
+
+    steps = []
+    for entry in reversed(to_revert):
+        output.info('revert patch "{}"'.format(entry['name']))
+        steps.append(patch_step_t('revert ' + entry['name'], load_patchset(stamp.patch_copy(entry)), True))
+    for entry in to_apply:
+        output.info('applying patch "{}"'.format(entry['path']))
+        steps.append(patch_step_t(entry['name'], load_patchset(entry['path'])))
+    files, errors = check_patch_series(base_path, steps, max_workers)
+    if errors:
+        raise ConanException('Failed to apply patches on {}:\n{}'.format(
+            base_path, '\n'.join('{}: {}'.format(_name, _error) for _name, _error in errors.items())))
+    if dry_run:
+        return [_entry['name'] for _entry in to_apply]
+
+    for path, content in files.items():
+        full_path = os.path.join(base_path, path)
+        if content is None:
+            if os.path.exists(full_path):
+                os.unlink(full_path)
+        elif os.path.isfile(full_path):
+            with open(full_path, 'rb') as f:
+                if f.read() == content:
+                    continue
+            save_atomic(full_path, content)
+        else:
+            os.makedirs(os.path.dirname(full_path) or '.', exist_ok=True)
+            with open(full_path, 'wb') as f:
+                f.write(content)
+    entries = stamp.entries[:common]
+    for entry, step in zip(to_apply, steps[len(to_revert):]):
+        entries.append({
+            'name': entry['name'],
+            'sha256': entry['sha256'],
+            'files': patch_touched_files(step.patchset),
+        })
+    file_hashes = dict(stamp.files)
+    file_hashes.update({_path: _sha256(_content) for _path, _content in files.items()})
+    stamp.save(entries, file_hashes, contents)
+    return [_entry['name'] for _entry in to_apply]
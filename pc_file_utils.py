@@ -0,0 +1,887 @@
+# -*- coding: UTF-8 -*-
+import os
+import re
+import shlex
+import typing
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import conans
+
+PC_IDENTIFIER_REGEX = re.compile(r'^([A-Za-z0-9_.]+)\s*([:=])\s*(.*)$')
+PC_VARIABLE_REF_REGEX = re.compile(r'\$\$|\$\{([^}]*)\}')
+# characters pkg-config and pkgconf escape with a backslash when they print a fragment
+PC_OUTPUT_UNSAFE_REGEX = re.compile(r'[^$()+,\-./0-9:=@A-Z^_a-z~\x80-\U0010ffff]')
+PC_REQUIRE_OPERATORS = ('<=', '>=', '!=', '=', '<', '>')
+
+
+class pc_requirement_t(NamedTuple):
+    name: str
+    operator: Optional[str] = None
+    version: Optional[str] = None
+
+
+def pc_env_var_name(pkg_name: str, var_name: str) -> str:
+    ''' Name of the environment variable pkg-config reads to override a variable of a package,
+    e.g. PKG_CONFIG_GSTREAMER_1_0_PREFIX
+    '''
+    def _mangle(_s):
+        return re.sub('[^a-zA-Z0-9]', '_', _s).upper()
+    return 'PKG_CONFIG_{}_{}'.format(_mangle(pkg_name), _mangle(var_name))
+
+
+def compare_pc_versions(a: str, b: str) -> int:
+    ''' rpmvercmp, which is what pkg-config and pkgconf use to compare module versions
+    :return: -1, 0 or 1
+    '''
+    if a == b:
+        return 0
+    seg_a = re.findall(r'[0-9]+|[a-zA-Z]+|~', a)
+    seg_b = re.findall(r'[0-9]+|[a-zA-Z]+|~', b)
+    for _x, _y in zip(seg_a, seg_b):
+        if _x == '~' or _y == '~':
+            if _x != _y:
+                return -1 if _x == '~' else 1
+            continue
+        if _x.isdigit() != _y.isdigit():
+            return 1 if _x.isdigit() else -1
+        if _x.isdigit():
+            _x, _y = int(_x), int(_y)
+        if _x != _y:
+            return -1 if _x < _y else 1
+    if len(seg_a) == len(seg_b):
+        return 0
+    _rest = seg_a[len(seg_b)] if len(seg_a) > len(seg_b) else seg_b[len(seg_a)]
+    longer_is_newer = _rest != '~'
+    if len(seg_a) > len(seg_b):
+        return 1 if longer_is_newer else -1
+    return -1 if longer_is_newer else 1
+
+
+def pc_version_satisfied(version: str, operator: Optional[str], required: Optional[str]) -> bool:
+    if not operator:
+        return True
+    _cmp = compare_pc_versions(version, required)
+    return {
+        '<': _cmp < 0,
+        '<=': _cmp <= 0,
+        '=': _cmp == 0,
+        '!=': _cmp != 0,
+        '>=': _cmp >= 0,
+        '>': _cmp > 0,
+    }[operator]
+
+
+def parse_pc_requires(value: str) -> List[pc_requirement_t]:
+    ''' parse a Requires/Requires.private field, e.g. "glib-2.0 >= 2.40, gobject-2.0 zlib"
+    '''
+    tokens = value.replace(',', ' ').split()
+    ret = []
+    i = 0
+    while i < len(tokens):
+        name = tokens[i]
+        operator = None
+        version = None
+        # operators may also be glued to the version, e.g. "foo >=1.0"
+        if i + 1 < len(tokens):
+            _next = tokens[i + 1]
+            for _op in PC_REQUIRE_OPERATORS:
+                if _next.startswith(_op):
+                    operator = _op
+                    version = _next[len(_op):]
+                    i += 1
+                    if not version and i + 1 < len(tokens):
+                        version = tokens[i + 1]
+                        i += 1
+                    break
+        ret.append(pc_requirement_t(name, operator, version))
+        i += 1
+    return ret
+
+
+class PcFile(object):
+    ''' A parsed .pc file. Variables and fields are kept unexpanded, so that one parse
+    can be evaluated under different variable overrides.
+    '''
+
+    def __init__(self, path: str, variables: Dict[str, str], fields: Dict[str, str]):
+        self.path = path
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        self.variables = variables
+        self.fields = fields
+
+    @classmethod
+    def parse(cls, path: str):
+        with open(path, 'r', encoding='utf-8', errors='surrogateescape') as f:
+            content = f.read()
+        variables = {}
+        fields = {}
+        for line in cls._logical_lines(content):
+            match = PC_IDENTIFIER_REGEX.match(line)
+            if not match:
+                continue
+            key, kind, value = match.groups()
+            value = value.strip()
+            if kind == '=':
+                variables.setdefault(key, value)
+            else:
+                # keywords are case insensitive, e.g. CFlags
+                fields.setdefault(key.lower(), value)
+        return cls(path, variables, fields)
+
+    @staticmethod
+    def _logical_lines(content: str):
+        _buffer = ''
+        for raw in content.splitlines():
+            line = ''
+            _escaped = False
+            for _c in raw:
+                if _escaped:
+                    line += _c if _c == '#' else '\\' + _c
+                    _escaped = False
+                elif _c == '\\':
+                    _escaped = True
+                elif _c == '#':
+                    break
+                else:
+                    line += _c
+            if _escaped:
+                # trailing backslash continues the line
+                _buffer += line
+                continue
+            yield (_buffer + line).strip()
+            _buffer = ''
+        if _buffer:
+            yield _buffer.strip()
+
+    def requires(self, private=False) -> List[pc_requirement_t]:
+        return parse_pc_requires(self.fields.get('requires.private' if private else 'requires', ''))
+
+
+_parsed_pc_files: Dict[str, Tuple[Tuple[int, int], PcFile]] = {}
+
+
+def load_pc_file(path: str) -> PcFile:
+    ''' parse a .pc file once per process, re-parsing only when it changed on disk
+    '''
+    st = os.stat(path)
+    key = (st.st_mtime_ns, st.st_size)
+    cached = _parsed_pc_files.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    pc = PcFile.parse(path)
+    _parsed_pc_files[path] = (key, pc)
+    return pc
+
+
+def rewrite_pc_prefix(content: str, new_prefix: str) -> str:
+    ''' content of a .pc file with its prefix variable set to new_prefix, like tools.replace_prefix_in_pc_file
+    '''
+    lines = []
+    for line in content.splitlines():
+        if line.startswith('prefix='):
+            lines.append('prefix=%s' % new_prefix)
+        else:
+            lines.append(line)
+    return '\n'.join(lines)
+
+
+def find_pc_requirement_files(names: typing.Iterable[str], search_dirs: List[str]) -> Dict[str, Optional[str]]:
+    ''' the .pc file of names and of everything they require (Requires and Requires.private), found in search_dirs
+    :return: {package name: path, None if it is not found}
+    '''
+    ret: Dict[str, Optional[str]] = {}
+    pending = list(names)
+    while pending:
+        name = pending.pop()
+        if name in ret:
+            continue
+        ret[name] = None
+        for _dir in search_dirs:
+            path = os.path.join(_dir, name + '.pc')
+            if os.path.isfile(path):
+                ret[name] = path
+                pc = load_pc_file(path)
+                pending.extend([_r.name for _r in pc.requires() + pc.requires(private=True)])
+                break
+    return ret
+
+
+def get_pc_search_dirs(
+        default_dirs: typing.Callable[[], List[str]], env: Optional[typing.Mapping[str, str]] = None
+) -> List[str]:
+    ''' the .pc search path as pkg-config builds it: PKG_CONFIG_PATH, then PKG_CONFIG_LIBDIR
+    or the built-in default path
+    :param env: environment to read instead of os.environ
+    '''
+    env = os.environ if env is None else env
+    dirs = [_i for _i in env.get('PKG_CONFIG_PATH', '').split(os.pathsep) if _i]
+    libdir = env.get('PKG_CONFIG_LIBDIR')
+    if libdir is not None:
+        dirs.extend([_i for _i in libdir.split(os.pathsep) if _i])
+    else:
+        dirs.extend(default_dirs())
+    return dirs
+
+
+class PcResolver(object):
+    ''' Evaluate .pc files in-process with pkg-config semantics: variable expansion,
+    PKG_CONFIG_$PACKAGE_$VARIABLE overrides, --define-variable, Requires/Requires.private
+    resolution and --static.
+    '''
+
+    def __init__(
+            self,
+            search_dirs: typing.Union[List[str], typing.Callable[[], List[str]]],
+            is_pkgconf: bool = False,
+            static: bool = False,
+            define_variables: Optional[Dict[str, str]] = None,
+            system_libdirs: typing.Iterable[str] = ('/usr/lib', '/lib'),
+            system_includedirs: typing.Iterable[str] = ('/usr/include',),
+            env: Optional[typing.Mapping[str, str]] = None,
+            provided: typing.Iterable[str] = (),
+    ):
+        ''' :param provided: packages whose flags are brought by something else, e.g. the other components of a
+            conan package. Their requirements are checked but they are not expanded unless queried directly.
+        '''
+        self._search_dirs = search_dirs
+        self.is_pkgconf = is_pkgconf
+        self.static = static
+        self.define_variables = dict(define_variables or {})
+        self.env = os.environ if env is None else env
+        self.sysroot = self.env.get('PKG_CONFIG_SYSROOT_DIR', '')
+        self.system_libdirs = set() if self.env.get('PKG_CONFIG_ALLOW_SYSTEM_LIBS') else set(system_libdirs)
+        self.system_includedirs = set() if self.env.get('PKG_CONFIG_ALLOW_SYSTEM_CFLAGS') else set(system_includedirs)
+        self._found: Dict[str, PcFile] = {}
+        self._variables: Dict[str, Dict[str, str]] = {}
+        self._expanded: Dict[Tuple[str, bool], List[Tuple[PcFile, bool]]] = {}
+        self._fragments_cache: Dict[Tuple[str, str], List[str]] = {}
+        self.provided = frozenset(provided)
+
+    def search_dirs(self) -> List[str]:
+        if callable(self._search_dirs):
+            self._search_dirs = self._search_dirs()
+        return self._search_dirs
+
+    def find(self, name: str) -> PcFile:
+        if name in self._found:
+            return self._found[name]
+        for _dir in self.search_dirs():
+            path = os.path.join(_dir, name + '.pc')
+            if os.path.isfile(path):
+                pc = load_pc_file(path)
+                self._found[name] = pc
+                return pc
+        raise conans.errors.ConanException(
+            'Package {} was not found in the pkg-config search path {}'.format(name, self.search_dirs()))
+
+    def variables(self, pc: PcFile) -> Dict[str, str]:
+        if pc.path in self._variables:
+            return self._variables[pc.path]
+        builtins = {
+            'pcfiledir': os.path.dirname(pc.path),
+            'pc_sysrootdir': self.sysroot or '/',
+        }
+        expanded: Dict[str, str] = {}
+
+        def _lookup(_name, _stack):
+            if not self.is_pkgconf:
+                _override = self.env.get(pc_env_var_name(pc.name, _name))
+                if _override is not None:
+                    return _override
+            if _name in self.define_variables:
+                return self.define_variables[_name]
+            if _name in expanded:
+                return expanded[_name]
+            if _name in pc.variables:
+                if _name in _stack:
+                    raise conans.errors.ConanException(
+                        'variable {} in {} references itself'.format(_name, pc.path))
+                _raw = pc.variables[_name]
+                if self.is_pkgconf:
+                    _raw = self._dequote(_raw)
+                expanded[_name] = self._expand(_raw, _lookup, _stack + (_name,))
+                return expanded[_name]
+            return builtins.get(_name, '')
+
+        ret = {_name: _lookup(_name, ()) for _name in pc.variables}
+        ret['pcfiledir'] = _lookup('pcfiledir', ())
+        self._variables[pc.path] = ret
+        return ret
+
+    @staticmethod
+    def _dequote(value: str) -> str:
+        ''' pkgconf drops the quotes around a variable value, e.g. digests="md5 sha1"
+        '''
+        if not value or value[0] not in ('"', "'"):
+            return value
+        quote = value[0]
+        ret = ''
+        i = 0
+        while i < len(value):
+            if value[i] == '\\' and value[i + 1:i + 2] == quote:
+                i += 1
+                ret += quote
+            elif value[i] != quote:
+                ret += value[i]
+            i += 1
+        return ret
+
+    @staticmethod
+    def _expand(value: str, lookup, stack=()) -> str:
+        def _sub(match):
+            if match.group(0) == '$$':
+                return '$'
+            return lookup(match.group(1), stack)
+        return PC_VARIABLE_REF_REGEX.sub(_sub, value)
+
+    def field(self, pc: PcFile, field_name: str) -> str:
+        _vars = self.variables(pc)
+        return self._expand(pc.fields.get(field_name.lower(), ''), lambda _n, _s: _vars.get(_n, ''))
+
+    def modversion(self, name: str) -> str:
+        return self.field(self.find(name), 'Version')
+
+    def _check_requirement(self, req: pc_requirement_t, pc: PcFile, parent: PcFile):
+        if req.operator and not pc_version_satisfied(self.field(pc, 'Version'), req.operator, req.version):
+            raise conans.errors.ConanException(
+                "Package dependency requirement '{} {} {}' could not be satisfied, required by {}".format(
+                    req.name, req.operator, req.version, parent.name))
+
+    def expand(self, name: str, include_private: bool) -> List[Tuple[PcFile, bool]]:
+        ''' serialized list of a package and everything it requires, dependents before their requirements,
+        each flagged with whether it was reached through Requires.private. pkgconf walks the graph
+        depth-first and visits shared requirements once per path, pkg-config keeps each package only
+        at its last position.
+        '''
+        return self._expand_pc(self.find(name), include_private, ())
+
+    def _expand_pc(self, pc: PcFile, include_private: bool, stack) -> List[Tuple[PcFile, bool]]:
+        key = (pc.path, include_private)
+        if key in self._expanded:
+            return self._expanded[key]
+        seq = [(pc, False)]
+        reqs = [(_r, False) for _r in pc.requires()]
+        if include_private:
+            reqs.extend([(_r, True) for _r in pc.requires(private=True)])
+        for req, private in reqs:
+            dep = self.find(req.name)
+            self._check_requirement(req, dep, pc)
+            if dep.path in stack or dep is pc or dep.name in self.provided:
+                continue
+            sub = self._expand_pc(dep, include_private, stack + (pc.path,))
+            seq.extend([(_pc, True) for _pc, _ in sub] if private else sub)
+        if not self.is_pkgconf:
+            seq = self._strip_duplicates(seq)
+        self._expanded[key] = seq
+        return seq
+
+    @staticmethod
+    def _strip_duplicates(seq: List[Tuple[PcFile, bool]]) -> List[Tuple[PcFile, bool]]:
+        seen = set()
+        ret = []
+        for pc, private in reversed(seq):
+            if pc.path not in seen:
+                seen.add(pc.path)
+                ret.append((pc, private))
+        ret.reverse()
+        return ret
+
+    def _fragments(self, pc: PcFile, field_name: str) -> List[str]:
+        key = (pc.path, field_name)
+        if key not in self._fragments_cache:
+            self._fragments_cache[key] = self._parse_fragments(pc, field_name)
+        return self._fragments_cache[key]
+
+    def _parse_fragments(self, pc: PcFile, field_name: str) -> List[str]:
+        value = self.field(pc, field_name)
+        if not value:
+            return []
+        try:
+            tokens = shlex.split(value)
+        except ValueError as e:
+            raise conans.errors.ConanException('cannot parse {} in {}: {}'.format(field_name, pc.path, e))
+        if self.is_pkgconf:
+            # pkgconf keeps "-I dir" as two fragments
+            return tokens
+        ret = []
+        i = 0
+        while i < len(tokens):
+            _token = tokens[i]
+            if _token in ('-I', '-L', '-l') and i + 1 < len(tokens):
+                _token += tokens[i + 1]
+                i += 1
+            ret.append(_token)
+            i += 1
+        return ret
+
+    def _apply_sysroot(self, flag: str) -> str:
+        # a lone -I or -L, whose folder is the next fragment, is printed as is
+        if self.sysroot and flag[:2] in ('-I', '-L') and len(flag) > 2 and not flag[2:].startswith(self.sysroot):
+            return flag[:2] + self.sysroot + flag[2:]
+        return flag
+
+    @staticmethod
+    def _split_output(flags: List[str]) -> List[str]:
+        ''' what tools.PkgConfig gets from the executable: the fragments are printed shell-escaped,
+        e.g. -DFOO=bar\\ baz, and the output is split on whitespace
+        '''
+        return ' '.join(PC_OUTPUT_UNSAFE_REGEX.sub(r'\\\g<0>', _f) for _f in flags).split()
+
+    @staticmethod
+    def _fragment_type(flag: str) -> str:
+        return flag[1] if flag.startswith('-') and len(flag) > 1 else ''
+
+    def _merge(self, flags: List[Tuple[str, bool]]) -> List[str]:
+        if self.is_pkgconf:
+            # pkgconf keeps the first of duplicated -I/-L flags. Any other duplicated flag moves to its
+            # last position, unless the earlier copy follows a flag it may belong to, e.g. -Wl,--as-needed.
+            # Libs.private and flags of packages reached through Requires.private are never merged.
+            merged = []
+            for _f, private in flags:
+                _type = self._fragment_type(_f)
+                if private:
+                    pass
+                elif _type in ('I', 'L'):
+                    if _f in merged:
+                        continue
+                elif _f in merged:
+                    idx = len(merged) - 1 - merged[::-1].index(_f)
+                    _prev_type = self._fragment_type(merged[idx - 1]) if idx > 0 else None
+                    if _prev_type is None or _prev_type in ('l', 'L', 'I') or _prev_type == _type:
+                        del merged[idx]
+                merged.append(_f)
+        else:
+            # pkg-config only strips consecutive duplicates
+            merged = []
+            for _f, _ in flags:
+                if not merged or merged[-1] != _f:
+                    merged.append(_f)
+        merged = [self._apply_sysroot(_f) for _f in merged]
+        return self._split_output([
+            _f for _f in merged
+            if not (_f.startswith('-L') and _f[2:] in self.system_libdirs)
+            and not (_f.startswith('-I') and _f[2:] in self.system_includedirs)
+        ])
+
+    def cflags(self, name: str) -> List[str]:
+        flags = []
+        for pc, _ in self.expand(name, include_private=True):
+            flags.extend([(_f, False) for _f in self._fragments(pc, 'Cflags')])
+            if self.static:
+                flags.extend([(_f, False) for _f in self._fragments(pc, 'Cflags.private')])
+        return self._merge(flags)
+
+    def libs(self, name: str) -> List[str]:
+        ''' with static and pkgconf, duplicated flags may not be merged in the same order as pkgconf does,
+        NativePkgConfig runs the executable in that case
+        '''
+        flags = []
+        for pc, private in self.expand(name, include_private=self.static):
+            flags.extend([(_f, private) for _f in self._fragments(pc, 'Libs')])
+            if self.static:
+                flags.extend([(_f, True) for _f in self._fragments(pc, 'Libs.private')])
+        return self._merge(flags)
+
+
+def default_pc_resolver(
+        static: bool = False, define_variables: Optional[Dict[str, str]] = None, provided: typing.Iterable[str] = ()
+) -> PcResolver:
+    ''' PcResolver configured like the pkg-config executable of the host: same search path, flavour and system dirs
+    '''
+    from .pkg_conf_utils import get_default_pc_path, get_pkg_config_variables, is_pkgconf
+    _vars = get_pkg_config_variables()
+
+    def _dirs(_env_name, _var_name, _default):
+        _value = os.environ.get(_env_name) or _vars.get(_var_name) or _default
+        return [_i for _i in _value.split(os.pathsep) if _i]
+
+    return PcResolver(
+        lambda: get_pc_search_dirs(get_default_pc_path),
+        is_pkgconf=is_pkgconf(),
+        static=static,
+        define_variables=define_variables,
+        system_libdirs=_dirs('PKG_CONFIG_SYSTEM_LIBRARY_PATH', 'pc_system_libdirs', '/usr/lib:/lib'),
+        system_includedirs=_dirs('PKG_CONFIG_SYSTEM_INCLUDE_PATH', 'pc_system_includedirs', '/usr/include'),
+        provided=provided,
+    )
+
+
+class PcGraph(object):
+    ''' Requires / Requires.private graph of the .pc files of some folders, built once.
+    Transitive closures are computed dependencies first and memoized, so that a shared requirement
+    is expanded once for the whole graph instead of once per dependent.
+    '''
+
+    def __init__(self, pc_dirs: typing.Iterable[str]):
+        self.pc_files: Dict[str, PcFile] = {}
+        for _dir in pc_dirs:
+            try:
+                entries = sorted(os.scandir(_dir), key=lambda _e: _e.name)
+            except OSError:
+                continue
+            for entry in entries:
+                name, ext = os.path.splitext(entry.name)
+                # the first folder wins, like in a search path
+                if ext == '.pc' and name not in self.pc_files and entry.is_file():
+                    self.pc_files[name] = load_pc_file(entry.path)
+        self._closures: Dict[bool, Dict[str, Tuple[str, ...]]] = {}
+        self._orders: Dict[bool, Tuple[List[str], typing.Set[Tuple[str, str]]]] = {}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.pc_files
+
+    def requires(self, name: str, include_private: bool = False) -> List[str]:
+        ''' direct requirements of name, including the ones that are not in the graph
+        '''
+        pc = self.pc_files.get(name)
+        if pc is None:
+            return []
+        ret = [_r.name for _r in pc.requires()]
+        if include_private:
+            ret.extend([_r.name for _r in pc.requires(private=True) if _r.name not in ret])
+        return ret
+
+    def _topological(self, include_private: bool) -> Tuple[List[str], typing.Set[Tuple[str, str]]]:
+        ''' packages of the graph, requirements before their dependents, and the (dependent, requirement)
+        edges that close a cycle
+        '''
+        if include_private not in self._orders:
+            order = []
+            back_edges = set()
+            state: Dict[str, int] = {}  # 1: on the stack, 2: done
+            for root in self.pc_files:
+                if root in state:
+                    continue
+                state[root] = 1
+                stack = [(root, iter(self.requires(root, include_private)))]
+                while stack:
+                    node, deps = stack[-1]
+                    for dep in deps:
+                        if dep not in self.pc_files:
+                            continue
+                        if state.get(dep) == 1:
+                            back_edges.add((node, dep))
+                        elif dep not in state:
+                            state[dep] = 1
+                            stack.append((dep, iter(self.requires(dep, include_private))))
+                            break
+                    else:
+                        stack.pop()
+                        state[node] = 2
+                        order.append(node)
+            self._orders[include_private] = (order, back_edges)
+        return self._orders[include_private]
+
+    def order(self, include_private: bool = False) -> List[str]:
+        return list(self._topological(include_private)[0])
+
+    def cycles(self, include_private: bool = False) -> typing.Set[Tuple[str, str]]:
+        return set(self._topological(include_private)[1])
+
+    def closure(self, name: str, include_private: bool = False) -> Tuple[str, ...]:
+        ''' every package name requires directly or not, in the order of first appearance
+        '''
+        if include_private not in self._closures:
+            order, back_edges = self._topological(include_private)
+            closures: Dict[str, Tuple[str, ...]] = {}
+            for node in order:
+                seen = {}
+                for dep in self.requires(node, include_private):
+                    seen[dep] = None
+                    if (node, dep) not in back_edges:
+                        seen.update(dict.fromkeys(closures.get(dep, ())))
+                seen.pop(node, None)
+                closures[node] = tuple(seen)
+            self._closures[include_private] = closures
+        return self._closures[include_private].get(name, ())
+
+    def internal_requires(
+            self, names: typing.Iterable[str], include_private: bool = False
+    ) -> Dict[str, List[str]]:
+        ''' direct requirements of each of names among names, without the edges closing a cycle,
+        e.g. the requires of the components of one package
+        '''
+        names = list(names)
+        members = set(names)
+        back_edges = self.cycles(include_private)
+        return {
+            _name: [
+                _dep for _dep in self.requires(_name, include_private)
+                if _dep in members and _dep != _name and (_name, _dep) not in back_edges
+            ]
+            for _name in names
+        }
+
+
+# variables of every indexed package, e.g. to locate it without evaluating its .pc file
+PC_INDEX_VARIABLES = ('prefix', 'libdir', 'includedir')
+# bumped when the content of pc_index_entry_t changes, so that the indexes stored on disk are scanned again
+PC_INDEX_FORMAT = 2
+
+
+class pc_index_entry_t(NamedTuple):
+    path: str
+    version: str  # expanded Version field
+    requires: Tuple[Tuple[str, Optional[str], Optional[str]], ...]  # (name, operator, version) of Requires
+    variables: Tuple[str, ...]  # expanded values of PC_INDEX_VARIABLES
+    requires_private: Tuple[Tuple[str, Optional[str], Optional[str]], ...] = ()  # same for Requires.private
+
+
+class PcIndex(object):
+    ''' Every package of a .pc search path, scanned once with scandir: name -> path, version, Requires,
+    Requires.private and a few variables, to answer existence and version queries without a pkg-config process.
+    The index is stale when one of the folders is modified, i.e. a .pc file is added, removed or replaced.
+    '''
+
+    def __init__(
+            self, search_dirs: List[str], entries: Dict[str, pc_index_entry_t], stamp: List, is_pkgconf: bool = False
+    ):
+        self.search_dirs = list(search_dirs)
+        self.entries = entries
+        self.stamp = stamp
+        self.is_pkgconf = is_pkgconf
+        self._errors: Dict[Tuple[str, bool], Optional[str]] = {}
+
+    @staticmethod
+    def dir_stamp(search_dirs: typing.Iterable[str]) -> List:
+        from .cache_utils import dir_stamp
+        return [list(_s) for _s in dir_stamp(search_dirs)]
+
+    @classmethod
+    def scan(cls, search_dirs: List[str], is_pkgconf: bool = False, sysroot: str = '') -> 'PcIndex':
+        stamp = cls.dir_stamp(search_dirs)
+        # no PKG_CONFIG_$PACKAGE_$VARIABLE overrides, the index only depends on the files and the sysroot
+        resolver = PcResolver(search_dirs, is_pkgconf=is_pkgconf, env={'PKG_CONFIG_SYSROOT_DIR': sysroot})
+        entries: Dict[str, pc_index_entry_t] = {}
+        for _dir in search_dirs:
+            try:
+                dir_entries = sorted(os.scandir(_dir), key=lambda _e: _e.name)
+            except OSError:
+                continue
+            for entry in dir_entries:
+                name, ext = os.path.splitext(entry.name)
+                # the first folder wins, like in a search path
+                if ext != '.pc' or name in entries or not entry.is_file():
+                    continue
+                try:
+                    pc = PcFile.parse(entry.path)
+                    _vars = resolver.variables(pc)
+                    entries[name] = pc_index_entry_t(
+                        entry.path,
+                        resolver.field(pc, 'Version'),
+                        tuple(tuple(_r) for _r in pc.requires()),
+                        tuple(_vars.get(_v, '') for _v in PC_INDEX_VARIABLES),
+                        tuple(tuple(_r) for _r in pc.requires(private=True)),
+                    )
+                except (OSError, conans.errors.ConanException):
+                    # pkg-config ignores the files it cannot read or evaluate too
+                    continue
+        return cls(search_dirs, entries, stamp, is_pkgconf)
+
+    def is_stale(self) -> bool:
+        return self.dir_stamp(self.search_dirs) != self.stamp
+
+    def to_json(self) -> Dict[str, typing.Any]:
+        return {'search_dirs': self.search_dirs, 'stamp': self.stamp, 'is_pkgconf': self.is_pkgconf,
+                'entries': {_n: list(_e) for _n, _e in self.entries.items()}}
+
+    @classmethod
+    def from_json(cls, data: Dict[str, typing.Any]) -> 'PcIndex':
+        entries = {
+            _n: pc_index_entry_t(
+                _e[0], _e[1], tuple(tuple(_r) for _r in _e[2]), tuple(_e[3]), tuple(tuple(_r) for _r in _e[4]))
+            for _n, _e in data['entries'].items()
+        }
+        return cls(data['search_dirs'], entries, data['stamp'], data['is_pkgconf'])
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def names(self) -> List[str]:
+        return sorted(self.entries)
+
+    def get(self, name: str) -> Optional[pc_index_entry_t]:
+        return self.entries.get(name)
+
+    def variable(self, name: str, var_name: str) -> Optional[str]:
+        entry = self.entries.get(name)
+        if entry is None or var_name not in PC_INDEX_VARIABLES:
+            return None
+        return entry.variables[PC_INDEX_VARIABLES.index(var_name)]
+
+    def error(self, name: str, private: bool = True) -> Optional[str]:
+        ''' why pkg-config would fail to use name: it is not found, or one of its Requires is missing or has a
+        version out of range, directly or not. None if name can be used.
+        :param private: check the Requires.private too, which pkg-config always does and pkgconf does for --exists
+            but not for --modversion
+        '''
+        key = (name, private)
+        if key in self._errors:
+            return self._errors[key]
+        # a Requires cycle is reported by pkg-config itself, not here
+        self._errors[key] = None
+        entry = self.entries.get(name)
+        if entry is None:
+            error = 'Package {} was not found in the pkg-config search path {}'.format(name, self.search_dirs)
+        else:
+            error = None
+            requires = entry.requires + entry.requires_private if private else entry.requires
+            for req_name, operator, version in requires:
+                req = self.entries.get(req_name)
+                if req is None:
+                    error = 'Package {}, required by {}, not found'.format(req_name, name)
+                elif not pc_version_satisfied(req.version, operator, version):
+                    error = 'Package {} requires {} {} {} but version of {} is {}'.format(
+                        name, req_name, operator, version, req_name, req.version)
+                else:
+                    error = self.error(req_name, private)
+                if error is not None:
+                    break
+        self._errors[key] = error
+        return error
+
+    def modversion(self, name: str) -> str:
+        ''' :raise ConanException: like the pkg-config executable, if name cannot be used
+        '''
+        error = self.error(name, private=not self.is_pkgconf)
+        if error is not None:
+            raise conans.errors.ConanException(error)
+        return self.entries[name].version
+
+    def satisfies(self, name: str, operator: Optional[str] = None, version: Optional[str] = None) -> bool:
+        ''' like pkg-config --exists "name operator version"
+        '''
+        return self.error(name) is None and pc_version_satisfied(self.entries[name].version, operator, version)
+
+
+_pc_indexes: Dict[tuple, PcIndex] = {}
+
+
+def get_pc_index(
+        search_dirs: Optional[List[str]] = None, is_pkgconf: Optional[bool] = None, sysroot: Optional[str] = None
+) -> PcIndex:
+    ''' index of a .pc search path, the one of the host pkg-config by default. It is kept in the process and on disk
+    (see cache_utils.HostCache) and rebuilt when a folder of the search path changes.
+    '''
+    from .cache_utils import HostCache
+    from .pkg_conf_utils import get_default_pc_path, get_host_sysroot
+    from .pkg_conf_utils import is_pkgconf as _is_pkgconf
+    if search_dirs is None:
+        search_dirs = get_pc_search_dirs(get_default_pc_path)
+    if is_pkgconf is None:
+        is_pkgconf = _is_pkgconf()
+    if sysroot is None:
+        sysroot = get_host_sysroot()
+    key = (tuple(search_dirs), bool(is_pkgconf), sysroot)
+    index = _pc_indexes.get(key)
+    if index is not None and not index.is_stale():
+        return index
+    stamp = PcIndex.dir_stamp(search_dirs)
+    cache = HostCache('pc_index')
+    cache_key = [list(key), stamp, PC_INDEX_FORMAT]
+    try:
+        data = cache.get('index', cache_key)
+    except OSError:
+        data = None
+    if data is not None:
+        index = PcIndex.from_json(data)
+    else:
+        index = PcIndex.scan(list(search_dirs), is_pkgconf, sysroot)
+        try:
+            cache.set('index', [list(key), index.stamp, PC_INDEX_FORMAT], index.to_json())
+        except OSError:
+            # a read only cache dir must not break the recipe
+            pass
+    _pc_indexes[key] = index
+    return index
+
+
+def invalidate_pc_indexes():
+    _pc_indexes.clear()
+
+
+class NativePkgConfig(object):
+    ''' Drop-in replacement of tools.PkgConfig which evaluates the .pc files in-process
+    instead of running one pkg-config process per query.
+    '''
+
+    def __init__(self, library, pkg_config_executable=None, static=False, msvc_syntax=False, variables=None,
+                 print_errors=True, resolver: Optional[PcResolver] = None):
+        if msvc_syntax:
+            raise conans.errors.ConanException('NativePkgConfig does not support msvc_syntax')
+        self.library = library
+        self.pkg_config_executable = pkg_config_executable or os.getenv('PKG_CONFIG', 'pkg-config')
+        self.static = static
+        self.define_variables = variables
+        self.print_errors = print_errors
+        self.resolver = resolver or self._default_resolver()
+        self.info = dict()
+
+    def _default_resolver(self):
+        return default_pc_resolver(static=self.static, define_variables=self.define_variables)
+
+    def _get_option(self, option):
+        if option not in self.info:
+            if option == 'cflags':
+                value = self.resolver.cflags(self.library)
+            elif option == 'libs' and self.static and self.resolver.is_pkgconf:
+                # pkgconf reorders the duplicated flags of --static in ways _merge does not reproduce,
+                # e.g. -Wl,--push-state, so these come from the executable
+                value = conans.tools.PkgConfig(
+                    self.library, self.pkg_config_executable, static=True, variables=self.define_variables,
+                    print_errors=self.print_errors).libs
+            elif option == 'libs':
+                value = self.resolver.libs(self.library)
+            elif option == 'modversion':
+                value = [self.resolver.modversion(self.library)]
+            else:
+                raise conans.errors.ConanException('NativePkgConfig does not support --{}'.format(option))
+            self.info[option] = value
+        return self.info[option]
+
+    @property
+    def cflags(self):
+        return self._get_option('cflags')
+
+    @property
+    def cflags_only_I(self):
+        return [_i for _i in self.cflags if _i.startswith('-I')]
+
+    @property
+    def cflags_only_other(self):
+        return [_i for _i in self.cflags if not _i.startswith('-I')]
+
+    @property
+    def libs(self):
+        return self._get_option('libs')
+
+    @property
+    def libs_only_L(self):
+        return [_i for _i in self.libs if _i.startswith('-L')]
+
+    @property
+    def libs_only_l(self):
+        return [_i for _i in self.libs if _i.startswith('-l')]
+
+    @property
+    def libs_only_other(self):
+        return [_i for _i in self.libs if not _i.startswith(('-L', '-l'))]
+
+    @property
+    def requires(self):
+        return [_r.name for _r in self.resolver.find(self.library).requires()]
+
+    @property
+    def requires_private(self):
+        return [_r.name for _r in self.resolver.find(self.library).requires(private=True)]
+
+    @property
+    def variables(self):
+        return self.resolver.variables(self.resolver.find(self.library))
+
+    @property
+    def version(self):
+        return self._get_option('modversion')
@@ -1,31 +1,133 @@
 # -*- coding: UTF-8 -*-
 import glob
 import re
+import shutil
 import sys
+import typing
+from typing import NamedTuple
 
 from conans import tools
 import subprocess
 import conans
 import os
 
+from .cache_utils import binary_identity, get_host_cache
+
+class pkg_config_info_t(NamedTuple):
+    executable: typing.Optional[str]
+    is_pkgconf: bool
+    version: str
+    arg_list_all: str
+
+
+# (executable, PATH it was looked up in) -> resolved path
+_pkg_config_paths: typing.Dict[typing.Tuple[str, typing.Optional[str]], typing.Optional[str]] = {}
+_pkg_config_info: typing.Dict[tuple, pkg_config_info_t] = {}
+
+
+def pkg_config_identity(pkg_config_executable=None, env: typing.Optional[typing.Mapping[str, str]] = None):
+    ''' the pkg-config executable found in the PATH of env (os.environ if None)
+    :return: its path (None if not found), key of its identity (resolved path, mtime, inode)
+    '''
+    environ = os.environ if env is None else env
+    executable = pkg_config_executable or environ.get('PKG_CONFIG', 'pkg-config')
+    path_key = (executable, environ.get('PATH'))
+    if path_key not in _pkg_config_paths:
+        _pkg_config_paths[path_key] = tools.which(executable) if env is None else \
+            shutil.which(executable, path=env.get('PATH'))
+    path = _pkg_config_paths[path_key]
+    try:
+        st = os.stat(path)
+    except (OSError, TypeError):
+        return None, (executable, None, None)
+    return path, (os.path.realpath(path), st.st_mtime_ns, st.st_ino)
+
+
+def _probe_pkg_config(path):
+    if path is None:
+        return pkg_config_info_t(None, False, '', '--list-all')
+    try:
+        _is_pkgconf = bool(tools.PkgConfig._cmd_output([path, '--about']))
+    except subprocess.CalledProcessError:
+        _is_pkgconf = False
+    try:
+        _version = tools.PkgConfig._cmd_output([path, '--version'])
+    except subprocess.CalledProcessError:
+        _version = ''
+    return pkg_config_info_t(
+        path, _is_pkgconf, _version,
+        '--list-package-names' if _is_pkgconf else '--list-all'
+    )
+
+
+def get_pkg_config_info(pkg_config_executable=None) -> pkg_config_info_t:
+    ''' identity and capabilities of the pkg-config executable, probed once per process and cached by
+    its resolved path, mtime and inode
+    '''
+    path, key = pkg_config_identity(pkg_config_executable)
+    if key not in _pkg_config_info:
+        if path is None:
+            _pkg_config_info[key] = _probe_pkg_config(path)
+        else:
+            _pkg_config_info[key] = pkg_config_info_t(*get_host_cache().get_or_compute(
+                'pkg_config_info', key, lambda: _probe_pkg_config(path)))
+    return _pkg_config_info[key]
+
+
+def is_pkgconf(pkg_config_executable=None) -> bool:
+    return get_pkg_config_info(pkg_config_executable).is_pkgconf
+
+
+def invalidate_pkg_config_info():
+    ''' forget the cached pkg-config executables, e.g. after PATH or PKG_CONFIG changed
+    '''
+    _pkg_config_paths.clear()
+    _pkg_config_info.clear()
+    _pkg_config_variables.clear()
+    _default_lib_path.clear()
+    from .pc_file_utils import invalidate_pc_indexes
+    invalidate_pc_indexes()
+
+
+def export_host_facts() -> typing.Dict[str, typing.Any]:
+    ''' what this process found out about the pkg-config executable, its search path and the linker,
+    to give it to worker processes with import_host_facts
+    '''
+    from .pc_file_utils import _pc_indexes
+    return {
+        'pkg_config_paths': dict(_pkg_config_paths),
+        'pkg_config_info': dict(_pkg_config_info),
+        'pkg_config_variables': dict(_pkg_config_variables),
+        'default_lib_path': dict(_default_lib_path),
+        'pc_indexes': dict(_pc_indexes),
+    }
+
+
+def import_host_facts(facts: typing.Mapping[str, typing.Any]):
+    ''' reuse the facts of export_host_facts instead of probing them again, the ones this process already has are kept
+    '''
+    from .pc_file_utils import _pc_indexes
+    for known, imported in (
+            (_pkg_config_paths, facts.get('pkg_config_paths')),
+            (_pkg_config_info, facts.get('pkg_config_info')),
+            (_pkg_config_variables, facts.get('pkg_config_variables')),
+            (_default_lib_path, facts.get('default_lib_path')),
+            (_pc_indexes, facts.get('pc_indexes')),
+    ):
+        for key, value in (imported or {}).items():
+            known.setdefault(key, value)
+
+
 class MyPkgConfig(tools.PkgConfig):
 
     def __init__(self, *args, **kwargs):
         super(MyPkgConfig, self).__init__(*args, **kwargs)
         self._is_pkgconf = self._check_is_pkgconf()
-        self.arg_list_all= '--list-package-names' if self._check_is_pkgconf() else '--list-all'
+        self.arg_list_all = get_pkg_config_info(self.pkg_config_executable).arg_list_all
 
 
     def _check_is_pkgconf(self):
-        command = [
-            self.pkg_config_executable,
-            '--about'
-        ]
-        try:
-            if self._cmd_output(command):
-                return True
-        except subprocess.CalledProcessError as e:
-            return False
+        return get_pkg_config_info(self.pkg_config_executable).is_pkgconf
 
 
     def is_pkgconf(self):
@@ -34,17 +136,26 @@ class MyPkgConfig(tools.PkgConfig):
 
 
     def version(self):
-        command = [
-            self.pkg_config_executable,
-            '--version'
-        ]
-        try:
-            return self._cmd_output(command).strip()
-        except subprocess.CalledProcessError as e:
-            raise conans.errors.ConanException('pkg-config command %s failed with error: %s' % (command, e))
-
-
-    def all_pkgs(self, only_in_dir=None):
+        info = get_pkg_config_info(self.pkg_config_executable)
+        if not info.version:
+            raise conans.errors.ConanException('cannot get version of pkg-config command %s' % self.pkg_config_executable)
+        return info.version
+
+
+    def all_pkgs(self, only_in_dir=None, use_index=False):
+        ''' names of the packages pkg-config finds, only in only_in_dir if given
+        :param use_index: list them from the scanned .pc files (see pc_file_utils.PcIndex) instead of running
+            pkg-config --list-all
+        '''
+        if use_index:
+            from .pc_file_utils import get_pc_index, get_pc_search_dirs
+            if only_in_dir:
+                search_dirs = [only_in_dir]
+            else:
+                search_dirs = get_pc_search_dirs(lambda: [
+                    _i for _i in get_pkg_config_variables(self.pkg_config_executable).get('pc_path', '').split(':') if _i
+                ])
+            return get_pc_index(search_dirs, self._is_pkgconf).names()
         _env = dict()
         if only_in_dir:
             _env['PKG_CONFIG_LIBDIR'] = only_in_dir
@@ -80,21 +191,55 @@ def get_all_names_in_pkgconfig(pkgconfig_folder):
 
 
 
+_pkg_config_variables: typing.Dict[tuple, typing.Dict[str, str]] = {}
+
+
+def get_pkg_config_variables(pkg_config_executable=None):
+    ''' built-in variables of the pkg-config executable (pc_path, pc_system_libdirs, ...), queried once per process
+    '''
+    _, key = pkg_config_identity(pkg_config_executable)
+    key = key + (get_host_sysroot(),)
+    if key not in _pkg_config_variables:
+        _pkg_config_variables[key] = get_host_cache().get_or_compute(
+            'pkg_config_variables', key,
+            lambda: tools.PkgConfig('pkg-config', pkg_config_executable=pkg_config_executable).variables
+        )
+    return _pkg_config_variables[key]
+
+
 def get_default_pc_path():
-    vars = tools.PkgConfig('pkg-config').variables
+    vars = get_pkg_config_variables()
     conans.tools.logger.debug('vars={}'.format(vars))
     pc_path_str = vars['pc_path']
     if (pc_path_str):
         return pc_path_str.split(':')
     return []
 
+def get_host_sysroot(env: typing.Optional[typing.Mapping[str, str]] = None):
+    env = os.environ if env is None else env
+    return env.get('SYSROOT') or env.get('PKG_CONFIG_SYSROOT_DIR') or ''
+
+
+_default_lib_path: typing.Dict[tuple, typing.List[str]] = {}
+
+
+def _get_ld_search_dirs():
+    ld_output = subprocess.check_output('ld --verbose | grep SEARCH_DIR', shell=True)
+    if ld_output:
+        return re.findall(r'SEARCH_DIR\("=([^()]+)"\);', ld_output.decode())
+    else:
+        return []
+
+
 def get_default_lib_path():
+    ''' linker search dirs, resolved on first use and cached on disk by the identity of ld and the sysroot
+    '''
     if tools.os_info.is_linux:
-        ld_output = subprocess.check_output('ld --verbose | grep SEARCH_DIR', shell=True)
-        if ld_output:
-            return re.findall(r'SEARCH_DIR\("=([^()]+)"\);', ld_output.decode())
-        else:
-            return []
+        env_key = (os.environ.get('PATH', ''), get_host_sysroot())
+        if env_key not in _default_lib_path:
+            _default_lib_path[env_key] = get_host_cache().get_or_compute(
+                'default_lib_path', (binary_identity('ld'), env_key[1]), _get_ld_search_dirs)
+        return _default_lib_path[env_key]
     elif tools.os_info.is_macos:
         # TODO: return default lib search path for MacOS
         print('FIXME: create get_default_lib_path() for MacOS', file=sys.stderr)
@@ -0,0 +1,220 @@
+# -*- coding: UTF-8 -*-
+import errno
+import hashlib
+import logging
+import os
+import shutil
+import stat
+import typing
+from typing import Dict, Iterable, Optional
+
+from conans.errors import ConanException
+
+from .cache_utils import LruDirCache, dir_size, file_lock, get_cache_dir, load_json, save_json_atomic, warn
+from .git_utils import normalize_repo_url
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+if typing.TYPE_CHECKING:
+    from conans.client.output import ScopedOutput
+default_logger = logging.getLogger(__name__)
+
+SOURCE_CACHE_MAX_SIZE_ENV = 'CONANUTILS_SOURCE_CACHE_MAX_SIZE'
+DEFAULT_SOURCE_CACHE_MAX_SIZE = 20 * 1024 ** 3
+# copy-on-write clones (btrfs, xfs), then plain copies
+LINK_MODE_AUTO = 'auto'
+# hardlinks share the inode with the cache: a build that edits a source file in place changes the cached tree,
+# which is detected by the verification of the next materialization
+LINK_MODE_HARDLINK = 'hardlink'
+LINK_MODE_COPY = 'copy'
+LINK_MODES = (LINK_MODE_AUTO, LINK_MODE_HARDLINK, LINK_MODE_COPY)
+_FICLONE = 0x40049409
+_MANIFEST_NAME = 'manifest.json'
+_TREE_NAME = 'tree'
+_META_NAME = 'meta'
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def source_tree_key(repo_url: str, commit: str, patch_files: Iterable[str]) -> str:
+    ''' key of the source tree obtained by applying patch_files, in order, on commit of repo_url
+    '''
+    h = hashlib.sha256()
+    h.update(normalize_repo_url(repo_url).encode())
+    h.update(b'\0' + commit.encode())
+    for patch_file in patch_files:
+        h.update(b'\0' + os.path.basename(patch_file).encode() + b'\0' + file_sha256(patch_file).encode())
+    return h.hexdigest()
+
+
+def build_manifest(tree: str) -> Dict[str, list]:
+    ''' {relative path: [size, mtime_ns, sha256, mode]} for files, {relative path: ['->', target]} for symlinks
+    '''
+    ret = {}
+    for dirpath, dirnames, filenames in os.walk(tree):
+        for name in filenames + [_d for _d in dirnames if os.path.islink(os.path.join(dirpath, _d))]:
+            path = os.path.join(dirpath, name)
+            rel_path = os.path.relpath(path, tree)
+            st = os.lstat(path)
+            if stat.S_ISLNK(st.st_mode):
+                ret[rel_path] = ['->', os.readlink(path)]
+            elif stat.S_ISREG(st.st_mode):
+                ret[rel_path] = [st.st_size, st.st_mtime_ns, file_sha256(path), stat.S_IMODE(st.st_mode)]
+    return ret
+
+
+def verify_manifest(tree: str, manifest: Dict[str, list]) -> Optional[str]:
+    ''' a file is only hashed again when its size or mtime differs from the manifest
+    :return: None if tree matches manifest, else the first file that does not
+    '''
+    for rel_path, expected in manifest.items():
+        path = os.path.join(tree, rel_path)
+        try:
+            st = os.lstat(path)
+        except OSError:
+            return rel_path
+        if expected[0] == '->':
+            if not stat.S_ISLNK(st.st_mode) or os.readlink(path) != expected[1]:
+                return rel_path
+            continue
+        if not stat.S_ISREG(st.st_mode) or st.st_size != expected[0]:
+            return rel_path
+        if st.st_mtime_ns != expected[1] and file_sha256(path) != expected[2]:
+            return rel_path
+    return None
+
+
+def _reflink(src: str, dst: str) -> bool:
+    if fcntl is None:
+        return False
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+    except OSError:
+        if os.path.exists(dst):
+            os.unlink(dst)
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+
+def materialize_file(src: str, dst: str, link_mode: str = LINK_MODE_AUTO):
+    if link_mode == LINK_MODE_HARDLINK:
+        try:
+            os.link(src, dst)
+            return
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+    if link_mode != LINK_MODE_COPY and _reflink(src, dst):
+        return
+    shutil.copy2(src, dst)
+
+
+def materialize_tree(src: str, dst: str, link_mode: str = LINK_MODE_AUTO):
+    if link_mode not in LINK_MODES:
+        raise ConanException('unknown link mode {}, expected one of {}'.format(link_mode, LINK_MODES))
+    if os.path.isdir(dst):
+        if os.listdir(dst):
+            raise ConanException('{} is not empty'.format(dst))
+        os.rmdir(dst)
+    shutil.copytree(
+        src, dst, symlinks=True, copy_function=lambda _src, _dst: materialize_file(_src, _dst, link_mode)
+    )
+
+
+class SourceTreeCache(LruDirCache):
+    ''' Content addressed cache of prepared (fetched and patched) source trees, see source_tree_key.
+    Each entry holds the tree and a manifest of its files, which is checked before the tree is reused.
+    '''
+
+    def __init__(self, root: Optional[str] = None, max_size: Optional[int] = None):
+        if max_size is None:
+            max_size = int(os.environ.get(SOURCE_CACHE_MAX_SIZE_ENV) or DEFAULT_SOURCE_CACHE_MAX_SIZE)
+        super().__init__(root or get_cache_dir('source_trees', create=False), max_size)
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def materialize(
+            self, key: str, dst: str, link_mode: str = LINK_MODE_AUTO,
+            output: typing.Union['ScopedOutput', logging.Logger] = default_logger, meta_dst: Optional[str] = None
+    ) -> bool:
+        ''' copy the cached tree of key to dst
+        :param meta_dst: where to copy the folder stored with the tree by store(meta_src=...), it is removed if the
+            entry has none
+        :return: False if key is not cached or its tree is corrupted, dst is not touched then
+        '''
+        entry = self.entry_path(key)
+        if not os.path.isdir(entry):
+            return False
+        with file_lock(self.entry_lock_path(entry), shared=True):
+            manifest = load_json(os.path.join(entry, _MANIFEST_NAME))
+            tree = os.path.join(entry, _TREE_NAME)
+            if manifest is None or not os.path.isdir(tree):
+                return False
+            corrupted = verify_manifest(tree, manifest)
+            if corrupted is None:
+                materialize_tree(tree, dst, link_mode)
+                if meta_dst is not None:
+                    if os.path.isdir(meta_dst):
+                        shutil.rmtree(meta_dst)
+                    if os.path.isdir(os.path.join(entry, _META_NAME)):
+                        shutil.copytree(os.path.join(entry, _META_NAME), meta_dst)
+        if corrupted is not None:
+            warn(output, 'cached source tree {} is corrupted ({} changed), dropping it'.format(key, corrupted))
+            self.remove(key)
+            return False
+        self.record(entry)
+        return True
+
+    def store(self, key: str, src: str, meta_src: Optional[str] = None, **info) -> str:
+        ''' copy src into the cache as the tree of key
+        :param meta_src: folder describing src kept outside of it, e.g. its patch_utils.PatchStamp, stored with
+            the tree but not part of it
+        :param info: recorded in the index, e.g. url and commit
+        :return: entry path
+        '''
+        entry = self.entry_path(key)
+        os.makedirs(self.root, exist_ok=True)
+        with file_lock(self.entry_lock_path(entry)):
+            if os.path.isdir(entry):
+                shutil.rmtree(entry)
+            tmp_entry = entry + '.tmp'
+            if os.path.isdir(tmp_entry):
+                shutil.rmtree(tmp_entry)
+            tree = os.path.join(tmp_entry, _TREE_NAME)
+            materialize_tree(src, tree, LINK_MODE_AUTO)
+            save_json_atomic(os.path.join(tmp_entry, _MANIFEST_NAME), build_manifest(tree))
+            if meta_src is not None and os.path.isdir(meta_src):
+                shutil.copytree(meta_src, os.path.join(tmp_entry, _META_NAME))
+            os.rename(tmp_entry, entry)
+            size = dir_size(entry)
+        self.record(entry, size, **info)
+        self.evict(keep=(entry,))
+        return entry
+
+    def remove(self, key: str):
+        entry = self.entry_path(key)
+        with file_lock(self.entry_lock_path(entry)):
+            shutil.rmtree(entry, ignore_errors=True)
+        self.forget(entry)
+
+
+_source_tree_cache: Optional[SourceTreeCache] = None
+
+
+def get_source_tree_cache() -> SourceTreeCache:
+    global _source_tree_cache
+    if _source_tree_cache is None:
+        _source_tree_cache = SourceTreeCache()
+    return _source_tree_cache
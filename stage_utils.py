@@ -0,0 +1,245 @@
+# -*- coding: UTF-8 -*-
+''' Run independent recipe stages (source fetch, host probes, ...) concurrently. A stage starts as soon as the
+stages it depends on are done, its output is buffered and printed as one block when it is joined, and the
+scheduler reports the critical path of what ran.
+'''
+import contextlib
+import logging
+import os
+import threading
+import time
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from conans.errors import ConanException
+
+from .trace_utils import stage as trace_stage
+
+if typing.TYPE_CHECKING:
+    from conans.client.output import ScopedOutput
+default_logger = logging.getLogger(__name__)
+
+# methods of ScopedOutput / logging.Logger that StageOutput buffers
+BUFFERED_OUTPUT_METHODS = ('write', 'writeln', 'info', 'highlight', 'success', 'warn', 'warning', 'error', 'debug')
+
+
+class stage_result_t(NamedTuple):
+    name: str
+    deps: Tuple[str, ...]
+    start: Optional[float]  # seconds since the scheduler was created, None if the stage did not run
+    end: Optional[float]
+    error: Optional[str]  # also set when the stage is skipped because a dependency failed
+    value: typing.Any = None
+
+    @property
+    def duration(self) -> float:
+        return 0. if self.start is None else self.end - self.start
+
+
+class StageOutput(object):
+    ''' Stands for a ScopedOutput or a logger. What a thread running a stage writes is buffered,
+    the other threads write through.
+    '''
+
+    def __init__(self, target: typing.Union['ScopedOutput', logging.Logger]):
+        self.target = target
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def capture(self, buffer: List):
+        previous = getattr(self._local, 'buffer', None)
+        self._local.buffer = buffer
+        try:
+            yield buffer
+        finally:
+            self._local.buffer = previous
+
+    def replay(self, buffer: List):
+        for method, args, kwargs in buffer:
+            getattr(self.target, method)(*args, **kwargs)
+
+    def __getattr__(self, name):
+        attr = getattr(self.target, name)
+        if name not in BUFFERED_OUTPUT_METHODS:
+            return attr
+
+        def _write(*args, **kwargs):
+            buffer = getattr(self._local, 'buffer', None)
+            if buffer is None:
+                return attr(*args, **kwargs)
+            buffer.append((name, args, kwargs))
+        return _write
+
+
+class _stage_spec_t(NamedTuple):
+    func: typing.Callable
+    args: tuple
+    kwargs: Dict[str, typing.Any]
+    deps: Tuple[str, ...]
+
+
+class StageScheduler(object):
+    ''' Stages run on a thread pool, so the ones waiting for the network or for processes overlap.
+    A stage is skipped when one of its dependencies fails, join() raises the error of the first failed stage.
+    '''
+
+    def __init__(
+            self, output: typing.Union['ScopedOutput', logging.Logger, StageOutput] = default_logger,
+            max_workers: Optional[int] = None
+    ):
+        self.output = output if isinstance(output, StageOutput) else StageOutput(output)
+        self.max_workers = max_workers or min(2 * (os.cpu_count() or 1), 16)
+        self.origin = time.perf_counter()
+        self.results: Dict[str, stage_result_t] = {}
+        self._specs: Dict[str, _stage_spec_t] = {}
+        self._submitted = set()
+        self._buffers: Dict[str, List] = {}
+        self._exceptions: Dict[str, BaseException] = {}
+        self._joined = set()
+        self._cond = threading.Condition()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def now(self) -> float:
+        return time.perf_counter() - self.origin
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._specs
+
+    def add(self, name: str, func: typing.Callable, *args, deps: typing.Iterable[str] = (), **kwargs):
+        ''' schedule func(*args, **kwargs), it starts once every stage of deps is done
+        :raise ConanException: if name is already scheduled or a dependency is unknown
+        '''
+        deps = tuple(deps)
+        with self._cond:
+            if name in self._specs:
+                raise ConanException('stage {} is already scheduled'.format(name))
+            unknown = [_d for _d in deps if _d not in self._specs]
+            if unknown:
+                raise ConanException('stage {} depends on unknown stages {}'.format(name, unknown))
+            self._specs[name] = _stage_spec_t(func, args, kwargs, deps)
+        self._submit_ready(name)
+
+    def _submit_ready(self, name: str):
+        with self._cond:
+            spec = self._specs[name]
+            if name in self._submitted or not all(_d in self.results for _d in spec.deps):
+                return
+            self._submitted.add(name)
+            failed = [_d for _d in spec.deps if self.results[_d].error is not None]
+            if not failed:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix='conanutils-stage')
+                self._executor.submit(self._run, name)
+                return
+            self._exceptions[name] = self._exceptions[failed[0]]
+            self._buffers[name] = []
+            self.results[name] = stage_result_t(
+                name, spec.deps, None, None, 'skipped, {} failed'.format(failed[0]))
+            self._cond.notify_all()
+        self._submit_dependents(name)
+
+    def _submit_dependents(self, name: str):
+        with self._cond:
+            dependents = [_n for _n, _spec in self._specs.items() if name in _spec.deps]
+        for dependent in dependents:
+            self._submit_ready(dependent)
+
+    def _run(self, name: str):
+        spec = self._specs[name]
+        buffer = []
+        value = None
+        error = None
+        start = self.now()
+        try:
+            with self.output.capture(buffer), trace_stage(name):
+                value = spec.func(*spec.args, **spec.kwargs)
+        except BaseException as e:
+            error = e
+        end = self.now()
+        with self._cond:
+            self._buffers[name] = buffer
+            if error is not None:
+                self._exceptions[name] = error
+            self.results[name] = stage_result_t(
+                name, spec.deps, start, end, None if error is None else '{}: {}'.format(type(error).__name__, error),
+                value)
+            self._cond.notify_all()
+        self._submit_dependents(name)
+
+    def _with_deps(self, names: typing.Iterable[str]) -> List[str]:
+        wanted = set()
+        pending = list(names)
+        while pending:
+            name = pending.pop()
+            if name not in wanted:
+                wanted.add(name)
+                pending.extend(self._specs[name].deps)
+        return [_n for _n in self._specs if _n in wanted]
+
+    def join(self, names: Optional[typing.Iterable[str]] = None) -> Dict[str, stage_result_t]:
+        ''' wait for names (all the stages if None) and their dependencies, then print the output of the ones
+        not joined yet, in the order they were added
+        :raise: the exception of the first failed stage
+        '''
+        names = list(self._specs) if names is None else list(names)
+        unknown = [_n for _n in names if _n not in self._specs]
+        if unknown:
+            raise ConanException('cannot join unknown stages {}'.format(unknown))
+        wanted = self._with_deps(names)
+        with self._cond:
+            self._cond.wait_for(lambda: all(_n in self.results for _n in wanted))
+            to_replay = [_n for _n in wanted if _n not in self._joined]
+            self._joined.update(to_replay)
+        for name in to_replay:
+            self.output.replay(self._buffers.pop(name))
+        for name in wanted:
+            if name in self._exceptions:
+                raise self._exceptions[name]
+        return {_n: self.results[_n] for _n in wanted}
+
+    def all_joined(self) -> bool:
+        with self._cond:
+            return len(self._joined) == len(self._specs)
+
+    def critical_path(self) -> List[stage_result_t]:
+        ''' the chain of stages that ended last: each one waited for the dependency that finished last
+        '''
+        with self._cond:
+            done = {_n: _r for _n, _r in self.results.items() if _r.start is not None}
+        if not done:
+            return []
+        path = [max(done.values(), key=lambda _r: _r.end)]
+        while True:
+            deps = [done[_d] for _d in path[-1].deps if _d in done]
+            if not deps:
+                break
+            path.append(max(deps, key=lambda _r: _r.end))
+        return list(reversed(path))
+
+    def report(self) -> List[str]:
+        ''' one line per stage and the critical path, the stages that are not done yet are left out
+        '''
+        with self._cond:
+            results = [self.results[_n] for _n in self._specs if _n in self.results]
+        ret = []
+        for result in results:
+            if result.start is None:
+                ret.append('stage {}: {}'.format(result.name, result.error))
+            else:
+                ret.append('stage {}: {:.3f}s (from {:.3f}s to {:.3f}s){}'.format(
+                    result.name, result.duration, result.start, result.end,
+                    ', failed' if result.error else ''))
+        path = self.critical_path()
+        if path:
+            total = sum(_r.duration for _r in results)
+            wall = path[-1].end - min(_r.start for _r in results if _r.start is not None)
+            ret.append('critical path {}: {:.3f}s, the stages took {:.3f}s in {:.3f}s'.format(
+                ' -> '.join(_r.name for _r in path), sum(_r.duration for _r in path), total, wall))
+        return ret
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
@@ -0,0 +1,256 @@
+# -*- coding: UTF-8 -*-
+import logging
+import subprocess
+import typing
+from typing import Dict, Iterable, List, Optional, Set
+
+from conans import tools
+from conans.errors import ConanException, ConanInvalidSystemRequirements
+
+from .cache_utils import get_probe_cache, package_db_stamp, warn
+
+if typing.TYPE_CHECKING:
+    from conans.client.output import ScopedOutput
+default_logger = logging.getLogger(__name__)
+
+SYSREQUIRES_MODES = ('enabled', 'verify', 'disabled')
+
+
+def sysrequires_mode(default_mode: str = 'disabled') -> str:
+    ''' CONAN_SYSREQUIRES_MODE, checked like tools.SystemPackageTool does
+    '''
+    mode = tools.get_env('CONAN_SYSREQUIRES_MODE', default_mode)
+    if mode.lower() not in SYSREQUIRES_MODES:
+        raise ConanException('CONAN_SYSREQUIRES_MODE=%s is not allowed, allowed modes=%r' % (mode, SYSREQUIRES_MODES))
+    return mode.lower()
+
+
+def _run_query(cmd: List[str]) -> Optional[subprocess.CompletedProcess]:
+    try:
+        return subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    except OSError:
+        return None
+
+
+def _same_package(requested: str, found: str) -> bool:
+    # dpkg prints the architecture only for Multi-Arch: same packages
+    if requested == found:
+        return True
+    req_name, _, req_arch = requested.partition(':')
+    found_name, _, found_arch = found.partition(':')
+    return req_name == found_name and not (req_arch and found_arch)
+
+
+def query_dpkg(packages: List[str]) -> Optional[Set[str]]:
+    proc = _run_query(['dpkg-query', '-W', '-f=${binary:Package}\t${Status}\n'] + packages)
+    if proc is None:
+        return None
+    found = []
+    for line in proc.stdout.splitlines():
+        name, _, status = line.partition('\t')
+        if status.strip().endswith('ok installed'):
+            found.append(name.strip())
+    return {_p for _p in packages if any(_same_package(_p, _f) for _f in found)}
+
+
+def query_rpm(packages: List[str]) -> Optional[Set[str]]:
+    proc = _run_query(['rpm', '-q'] + packages)
+    if proc is None:
+        return None
+    # rpm prints one line per missing argument, whatever the output format of the installed ones
+    missing = set()
+    for line in proc.stdout.splitlines():
+        if line.startswith('package ') and line.endswith(' is not installed'):
+            missing.add(line[len('package '):-len(' is not installed')])
+    return {_p for _p in packages if _p not in missing}
+
+
+def query_pacman(packages: List[str]) -> Optional[Set[str]]:
+    proc = _run_query(['pacman', '-Q'] + packages)
+    if proc is None:
+        return None
+    found = {_line.split()[0] for _line in proc.stdout.splitlines() if _line.strip()}
+    return {_p for _p in packages if _p in found}
+
+
+def query_brew(packages: List[str]) -> Optional[Set[str]]:
+    proc = _run_query(['brew', 'list', '--versions'] + packages)
+    if proc is None:
+        return None
+    found = {_line.split()[0] for _line in proc.stdout.splitlines() if _line.strip()}
+    return {_p for _p in packages if _p in found or _p.rsplit('/', 1)[-1] in found}
+
+
+# conan package tool class name -> one command telling which of many packages are installed
+BATCHED_QUERIES: Dict[str, typing.Callable[[List[str]], Optional[Set[str]]]] = {
+    'AptTool': query_dpkg,
+    'YumTool': query_rpm,
+    'DnfTool': query_rpm,
+    'ZypperTool': query_rpm,
+    'PacManTool': query_pacman,
+    'BrewTool': query_brew,
+}
+
+
+class SystemPackageManager(object):
+    ''' tools.SystemPackageTool working on many packages at once: one query for the installed state of all of them,
+    one package manager transaction to install the missing ones, one query to verify the result.
+    The installed state is cached on the host until the package database changes (see cache_utils.ProbeCache).
+    Batching needs private members of SystemPackageTool, without them every package goes through its public
+    installed() and install().
+    '''
+    # whether installed() can use the host probe cache
+    cacheable = True
+
+    def __init__(
+            self, installer: Optional[tools.SystemPackageTool] = None, default_mode: str = 'disabled',
+            output: typing.Union['ScopedOutput', logging.Logger] = default_logger
+    ):
+        self.installer = installer
+        self.default_mode = default_mode
+        self.output = output
+        self._updated = False
+
+    @property
+    def tool(self):
+        ''' the package manager behind installer, None if this conan version does not expose what batching needs
+        '''
+        tool = getattr(self.installer, '_tool', None)
+        if tool is None or not hasattr(self.installer, '_get_package_names') \
+                or not all(callable(getattr(tool, _m, None)) for _m in ('installed', 'update', 'install')):
+            return None
+        return tool
+
+    @property
+    def tool_name(self) -> str:
+        tool = self.tool
+        return type(self.installer if tool is None else tool).__name__
+
+    def package_names(self, packages: List[str]) -> List[str]:
+        ''' names with the architecture suffix of the host when cross building, like SystemPackageTool.install
+        '''
+        if self.tool is None:
+            # SystemPackageTool.install adds it
+            return list(packages)
+        return self.installer._get_package_names(packages, None)
+
+    def mode(self) -> str:
+        return sysrequires_mode(self.default_mode)
+
+    def query(self, packages: List[str]) -> Dict[str, bool]:
+        ''' installed state of packages, with one process if the package manager is known
+        '''
+        tool = self.tool
+        batched = BATCHED_QUERIES.get(self.tool_name) if tool is not None else None
+        found = batched(packages) if batched is not None else None
+        if found is None:
+            return {_p: bool((self.installer if tool is None else tool).installed(_p)) for _p in packages}
+        return {_p: _p in found for _p in packages}
+
+    def update(self):
+        tool = self.tool
+        (self.installer if tool is None else tool).update()
+
+    def install_transaction(self, packages: List[str]):
+        ''' install all packages with one package manager command, one command per package without self.tool
+        :raise ConanException: if it fails
+        '''
+        tool = self.tool
+        if tool is not None:
+            tool.install(' '.join(packages))
+            return
+        for package in packages:
+            # update() already ran, install() skips the package if a previous call installed it
+            self.installer.install(package, update=False)
+
+    def installed(self, packages: Iterable[str], use_cache: bool = True) -> Dict[str, bool]:
+        packages = list(dict.fromkeys(packages))
+        if not packages:
+            return {}
+        if not (use_cache and self.cacheable):
+            return self.query(packages)
+        stamp = package_db_stamp()
+        entries = {'installed:{}:{}'.format(self.tool_name, _p): _p for _p in packages}
+        values = get_probe_cache().get_or_probe_many(
+            {_entry: stamp for _entry in entries},
+            lambda _missing: {
+                _entry: _state for _entry, _state in zip(_missing, self.query([entries[_e] for _e in _missing]).values())
+            }
+        )
+        return {entries[_entry]: bool(_state) for _entry, _state in values.items()}
+
+    def install(self, packages: Iterable[str], update: bool = True) -> Dict[str, bool]:
+        ''' install the packages that are not installed yet, according to CONAN_SYSREQUIRES_MODE
+        :return: installed state of every package afterwards
+        '''
+        packages = list(dict.fromkeys(packages))
+        names = dict(zip(packages, self.package_names(packages))) if packages else {}
+        states = self.installed(names.values())
+        missing = [_n for _n in names.values() if not states[_n]]
+        if missing:
+            mode = self.mode()
+            if mode == 'disabled':
+                self.output.info('The following packages need to be installed:\n %s' % '\n'.join(missing))
+            elif mode == 'verify':
+                self.output.error('The following packages need to be installed:\n %s' % '\n'.join(missing))
+                raise ConanInvalidSystemRequirements(
+                    'Aborted due to CONAN_SYSREQUIRES_MODE=%s. Some system packages need to be installed' % mode)
+            else:
+                if update and not self._updated:
+                    self.update()
+                    self._updated = True
+                try:
+                    self.install_transaction(missing)
+                except ConanException as e:
+                    # one unknown package fails the whole transaction, do not let it block the others
+                    warn(self.output, 'installing {} at once failed ({}), install them one by one'.format(
+                        ' '.join(missing), e))
+                    for name in missing:
+                        try:
+                            self.install_transaction([name])
+                        except ConanException as e:
+                            warn(self.output, 'cannot install {}: {}'.format(name, e))
+                states.update(self.installed(missing, use_cache=False))
+        return {_p: states[names[_p]] for _p in packages}
+
+
+class StubPackageManager(SystemPackageManager):
+    ''' in-memory package manager for tests: return one from AutoConanFile.system_package_manager()
+    '''
+    cacheable = False
+
+    def __init__(
+            self, installed: Iterable[str] = (), available: Optional[Iterable[str]] = None, mode: str = 'enabled',
+            output: typing.Union['ScopedOutput', logging.Logger] = default_logger
+    ):
+        super().__init__(None, mode, output)
+        self.installed_packages = set(installed)
+        # None: every package can be installed
+        self.available = None if available is None else set(available)
+        self.queries: List[List[str]] = []
+        self.transactions: List[List[str]] = []
+        self.updates = 0
+
+    @property
+    def tool_name(self) -> str:
+        return type(self).__name__
+
+    def package_names(self, packages: List[str]) -> List[str]:
+        return list(packages)
+
+    def mode(self) -> str:
+        return self.default_mode
+
+    def query(self, packages: List[str]) -> Dict[str, bool]:
+        self.queries.append(list(packages))
+        return {_p: _p in self.installed_packages for _p in packages}
+
+    def update(self):
+        self.updates += 1
+
+    def install_transaction(self, packages: List[str]):
+        self.transactions.append(list(packages))
+        unknown = [_p for _p in packages if self.available is not None and _p not in self.available]
+        if unknown:
+            raise ConanException('Unable to locate package {}'.format(' '.join(unknown)))
+        self.installed_packages.update(packages)
@@ -0,0 +1,19 @@
+# -*- coding: UTF-8 -*-
+import os
+
+import pytest
+
+from conanutils.cache_utils import CACHE_DIR_ENV
+
+
+@pytest.fixture(autouse=True, scope='session')
+def cache_dir(tmp_path_factory):
+    ''' keep the host caches of the tests out of the user cache
+    '''
+    previous = os.environ.get(CACHE_DIR_ENV)
+    os.environ[CACHE_DIR_ENV] = str(tmp_path_factory.mktemp('cache'))
+    yield os.environ[CACHE_DIR_ENV]
+    if previous is None:
+        os.environ.pop(CACHE_DIR_ENV)
+    else:
+        os.environ[CACHE_DIR_ENV] = previous
@@ -0,0 +1,61 @@
+# -*- coding: UTF-8 -*-
+import io
+import logging
+import os
+import time
+import warnings
+
+from conans.client.output import ConanOutput
+
+from conanutils.cache_utils import PACKAGE_DB_PATHS_ENV, ProbeCache, package_db_stamp, warn
+from conanutils.stage_utils import StageOutput
+
+
+def test_probe_cache_reuses_entries_with_the_same_key():
+    cache = ProbeCache('test_keys', ttl=60)
+    probed = []
+
+    def probe(names):
+        probed.append(list(names))
+        return {_name: _name.upper() for _name in names}
+    assert cache.get_or_probe_many({'a': [1], 'b': [1]}, probe) == {'a': 'A', 'b': 'B'}
+    assert cache.get_or_probe_many({'a': [1], 'b': [2]}, probe) == {'a': 'A', 'b': 'B'}
+    assert probed == [['a', 'b'], ['b']]
+
+
+def test_probe_cache_ttl(monkeypatch):
+    cache = ProbeCache('test_ttl', ttl=60)
+    cache.store({'a': ('key', 1)})
+    assert cache.lookup({'a': 'key'}) == {'a': 1}
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 61)
+    assert cache.lookup({'a': 'key'}) == {}
+    assert ProbeCache('test_ttl', ttl=0).lookup({'a': 'key'}) == {}
+
+
+def test_package_db_stamp_follows_the_databases(tmp_path):
+    db = tmp_path / 'status'
+    db.write_text('a\n')
+    env = {PACKAGE_DB_PATHS_ENV: str(db)}
+    stamp = package_db_stamp(env)
+    assert (str(db), os.stat(str(db)).st_mtime_ns) in stamp
+    assert package_db_stamp(env) == stamp
+    os.utime(str(db), ns=(0, 0))
+    assert package_db_stamp(env) != stamp
+    assert str(db) not in dict(package_db_stamp({}))
+
+
+def test_warn_uses_the_method_of_the_output(caplog):
+    logger = logging.getLogger('conanutils.tests')
+    stream = io.StringIO()
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', DeprecationWarning)
+        warn(logger, 'logger')
+        stage_output = StageOutput(logger)
+        buffer = []
+        with stage_output.capture(buffer):
+            warn(stage_output, 'stage')
+        stage_output.replay(buffer)
+    warn(ConanOutput(stream), 'scoped')
+    assert [_r.getMessage() for _r in caplog.records] == ['logger', 'stage']
+    assert 'WARN: scoped' in stream.getvalue()
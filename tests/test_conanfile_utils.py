@@ -0,0 +1,38 @@
+# -*- coding: UTF-8 -*-
+import gc
+import weakref
+
+from conanutils import conanfile_utils
+from conanutils.benchmarks.cases import make_recipe
+
+
+def _stage(recipe, message):
+    recipe.output.info(message)
+    return message
+
+
+def test_stages_are_flushed_at_exit_without_keeping_the_recipe(tmp_path):
+    recipe = make_recipe(str(tmp_path / 'package'), False)
+    recipe.start_stage('first', _stage, recipe, 'first done')
+    assert recipe in conanfile_utils._stage_owners
+    conanfile_utils._flush_all_stages()
+    assert 'first done' in recipe.output.target._stream.getvalue()
+    assert recipe.stage_scheduler()._executor is None
+
+    ref = weakref.ref(recipe)
+    del recipe
+    gc.collect()
+    assert ref() is None
+
+
+def test_last_join_stops_the_workers(tmp_path):
+    recipe = make_recipe(str(tmp_path / 'package'), False)
+    recipe.start_stage('first', _stage, recipe, 'first done')
+    recipe.start_stage('second', _stage, recipe, 'second done', deps=['first'])
+    assert recipe.join_stages('first')['first'].value == 'first done'
+    assert recipe.stage_scheduler()._executor is not None
+    assert recipe.join_stages('second')['second'].value == 'second done'
+    assert recipe.stage_scheduler()._executor is None
+    # a stage started afterwards gets new workers
+    recipe.start_stage('third', _stage, recipe, 'third done')
+    assert recipe.join_stages('third')['third'].value == 'third done'
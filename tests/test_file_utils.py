@@ -0,0 +1,75 @@
+# -*- coding: UTF-8 -*-
+import io
+import os
+import stat
+
+import pytest
+from conans.client.output import ConanOutput
+from conans.errors import ConanException
+
+from conanutils.file_utils import replace_regex_in_file_list, save_atomic
+
+
+@pytest.fixture
+def output():
+    return ConanOutput(io.StringIO())
+
+
+def _write(path, content):
+    with open(str(path), 'w') as f:
+        f.write(content)
+    return str(path)
+
+
+def _read(path):
+    with open(str(path)) as f:
+        return f.read()
+
+
+def test_only_changed_files_are_rewritten(tmp_path, output):
+    a = _write(tmp_path / 'a.pc', 'prefix=/old/a\nlibdir=/old/a/lib\n')
+    b = _write(tmp_path / 'b.pc', 'prefix=/usr\n')
+    os.utime(b, ns=(0, 0))
+    assert replace_regex_in_file_list([a, b], '/old/', '/new/', strict=False, output=output) == {a: 2, b: 0}
+    assert _read(a) == 'prefix=/new/a\nlibdir=/new/a/lib\n'
+    assert os.stat(b).st_mtime_ns == 0
+
+
+def test_strict_writes_nothing_if_a_file_has_no_match(tmp_path, output):
+    a = _write(tmp_path / 'a.pc', 'prefix=/old/a\n')
+    b = _write(tmp_path / 'b.pc', 'prefix=/usr\n')
+    with pytest.raises(ConanException):
+        replace_regex_in_file_list([a, b], '/old/', '/new/', output=output)
+    assert _read(a) == 'prefix=/old/a\n'
+
+
+def test_symlinks_are_kept_and_their_target_rewritten_once(tmp_path, output):
+    target = _write(tmp_path / 'target.pc', 'prefix=/old/a\n')
+    link = str(tmp_path / 'link.pc')
+    os.symlink('target.pc', link)
+    calls = []
+    assert replace_regex_in_file_list(
+        [link, target], '/old/', lambda _m: calls.append(_m) or '/new/', output=output) == {link: 1, target: 1}
+    assert len(calls) == 1
+    assert os.path.islink(link) and os.readlink(link) == 'target.pc'
+    assert _read(target) == 'prefix=/new/a\n'
+
+
+def test_save_atomic_keeps_the_mode(tmp_path):
+    path = _write(tmp_path / 'script.sh', 'echo old\n')
+    os.chmod(path, 0o755)
+    save_atomic(path, b'echo new\n')
+    assert _read(path) == 'echo new\n'
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o755
+
+
+def test_save_atomic_leaves_the_file_untouched_on_error(tmp_path, monkeypatch):
+    path = _write(tmp_path / 'a.pc', 'prefix=/old\n')
+
+    def _fail(*_args):
+        raise OSError('disk full')
+    monkeypatch.setattr(os, 'replace', _fail)
+    with pytest.raises(OSError):
+        save_atomic(path, b'prefix=/new\n')
+    assert _read(path) == 'prefix=/old\n'
+    assert os.listdir(str(tmp_path)) == ['a.pc']
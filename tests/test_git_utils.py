@@ -0,0 +1,136 @@
+# -*- coding: UTF-8 -*-
+import os
+import shutil
+import subprocess
+
+import pytest
+from conans.errors import ConanException
+
+from conanutils.git_utils import GIT_FETCH_AUTO, GIT_FETCH_DEEPEN, GIT_FETCH_EXACT, GIT_FETCH_UNSHALLOW, \
+    GitMirrorCache, fetch_commit, is_shallow, run_git
+
+pytestmark = pytest.mark.skipif(shutil.which('git') is None, reason='git is not installed')
+
+
+def _git(folder, *args):
+    return run_git(
+        folder, '-c', 'user.name=test', '-c', 'user.email=test@example.com', *args).stdout.strip()
+
+
+@pytest.fixture(scope='module')
+def remote(tmp_path_factory):
+    ''' bare repository with commits c1..c4 on master tagged v1..v4, and the annotated tag va3 on c3
+    :return: url, {commit message: sha}
+    '''
+    root = tmp_path_factory.mktemp('git')
+    src = str(root / 'src')
+    os.makedirs(src)
+    _git(src, 'init', '--quiet', '--initial-branch=master')
+    commits = {}
+    for i in range(1, 5):
+        with open(os.path.join(src, 'file.txt'), 'w') as f:
+            f.write('{}\n'.format(i))
+        _git(src, 'add', 'file.txt')
+        _git(src, 'commit', '--quiet', '-m', 'c{}'.format(i))
+        _git(src, 'tag', 'v{}'.format(i))
+        commits['c{}'.format(i)] = _git(src, 'rev-parse', 'HEAD')
+    _git(src, 'tag', '-a', '-m', 'annotated', 'va3', commits['c3'])
+    bare = str(root / 'bare.git')
+    subprocess.run(['git', 'clone', '--quiet', '--bare', src, bare], check=True)
+    return 'file://' + bare, commits
+
+
+def _tags(folder):
+    return set(_git(folder, 'tag').split())
+
+
+def test_exact_full_sha_is_shallow_with_its_tags(remote, tmp_path):
+    url, commits = remote
+    folder = str(tmp_path / 'clone')
+    assert fetch_commit(folder, url, 'master', commits['c3'], GIT_FETCH_EXACT) == commits['c3']
+    assert is_shallow(folder)
+    # only the tags of the fetched history, which is c3 alone
+    assert _tags(folder) == {'v3', 'va3'}
+    assert _git(folder, 'describe', '--tags', '--exact-match') in ('v3', 'va3')
+    assert _git(folder, 'describe') == 'va3'
+
+
+def test_abbreviated_sha_of_a_tag_is_fetched_directly(remote, tmp_path):
+    url, commits = remote
+    folder = str(tmp_path / 'clone')
+    assert fetch_commit(folder, url, None, commits['c2'][:7], GIT_FETCH_EXACT) == commits['c2']
+    assert is_shallow(folder)
+
+
+def test_abbreviated_sha_inside_the_history_deepens_the_branch(remote, tmp_path):
+    url, commits = remote
+    _git(url[len('file://'):], 'tag', '--delete', 'v1')
+    try:
+        folder = str(tmp_path / 'clone')
+        with pytest.raises(ConanException):
+            fetch_commit(folder, url, 'master', commits['c1'][:7], GIT_FETCH_EXACT)
+        folder = str(tmp_path / 'clone2')
+        assert fetch_commit(
+            folder, url, 'master', commits['c1'][:7], GIT_FETCH_AUTO, deepen_steps=(1, 1, 1)) == commits['c1']
+        assert _tags(folder) == set()
+    finally:
+        _git(url[len('file://'):], 'tag', 'v1', commits['c1'])
+
+
+@pytest.mark.parametrize('strategy', [GIT_FETCH_DEEPEN, GIT_FETCH_UNSHALLOW])
+def test_branch_history_strategies(remote, tmp_path, strategy):
+    url, commits = remote
+    folder = str(tmp_path / 'clone')
+    assert fetch_commit(folder, url, 'master', commits['c2'], strategy, deepen_steps=(2,)) == commits['c2']
+    assert is_shallow(folder) == (strategy == GIT_FETCH_DEEPEN)
+    assert _git(folder, 'describe', '--tags') == 'v2'
+    assert ('v1' in _tags(folder)) == (strategy == GIT_FETCH_UNSHALLOW)
+
+
+def test_deepen_falls_back_to_the_whole_history(remote, tmp_path):
+    url, commits = remote
+    folder = str(tmp_path / 'clone')
+    assert fetch_commit(folder, url, 'master', commits['c1'], GIT_FETCH_DEEPEN, deepen_steps=(1,)) == commits['c1']
+    assert not is_shallow(folder)
+
+
+def test_partial_clone(remote, tmp_path):
+    url, commits = remote
+    folder = str(tmp_path / 'clone')
+    assert fetch_commit(folder, url, 'master', commits['c4'], partial_clone=True) == commits['c4']
+    assert _git(folder, 'config', 'remote.origin.partialclonefilter') == 'blob:none'
+    with open(os.path.join(folder, 'file.txt')) as f:
+        assert f.read() == '4\n'
+
+
+def test_unknown_strategy(remote, tmp_path):
+    url, commits = remote
+    with pytest.raises(ConanException):
+        fetch_commit(str(tmp_path / 'clone'), url, 'master', commits['c4'], 'everything')
+
+
+def test_mirror_clone_updates_a_mirror_removed_after_update(remote, tmp_path):
+    url, commits = remote
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    log = tmp_path / 'git.log'
+    (bin_dir / 'git').write_text('#!/bin/sh\necho "$@" >> {}\nexec {} "$@"\n'.format(log, shutil.which('git')))
+    os.chmod(str(bin_dir / 'git'), 0o755)
+    env = dict(os.environ, PATH='{}{}{}'.format(bin_dir, os.pathsep, os.environ.get('PATH', '')))
+    cache = GitMirrorCache(str(tmp_path / 'mirrors'))
+    updates = []
+
+    def update(*args, **kwargs):
+        # another process evicts the mirror before clone locks it
+        mirror = GitMirrorCache.update(cache, *args, **kwargs)
+        updates.append(mirror)
+        if len(updates) == 1:
+            shutil.rmtree(mirror)
+        return mirror
+    cache.update = update
+    folder = str(tmp_path / 'clone')
+    assert cache.clone(folder, url, 'master', commits['c2'], env=env) == commits['c2']
+    assert len(updates) == 2
+    calls = log.read_text()
+    assert 'clone --quiet --mirror' in calls
+    assert 'checkout --quiet {}'.format(commits['c2']) in calls
@@ -0,0 +1,46 @@
+# -*- coding: UTF-8 -*-
+import os
+
+from conanutils.patch_utils import PATCH_STAMP_DIR, apply_patch_series, patch_stamp_dir
+from conanutils.source_cache_utils import SourceTreeCache
+
+_PATCH = '--- a/a.txt\n+++ b/a.txt\n@@ -1 +1 @@\n-hello\n+world\n'
+
+
+def _source(tmp_path, name='src'):
+    src = tmp_path / name
+    src.mkdir()
+    (src / 'a.txt').write_text('hello\n')
+    patch = tmp_path / '0001-world.diff'
+    patch.write_text(_PATCH)
+    return str(src), str(patch)
+
+
+def test_stamp_is_kept_next_to_the_source_folder(tmp_path):
+    src, patch = _source(tmp_path)
+    assert apply_patch_series(src, [patch]) == ['0001-world.diff']
+    assert os.listdir(src) == ['a.txt']
+    assert os.path.isfile(os.path.join(patch_stamp_dir(src), 'stamp.json'))
+    assert apply_patch_series(src, [patch]) == []
+    # reverted when the patch is dropped from the series
+    assert apply_patch_series(src, []) == []
+    assert (tmp_path / 'src' / 'a.txt').read_text() == 'hello\n'
+
+
+def test_stamp_follows_the_cached_tree(tmp_path):
+    src, patch = _source(tmp_path)
+    apply_patch_series(src, [patch])
+    cache = SourceTreeCache(str(tmp_path / 'cache'))
+    cache.store('key', src, patch_stamp_dir(src))
+    assert os.listdir(os.path.join(cache.entry_path('key'), 'tree')) == ['a.txt']
+    dst = str(tmp_path / 'other' / 'src')
+    assert cache.materialize('key', dst, meta_dst=patch_stamp_dir(dst))
+    assert apply_patch_series(dst, [patch]) == []
+
+
+def test_stamp_inside_the_source_folder_is_moved_out(tmp_path):
+    src, patch = _source(tmp_path)
+    apply_patch_series(src, [patch])
+    os.rename(patch_stamp_dir(src), os.path.join(src, PATCH_STAMP_DIR))
+    assert apply_patch_series(src, [patch]) == []
+    assert os.listdir(src) == ['a.txt']
@@ -0,0 +1,52 @@
+# -*- coding: UTF-8 -*-
+import os
+import shutil
+import subprocess
+
+import pytest
+from conans.errors import ConanException
+
+from conanutils.pc_file_utils import PcIndex
+from conanutils.pkg_conf_utils import is_pkgconf
+
+
+@pytest.fixture
+def pc_dir(tmp_path):
+    for name, requires_private in (('a', 'missingpkg'), ('b', 'a >= 2'), ('c', 'b'), ('d', '')):
+        content = 'Name: {0}\nDescription: {0}\nVersion: 1\nLibs: -l{0}\n'.format(name)
+        if requires_private:
+            content += 'Requires.private: {}\n'.format(requires_private)
+        (tmp_path / (name + '.pc')).write_text(content)
+    return str(tmp_path)
+
+
+@pytest.mark.parametrize('is_pkgconf', [False, True])
+def test_requires_private_are_checked(pc_dir, is_pkgconf):
+    index = PcIndex.scan([pc_dir], is_pkgconf)
+    assert index.get('b').requires_private == (('a', '>=', '2'),)
+    for name in ('a', 'b', 'c'):
+        assert not index.satisfies(name)
+    assert index.satisfies('d')
+    if is_pkgconf:
+        # pkgconf --modversion does not look at Requires.private
+        assert index.modversion('b') == '1'
+    else:
+        with pytest.raises(ConanException):
+            index.modversion('b')
+
+
+@pytest.mark.skipif(shutil.which('pkg-config') is None, reason='pkg-config is not installed')
+def test_satisfies_matches_pkg_config(pc_dir):
+    index = PcIndex.scan([pc_dir], is_pkgconf())
+    env = dict(os.environ, PKG_CONFIG_LIBDIR=pc_dir)
+    env.pop('PKG_CONFIG_PATH', None)
+    for name in ('a', 'b', 'c', 'd'):
+        exists = subprocess.run(['pkg-config', '--exists', name], env=env).returncode == 0
+        assert index.satisfies(name) == exists, name
+
+
+def test_json_round_trip(pc_dir):
+    index = PcIndex.scan([pc_dir], True)
+    loaded = PcIndex.from_json(index.to_json())
+    assert loaded.entries == index.entries
+    assert loaded.is_pkgconf
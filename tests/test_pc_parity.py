@@ -0,0 +1,48 @@
+# -*- coding: UTF-8 -*-
+import shutil
+
+import pytest
+from conans import tools
+
+from conanutils.benchmarks.cases import make_recipe
+from conanutils.benchmarks.synthetic import generate_prefix
+from conanutils.pc_file_utils import NativePkgConfig
+
+pytestmark = pytest.mark.skipif(shutil.which('pkg-config') is None, reason='pkg-config is not installed')
+
+
+@pytest.fixture(scope='module')
+def prefix(tmp_path_factory):
+    prefix = generate_prefix(str(tmp_path_factory.mktemp('prefix')), 40)
+    # the generated graph has to exercise Requires.private
+    assert any('Requires.private:' in open('{}/{}.pc'.format(prefix.pc_dir, _n)).read() for _n in prefix.names)
+    return prefix
+
+
+def _collect(prefix, native, method, *args):
+    recipe = make_recipe(prefix.root, native)
+    with tools.environment_append({'PKG_CONFIG_PATH': prefix.system_pc_dir}):
+        return getattr(recipe, method)(*args)
+
+
+def test_components_info_native_matches_pkg_config(prefix):
+    native = _collect(prefix, True, '_extract_components_info_from_pc', prefix.pc_dir)
+    expected = _collect(prefix, False, '_extract_components_info_from_pc', prefix.pc_dir)
+    assert native == expected
+
+
+def test_libs_info_native_matches_pkg_config(prefix):
+    native = _collect(prefix, True, '_extract_libs_info_from_pc', prefix.pc_dir, (prefix.system_pc_dir,))
+    expected = _collect(prefix, False, '_extract_libs_info_from_pc', prefix.pc_dir, (prefix.system_pc_dir,))
+    assert native == expected
+
+
+@pytest.mark.parametrize('option', ['cflags', 'libs'])
+def test_quoted_and_separated_flags_match_pkg_config(tmp_path, option):
+    (tmp_path / 'quoted.pc').write_text(
+        'Name: quoted\nDescription: quoted\nVersion: 1\n'
+        'Cflags: -DFOO="bar baz" -I/a\\ b -DX=\'a b\' -I /c -DD="x;y*?" -DE=p~q^r\n'
+        'Libs: -L /x -l quoted -lz -Wl,-rpath,/r\n')
+    with tools.environment_append({'PKG_CONFIG_PATH': str(tmp_path)}):
+        expected = getattr(tools.PkgConfig('quoted'), option)
+        assert getattr(NativePkgConfig('quoted'), option) == expected
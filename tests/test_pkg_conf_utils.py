@@ -0,0 +1,53 @@
+# -*- coding: UTF-8 -*-
+import os
+
+import pytest
+
+from conanutils.pkg_conf_utils import get_pkg_config_info, invalidate_pkg_config_info, pkg_config_identity
+
+
+@pytest.fixture
+def fake_pkg_config(tmp_path):
+    ''' :return: write(version) replacing the executable, log of its calls
+    '''
+    path = tmp_path / 'pkg-config'
+    log = tmp_path / 'calls'
+
+    def write(version):
+        tmp = tmp_path / 'pkg-config.tmp'
+        tmp.write_text('#!/bin/sh\necho "$1" >> {}\n[ "$1" = --version ] && echo {}\nexit 0\n'.format(log, version))
+        os.chmod(str(tmp), 0o755)
+        os.replace(str(tmp), str(path))
+        return str(path)
+    yield write, log
+    invalidate_pkg_config_info()
+
+
+def test_pkg_config_info_is_keyed_by_the_executable(fake_pkg_config):
+    write, log = fake_pkg_config
+    path = write('1.0')
+    assert get_pkg_config_info(path).version == '1.0'
+    calls = log.read_text()
+    # reused from the host cache by another process
+    invalidate_pkg_config_info()
+    assert get_pkg_config_info(path).version == '1.0'
+    assert log.read_text() == calls
+    # a new binary at the same path is probed again
+    write('2.0')
+    invalidate_pkg_config_info()
+    assert get_pkg_config_info(path).version == '2.0'
+    assert log.read_text() != calls
+
+
+def test_pkg_config_identity_follows_the_path_of_env(fake_pkg_config, tmp_path):
+    write, _ = fake_pkg_config
+    path = write('1.0')
+    other = tmp_path / 'other'
+    other.mkdir()
+    os.symlink(path, str(other / 'pkg-config'))
+    default = pkg_config_identity()
+    assert pkg_config_identity(env={'PATH': str(tmp_path)})[0] == path
+    assert pkg_config_identity(env={'PATH': str(other)})[0] == str(other / 'pkg-config')
+    assert pkg_config_identity(env={'PATH': str(other)})[1] == pkg_config_identity(env={'PATH': str(tmp_path)})[1]
+    assert pkg_config_identity(env={'PATH': str(tmp_path / 'missing')})[0] is None
+    assert pkg_config_identity() == default
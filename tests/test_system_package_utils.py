@@ -0,0 +1,108 @@
+# -*- coding: UTF-8 -*-
+import shutil
+
+import pytest
+from conans import tools
+from conans.errors import ConanException, ConanInvalidSystemRequirements
+
+from conanutils.benchmarks.cases import make_recipe
+from conanutils.system_package_utils import StubPackageManager, SystemPackageManager
+
+
+def test_one_query_and_one_transaction():
+    manager = StubPackageManager(installed=['a'])
+    assert manager.install(['a', 'b', 'c', 'b']) == {'a': True, 'b': True, 'c': True}
+    assert manager.queries == [['a', 'b', 'c'], ['b', 'c']]
+    assert manager.transactions == [['b', 'c']]
+    assert manager.updates == 1
+    manager.install(['d'])
+    assert manager.updates == 1
+
+
+def test_nothing_to_install():
+    manager = StubPackageManager(installed=['a', 'b'])
+    assert manager.install(['a', 'b']) == {'a': True, 'b': True}
+    assert manager.transactions == []
+    assert manager.updates == 0
+
+
+def test_failed_transaction_installs_one_by_one():
+    manager = StubPackageManager(available=['a', 'c'])
+    assert manager.install(['a', 'b', 'c'], update=False) == {'a': True, 'b': False, 'c': True}
+    assert manager.transactions == [['a', 'b', 'c'], ['a'], ['b'], ['c']]
+    assert manager.updates == 0
+
+
+def test_disabled_mode_installs_nothing():
+    manager = StubPackageManager(mode='disabled')
+    assert manager.install(['a']) == {'a': False}
+    assert manager.transactions == []
+
+
+def test_verify_mode_raises():
+    manager = StubPackageManager(mode='verify')
+    with pytest.raises(ConanInvalidSystemRequirements):
+        manager.install(['a'])
+
+
+@pytest.mark.skipif(shutil.which('pkg-config') is None, reason='pkg-config is not installed')
+def test_system_requirements_from_conan_data(tmp_path, monkeypatch):
+    pc_dir = tmp_path / 'pkgconfig'
+    pc_dir.mkdir()
+    (pc_dir / 'present.pc').write_text('Name: present\nDescription: present\nVersion: 1.2\nLibs: -lpresent\n')
+    monkeypatch.setattr(tools.os_info, 'linux_distro', 'ubuntu')
+    manager = StubPackageManager(available=['a-dev'])
+    recipe = make_recipe(str(tmp_path / 'package'), False)
+    recipe.system_package_manager = lambda: manager
+    recipe.conan_data = {'system-packages': {
+        'ubuntu': {
+            'present': {'pkg': 'present-dev', 'version': ['1.0']},
+            'conanutils-test-a': {'pkg': 'a-dev', 'version': ['1.0']},
+            'conanutils-test-b': {'pkg': 'b-dev', 'version': ['1.0']},
+        },
+        'fallback': {'conanutils-test-a': 'a/1.0', 'conanutils-test-b': 'b/1.0'},
+    }}
+    with tools.environment_append({'PKG_CONFIG_PATH': str(pc_dir)}):
+        recipe.system_requirements_from_conan_data()
+    # the installed lib is still not found by pkg-config, both fall back to their conan package
+    assert manager.queries == [['a-dev', 'b-dev'], ['a-dev', 'b-dev']]
+    assert manager.transactions == [['a-dev', 'b-dev'], ['a-dev'], ['b-dev']]
+    assert sorted(recipe.fallback_requires) == ['a/1.0', 'b/1.0']
+
+
+class PublicOnlyInstaller(object):
+    ''' the public methods of tools.SystemPackageTool, without the private ones batching uses
+    '''
+
+    def __init__(self, installed=(), available=()):
+        self.installed_packages = set(installed)
+        self.available = set(available)
+        self.calls = []
+
+    def installed(self, package_name):
+        self.calls.append(('installed', package_name))
+        return package_name in self.installed_packages
+
+    def update(self):
+        self.calls.append(('update',))
+
+    def install(self, packages, update=True, force=False, arch_names=None):
+        self.calls.append(('install', packages, update))
+        if not force and packages in self.installed_packages:
+            return
+        if packages not in self.available:
+            raise ConanException('Could not install any of {}'.format(packages))
+        self.installed_packages.add(packages)
+
+
+def test_public_api_fallback():
+    installer = PublicOnlyInstaller(installed=['public-a'], available=['public-b'])
+    manager = SystemPackageManager(installer, default_mode='enabled')
+    assert manager.tool is None
+    assert manager.install(['public-a', 'public-b', 'public-c']) == {
+        'public-a': True, 'public-b': True, 'public-c': False}
+    assert ('update',) in installer.calls
+    assert [_c for _c in installer.calls if _c[0] == 'install'] == [
+        ('install', 'public-b', False), ('install', 'public-c', False),
+        ('install', 'public-b', False), ('install', 'public-c', False)]
+    assert installer.installed_packages == {'public-a', 'public-b'}
@@ -0,0 +1,290 @@
+# -*- coding: UTF-8 -*-
+''' Opt-in instrumentation of the processes spawned by the helpers (pkg-config, ld, git, package managers...)
+and of the recipe stages. Set CONANUTILS_TRACE to a folder to enable it: at exit, the process writes
+conanutils-summary-<pid>.json and conanutils-trace-<pid>.json (chrome://tracing / Perfetto trace events) there.
+When it is disabled, subprocess is not touched and traced stages cost a global lookup.
+'''
+import atexit
+import contextlib
+import functools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import typing
+from typing import Dict, List, NamedTuple, Optional
+
+TRACE_ENV = 'CONANUTILS_TRACE'
+_PACKAGE = __name__.rpartition('.')[0]
+_UNKNOWN_CALLER = '<external>'
+
+
+class span_t(NamedTuple):
+    name: str
+    category: str  # 'spawn' or 'stage'
+    start: float  # seconds since the tracer started
+    duration: Optional[float]  # None if the process was never waited for
+    tid: int
+    args: Dict[str, typing.Any]
+
+
+def _caller_of_spawn() -> str:
+    ''' innermost function of this package in the stack, e.g. get_cpp_info_fields_from_pkg
+    '''
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module != __name__ and (module == _PACKAGE or module.startswith(_PACKAGE + '.')):
+            return '{}.{}'.format(module.rpartition('.')[2], frame.f_code.co_name)
+        frame = frame.f_back
+    return _UNKNOWN_CALLER
+
+
+class Tracer(object):
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans: List[span_t] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # innermost stage of the process, for the spawns of worker threads that are not in a stage themselves
+        self._open_stages: List[str] = []
+
+    def now(self) -> float:
+        return time.perf_counter() - self.origin
+
+    def add(self, span: span_t):
+        with self._lock:
+            self.spans.append(span)
+
+    def current_stage(self) -> Optional[str]:
+        stack = getattr(self._local, 'stages', None)
+        if stack:
+            return stack[-1]
+        with self._lock:
+            return self._open_stages[-1] if self._open_stages else None
+
+    @contextlib.contextmanager
+    def stage(self, name: str, **args):
+        stack = getattr(self._local, 'stages', None)
+        if stack is None:
+            stack = self._local.stages = []
+        parent = stack[-1] if stack else None
+        stack.append(name)
+        with self._lock:
+            self._open_stages.append(name)
+        start = self.now()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = '{}: {}'.format(type(e).__name__, e)
+            raise
+        finally:
+            duration = self.now() - start
+            stack.pop()
+            with self._lock:
+                self._open_stages.remove(name)
+            span_args = dict(args, parent=parent)
+            if error:
+                span_args['error'] = error
+            self.add(span_t(name, 'stage', start, duration, threading.get_ident(), span_args))
+
+    def spawn_started(self, argv) -> dict:
+        if isinstance(argv, (str, bytes)):
+            argv = [argv]
+        argv = [os.fsdecode(_a) if isinstance(_a, (bytes, os.PathLike)) else str(_a) for _a in argv]
+        return {
+            'argv': argv,
+            'caller': _caller_of_spawn(),
+            'stage': self.current_stage(),
+            'start': self.now(),
+            'tid': threading.get_ident(),
+        }
+
+    def spawn_finished(self, record: dict, returncode: Optional[int], error: Optional[str] = None):
+        args = {'argv': record['argv'], 'caller': record['caller'], 'stage': record['stage'],
+                'returncode': returncode}
+        if error:
+            args['error'] = error
+        duration = None if returncode is None and error is None else self.now() - record['start']
+        self.add(span_t(_spawn_name(record['argv']), 'spawn', record['start'], duration, record['tid'], args))
+
+    def summary(self) -> Dict[str, typing.Any]:
+        with self._lock:
+            spans = list(self.spans)
+
+        def aggregate(items, key):
+            ret = {}
+            for span in items:
+                entry = ret.setdefault(key(span), {'count': 0, 'total_time': 0., 'failed': 0})
+                entry['count'] += 1
+                entry['total_time'] += span.duration or 0.
+                if span.args.get('error') or span.args.get('returncode'):
+                    entry['failed'] += 1
+            return dict(sorted(ret.items(), key=lambda _i: -_i[1]['total_time']))
+
+        spawns = [_s for _s in spans if _s.category == 'spawn']
+        stages = [_s for _s in spans if _s.category == 'stage']
+        return {
+            'pid': os.getpid(),
+            'argv': sys.argv,
+            'elapsed': self.now(),
+            'spawn_count': len(spawns),
+            'spawn_time': sum(_s.duration or 0. for _s in spawns),
+            'by_caller': aggregate(spawns, lambda _s: _s.args['caller']),
+            'by_executable': aggregate(spawns, lambda _s: _s.name),
+            'by_stage': aggregate(stages, lambda _s: _s.name),
+            'spawns': [dict(_s.args, start=_s.start, duration=_s.duration) for _s in spawns],
+        }
+
+    def chrome_trace(self) -> Dict[str, typing.Any]:
+        with self._lock:
+            spans = list(self.spans)
+        pid = os.getpid()
+        events = []
+        for span in spans:
+            event = {'name': span.name, 'cat': span.category, 'pid': pid, 'tid': span.tid,
+                     'ts': span.start * 1e6, 'args': span.args}
+            if span.duration is None:
+                event['ph'] = 'i'
+                event['s'] = 't'
+            else:
+                event['ph'] = 'X'
+                event['dur'] = span.duration * 1e6
+            events.append(event)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export(self, output_dir: str) -> typing.Tuple[str, str]:
+        ''' write the summary and the chrome trace into output_dir
+        :return: their paths
+        '''
+        os.makedirs(output_dir, exist_ok=True)
+        pid = os.getpid()
+        summary_path = os.path.join(output_dir, 'conanutils-summary-{}.json'.format(pid))
+        trace_path = os.path.join(output_dir, 'conanutils-trace-{}.json'.format(pid))
+        with open(summary_path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+        with open(trace_path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+        return summary_path, trace_path
+
+
+def _spawn_name(argv: List[str]) -> str:
+    if not argv:
+        return '?'
+    # shell=True command lines are a single string
+    first = argv[0].split()[0] if len(argv) == 1 and argv[0].strip() else argv[0]
+    return os.path.basename(first)
+
+
+_tracer: Optional[Tracer] = None
+_original_popen = {}
+
+
+def _install_popen_hooks():
+    popen = subprocess.Popen
+    _original_popen.update(__init__=popen.__init__, wait=popen.wait, poll=popen.poll)
+    original_init, original_wait, original_poll = popen.__init__, popen.wait, popen.poll
+
+    def _finish(proc):
+        record = proc.__dict__.pop('_conanutils_trace', None)
+        if record is not None and _tracer is not None:
+            _tracer.spawn_finished(record, proc.returncode)
+
+    @functools.wraps(original_init)
+    def traced_init(self, args, *a, **kw):
+        tracer = _tracer
+        record = tracer.spawn_started(args) if tracer is not None else None
+        try:
+            original_init(self, args, *a, **kw)
+        except BaseException as e:
+            if record is not None:
+                tracer.spawn_finished(record, None, '{}: {}'.format(type(e).__name__, e))
+            raise
+        if record is not None:
+            self._conanutils_trace = record
+
+    @functools.wraps(original_wait)
+    def traced_wait(self, *a, **kw):
+        ret = original_wait(self, *a, **kw)
+        if self.returncode is not None:
+            _finish(self)
+        return ret
+
+    @functools.wraps(original_poll)
+    def traced_poll(self, *a, **kw):
+        ret = original_poll(self, *a, **kw)
+        if self.returncode is not None:
+            _finish(self)
+        return ret
+
+    popen.__init__, popen.wait, popen.poll = traced_init, traced_wait, traced_poll
+
+
+def _remove_popen_hooks():
+    for name, method in _original_popen.items():
+        setattr(subprocess.Popen, name, method)
+    _original_popen.clear()
+
+
+def get_tracer() -> Optional[Tracer]:
+    ''' the active tracer, None if tracing is disabled
+    '''
+    return _tracer
+
+
+def enable_tracing(output_dir: Optional[str] = None) -> Tracer:
+    ''' start recording the spawned processes and the stages
+    :param output_dir: export the records there at exit
+    '''
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer()
+        _install_popen_hooks()
+        if output_dir:
+            tracer = _tracer
+            atexit.register(tracer.export, output_dir)
+    return _tracer
+
+
+def disable_tracing() -> Optional[Tracer]:
+    ''' stop recording
+    :return: the tracer that was active, to export what it recorded
+    '''
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        _remove_popen_hooks()
+    return tracer
+
+
+def stage(name: str, **args) -> typing.ContextManager:
+    ''' context manager timing a stage when tracing is enabled
+    '''
+    tracer = _tracer
+    if tracer is None:
+        return contextlib.suppress()
+    return tracer.stage(name, **args)
+
+
+def traced_stage(func=None, name: Optional[str] = None):
+    ''' decorator recording every call of func as a stage named after it
+    '''
+    if func is None:
+        return functools.partial(traced_stage, name=name)
+    stage_name = name or func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        tracer = _tracer
+        if tracer is None:
+            return func(*args, **kwargs)
+        with tracer.stage(stage_name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+if os.environ.get(TRACE_ENV):
+    enable_tracing(os.path.abspath(os.environ[TRACE_ENV]))